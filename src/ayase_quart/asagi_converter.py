@@ -1,17 +1,21 @@
 import asyncio
+import heapq
 import html
 import json
 import re
+import time
 from collections import defaultdict
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
 from datetime import date, datetime
 from functools import cache
-from itertools import batched
+from itertools import batched, islice
 from textwrap import dedent
+from typing import AsyncIterator
 
 from async_lru import alru_cache
 
-from .configs import stats_conf
+from .configs import db_conf, stats_conf, vanilla_search_conf
 from .db import db_q
 from .db.redis import get_redis
 from .posts.capcodes import Capcode
@@ -21,7 +25,19 @@ from .posts.quotelinks import (
     get_quotelink_lookup,
     get_quotelink_lookup_raw
 )
+from .posts.quotelink_table import (
+    delete_post_quotelinks,
+    get_board_thread_quotelinks_indexed
+)
+from .posts.rendered_table import (
+    RenderedLookup,
+    delete_post_rendered,
+    get_board_rendered_by_doc_ids,
+    get_board_rendered_by_thread,
+    html_comment_rendered
+)
 from .enums import DbType
+from .utils.cursors import decode_cursor
 from .utils.validation import validate_board, validate_boards
 from .db.base_db import BasePlaceHolderGen
 
@@ -184,6 +200,14 @@ def get_selector(board: str) -> str:
     return dedent(selector)
 
 
+def rows_2_posts(rows: list[tuple]) -> list[dict]:
+    """Posts from rows that were selected with `get_selector()` and fetched as tuples, e.g. with `query_tuple()`.
+
+    One `dict(zip())` per row is far cheaper than the drivers' dict-like rows, which are built key by key in python.
+    """
+    return [dict(zip(selector_columns, row)) for row in rows]
+
+
 # Temporary, needs testing before removing old get_posts_filtered
 # TODO: transfer all of this (SqlSearchFilter, validate_and_generate_params, search_posts) to search/providers/sql.py
 @dataclass(slots=True)
@@ -331,27 +355,81 @@ def get_board_specific_where_clause(board: str, where_query: str, params: list[s
 
 
 is_counter_db = 'counter' in db_q.Phg.__slots__
-async def get_total_hits(form_data: dict, boards: list[str], max_hits: int, where_query: str, phg1: BasePlaceHolderGen, params: list):
-    query_tuple_calls = []
-    for board in boards:
-
-        phg2 = db_q.Phg(start=phg1.counter) if hasattr(phg1, 'counter') else db_q.Phg()
 
-        where_query, params = get_board_specific_where_clause(board, where_query, params, form_data, phg2)
-        params = tuple(params) if params else None
+# 'exact' counts every hit, 'capped' stops counting a board at max_hits + 1,
+# 'estimate' reads the planner's row estimate on mysql and postgresql, and is 'capped' elsewhere.
+# estimates are only ever displayed, offset pagination places each board's limit with 'capped' counts,
+# since the planner's estimate can be 0 for a board with hits.
+SEARCH_COUNT_MODE: str = vanilla_search_conf.get('count_mode', 'capped')
+SEARCH_COUNT_CACHE_TTL: int = vanilla_search_conf.get('count_cache_ttl', 300)
+SEARCH_COUNT_ESTIMATED: bool = SEARCH_COUNT_MODE == 'estimate' and db_q.db_type in (DbType.mysql, DbType.postgres)
+
+
+async def estimate_board_hits(board: str, board_where: str, params: tuple | None) -> int:
+    sql = f'select 1 from `{board}` {board_where}'
+    match db_q.db_type:
+        case DbType.mysql:
+            # the first row is the board itself, facet subqueries come after it
+            rows = await db_q.query_dict(f'explain {sql};', params=params)
+            return int((rows[0]['rows'] or 0) * (rows[0]['filtered'] or 100) / 100)
+        case DbType.postgres:
+            rows = await db_q.query_tuple(f'explain (format json) {sql};', params=params)
+            plan = rows[0][0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+    raise ValueError(db_q.db_type)
+
+
+async def count_board_hits(board: str, board_where: str, params: tuple | None, max_hits: int, estimate: bool=False) -> int:
+    """Everything that varies between pages of the same search (page, cursor, hits_per_page) is left out of the arguments,
+    so with the count cache, only a search's first page counts its hits.
+    """
+    if estimate:
+        return await estimate_board_hits(board, board_where, params)
 
+    if SEARCH_COUNT_MODE == 'exact' or not max_hits:
         sql = f"""
         select count(*)
         from `{board}`
-        {where_query}
+        {board_where}
         ;"""
+    else:
+        # past max_hits + 1, the total is clamped to max_hits anyway
+        sql = f"""
+        select count(*) from (
+            select 1
+            from `{board}`
+            {board_where}
+            limit {int(max_hits) + 1}
+        ) as capped
+        ;"""
+    rows = await db_q.query_tuple(sql, params=params)
+    return rows[0][0]
 
-        query_tuple_calls.append(db_q.query_tuple(sql, params=params))
 
-    total_hits_per_board = await asyncio.gather(*query_tuple_calls)
+if SEARCH_COUNT_CACHE_TTL:
+    count_board_hits = alru_cache(maxsize=1024, ttl=SEARCH_COUNT_CACHE_TTL)(count_board_hits)
+
+
+async def get_total_hits(form_data: dict, boards: list[str], max_hits: int, where_query: str, phg1: BasePlaceHolderGen, params: list, estimate: bool=False) -> tuple[int, list[int]]:
+    """Returns `(total_hits, hits per board)`. `total_hits` is clamped to `max_hits`, and per board hits may be clamped to `max_hits + 1`.
+
+    With `estimate`, the hits are planner estimates, which are only fit for display.
+    """
+    count_calls = []
+    for board in boards:
+
+        phg2 = db_q.Phg(start=phg1.counter) if hasattr(phg1, 'counter') else db_q.Phg()
+
+        board_where, board_params = get_board_specific_where_clause(board, where_query, params.copy(), form_data, phg2)
+
+        count_calls.append(count_board_hits(board, board_where, tuple(board_params) if board_params else None, max_hits, estimate))
+
+    total_hits_per_board = await asyncio.gather(*count_calls)
 
     # what did we find across all board?
-    total_hits = min(sum(n[0][0] for n in total_hits_per_board), max_hits)
+    total_hits = min(sum(total_hits_per_board), max_hits)
 
     return total_hits, total_hits_per_board
 
@@ -407,11 +485,12 @@ def intersect_form_data(boards: list[str], form_data: dict) -> tuple[list[str],
     return boards, form_data
 
 
-async def search_posts(form_data: dict, max_hits: int) -> tuple[list[dict], int]:
+def get_search_boards(form_data: dict) -> tuple[list[str] | None, dict | None]:
+    """Pops and validates `form_data['boards']`. `(None, None)` means there is nothing to search."""
     boards: list[str] | str = form_data.pop('boards')
 
     if not boards:
-        return [], 0
+        return None, None
 
     if boards and isinstance(boards, str):
         boards = [boards]
@@ -421,9 +500,16 @@ async def search_posts(form_data: dict, max_hits: int) -> tuple[list[dict], int]
 
     boards, form_data = intersect_form_data(boards, form_data)
     if (not boards) or (form_data is None):
-        return [], 0
+        return None, None
 
     validate_boards(boards)
+    return boards, form_data
+
+
+async def search_posts(form_data: dict, max_hits: int) -> tuple[list[dict], int]:
+    boards, form_data = get_search_boards(form_data)
+    if not boards:
+        return [], 0
 
     # some extra validation since these variables are embedded into sql strings
     order_by: str = dict(asc='asc', desc='desc').get(form_data.get('order_by', 'desc'), 'desc')
@@ -453,7 +539,7 @@ async def search_posts(form_data: dict, max_hits: int) -> tuple[list[dict], int]
 
     hits_for_this_page = 0
     for i, board in enumerate(boards):
-        board_hits: int = total_hits_per_board[i][0][0]
+        board_hits: int = total_hits_per_board[i]
         if not board_hits:
             continue
 
@@ -510,6 +596,100 @@ async def search_posts(form_data: dict, max_hits: int) -> tuple[list[dict], int]
     return posts, total_hits
 
 
+type SearchCursor = tuple[int, int, int]
+"""`(ts_unix, board index, num)` of the last post on the previous page, boards indexed in sorted order."""
+
+
+def get_search_keyset_where(where_query: str, cursor: SearchCursor | None, board_idx: int, order_by: str, phg: BasePlaceHolderGen) -> tuple[str, list]:
+    """Posts of the board at `board_idx` that come after `cursor` in `(ts_unix, board index, num)` order.
+
+    Boards merged ahead of the cursor's board have already given up their posts at the cursor's timestamp,
+    boards merged behind it have not.
+    """
+    if not cursor:
+        return '', []
+
+    ts_unix, cursor_board_idx, num = cursor
+    pre = ' and' if where_query else ' where '
+    cmp = '<' if order_by == 'desc' else '>'
+
+    if board_idx == cursor_board_idx:
+        return f'{pre} timestamp {cmp}= {phg()} and (timestamp {cmp} {phg()} or num {cmp} {phg()})', [ts_unix, ts_unix, num]
+
+    inclusive = board_idx < cursor_board_idx if order_by == 'desc' else board_idx > cursor_board_idx
+    return f'{pre} timestamp {cmp}{"=" if inclusive else ""} {phg()}', [ts_unix]
+
+
+async def search_posts_keyset(form_data: dict, max_hits: int, count_hits: bool=True) -> tuple[list[dict], int, SearchCursor | None]:
+    """Like `search_posts()`, but each board only reads `hits_per_page` posts after `form_data['cursor']`,
+    and the boards are merged into one time ordered page.
+
+    Returns `(posts, total_hits, next_cursor)`. Without `count_hits`, `total_hits` is the number of posts on this page.
+    """
+    boards, form_data = get_search_boards(form_data)
+    if not boards:
+        return [], 0, None
+
+    # some extra validation since these variables are embedded into sql strings
+    order_by: str = dict(asc='asc', desc='desc').get(form_data.get('order_by', 'desc'), 'desc')
+    hits_per_page: int = int(form_data['hits_per_page'])
+    cursor: SearchCursor | None = decode_cursor(form_data.get('cursor'), n_values=3)
+
+    phg1 = db_q.Phg()
+    where_filters, params = validate_and_generate_params(form_data, phg1)
+    where_query = f'where {where_filters}' if where_filters else ''
+
+    params += get_facet_params(form_data)
+
+    boards = sorted(boards)
+    calls = []
+    for board_idx, board in enumerate(boards):
+        phg2 = db_q.Phg(start=phg1.counter) if hasattr(phg1, 'counter') else db_q.Phg()
+
+        board_where, board_params = get_board_specific_where_clause(board, where_query, params.copy(), form_data, phg2)
+        keyset_where, keyset_params = get_search_keyset_where(board_where, cursor, board_idx, order_by, phg2)
+        board_params += keyset_params
+
+        sql = f"""
+            {get_selector(board)}
+            from `{board}`
+            {board_where}{keyset_where}
+            order by timestamp {order_by}, num {order_by}
+            limit {hits_per_page + 1}
+        """
+        calls.append(db_q.query_dict(sql, params=tuple(board_params) if board_params else None))
+
+    if count_hits:
+        board_posts, (total_hits, _) = await asyncio.gather(
+            asyncio.gather(*calls),
+            get_total_hits(form_data, boards, max_hits, where_query, phg1, params.copy(), estimate=SEARCH_COUNT_ESTIMATED),
+        )
+    else:
+        board_posts = await asyncio.gather(*calls)
+
+    board_idxs = {board: i for i, board in enumerate(boards)}
+    def get_key(post: dict) -> SearchCursor:
+        return (post['ts_unix'], board_idxs[post['board_shortname']], post['num'])
+
+    merged = heapq.merge(*board_posts, key=get_key, reverse=order_by == 'desc')
+    posts = list(islice(merged, hits_per_page))
+    if not posts:
+        return [], 0, None
+
+    # each board reads one post past the page, so anything left over in the merge means there is another page
+    next_cursor = get_key(posts[-1]) if next(merged, None) is not None else None
+
+    if not count_hits:
+        total_hits = len(posts)
+
+    board_quotelinks = await get_board_2_ql_lookup(posts)
+
+    for post in posts:
+        post['quotelinks'] = board_quotelinks.get(post['board_shortname'], {}).get(post['num'], set())
+
+    return posts, total_hits, next_cursor
+
+
 def get_qls_and_posts(rows: list[dict], gather_qls: bool=True) -> tuple[dict, list]:
     post_2_quotelinks = defaultdict(list)
     posts = []
@@ -544,7 +724,13 @@ async def get_board_2_ql_lookup(posts: list[dict]) -> dict[str, dict[int, list[i
     return {board: ql_lookup for (board, _thread_nums), ql_lookup in zip(board_thread_nums, board_qls)}
 
 
+QUOTELINKS_TABLE: bool = db_conf.get('quotelinks_table', False)
+
+
 async def get_board_thread_quotelinks(board: str, thread_nums: tuple[int]):
+    if QUOTELINKS_TABLE:
+        return await get_board_thread_quotelinks_indexed(board, thread_nums)
+
     sql = f'''
         select num, comment
         from `{board}`
@@ -555,10 +741,93 @@ async def get_board_thread_quotelinks(board: str, thread_nums: tuple[int]):
     return get_quotelink_lookup(rows)
 
 
-@alru_cache(ttl=60*2)
-async def get_op_thread_count(board: str) -> int:
-    rows = await db_q.query_tuple(f'select count(*) from `{board}_threads`;')
-    return rows[0][0]
+RENDERED_TABLE: bool = db_conf.get('rendered_table', False)
+
+
+async def get_rendered_comments(board: str, posts: list[dict]) -> RenderedLookup:
+    """Pre-rendered comments of `posts` from `<board>_rendered`, empty when the table is not in use."""
+    if not RENDERED_TABLE or not (doc_ids := tuple(post['doc_id'] for post in posts if post['comment'])):
+        return {}
+    return await get_board_rendered_by_doc_ids(board, doc_ids)
+
+
+async def get_thread_rendered_comments(board: str, thread_num: int) -> RenderedLookup:
+    if not RENDERED_TABLE:
+        return {}
+    return await get_board_rendered_by_thread(board, thread_num)
+
+
+async def html_comments(posts: list[dict]) -> None:
+    """Turns the `comment` of posts from any boards into html, like `html_comment()`.
+
+    Posts with a `doc_id`, i.e. not from a search index, are read from `<board>_rendered` when possible.
+    """
+    board_posts = defaultdict(list)
+    for post in posts:
+        if 'doc_id' in post:
+            board_posts[post['board_shortname']].append(post)
+
+    board_rendered = dict(zip(board_posts, await asyncio.gather(*(
+        get_rendered_comments(board, b_posts)
+        for board, b_posts in board_posts.items()
+    ))))
+
+    for post in posts:
+        board = post['board_shortname']
+        if rendered := board_rendered.get(board):
+            post['comment'] = html_comment_rendered(post, post['thread_num'], board, rendered)
+        else:
+            post['comment'] = html_comment(post['comment'], post['thread_num'], board)
+
+
+# the count is served from memory this long, then topped up with the threads added since
+OP_THREAD_COUNT_TTL = 60*2
+# and counted in full this often, to catch threads removed without a moderation generation bump
+OP_THREAD_RECOUNT_TTL = 60*30
+
+
+@dataclass(slots=True)
+class OpThreadCount:
+    checked: float
+    counted: float # last full count
+    generation: int
+    count: int
+    max_thread_num: int
+
+
+op_thread_counts: dict[str, OpThreadCount] = {}
+
+
+async def get_op_thread_count(board: str, get_generation: Callable[[str], Awaitable[int]] | None=None) -> int:
+    """Threads in `<board>_threads`.
+
+    The count is refreshed at most every `OP_THREAD_COUNT_TTL` seconds, and `get_generation(board)` is only read then.
+    A refresh only adds the threads past the highest thread_num counted, a primary key range scan.
+    The table is counted in full when the moderation generation changed, since deleting a thread bumps it,
+    and every `OP_THREAD_RECOUNT_TTL` seconds for threads removed some other way.
+    """
+    now = time.monotonic()
+    entry = op_thread_counts.get(board)
+    if entry and now - entry.checked < OP_THREAD_COUNT_TTL:
+        return entry.count
+
+    if entry:
+        entry.checked = now # requests arriving during the refresh keep the current count
+
+    generation = await get_generation(board) if get_generation else 0
+    if entry and entry.generation == generation and now - entry.counted < OP_THREAD_RECOUNT_TTL:
+        max_thread_num = entry.max_thread_num
+        sql = f'select count(*), max(thread_num) from `{board}_threads` where thread_num > {db_q.Phg()()};'
+        new_count, new_max = (await db_q.query_tuple(sql, params=(max_thread_num,)))[0]
+        # skipped if a concurrent refresh already added these threads
+        if new_count and entry.max_thread_num == max_thread_num:
+            entry.count += new_count
+            entry.max_thread_num = new_max
+        return entry.count
+
+    count, max_thread_num = (await db_q.query_tuple(f'select count(*), max(thread_num) from `{board}_threads`;'))[0]
+    op_thread_counts[board] = OpThreadCount(now, now, generation, count, max_thread_num or 0)
+    return count
 
 
 square_re = re.compile(r'.*\[(spoiler|code|banned)\].*\[/(spoiler|code|banned)\].*')
@@ -578,68 +847,167 @@ def substitute_square_brackets(text):
     return text
 
 
-async def get_page_threads_normal(board: str, post_count: int, page_num: int=1) -> list[dict]:
+type PageCursor = tuple[int, int]
+"""`(time_bump, thread_num)` of the last thread on the previous page."""
+
+INDEX_PAGE_THREADS = 10
+CATALOG_PAGE_THREADS = 150
+
+# every PAGE_CURSOR_STRIDE-th page keeps its cursor, the pages in between are a short hop from the one before them
+PAGE_CURSOR_STRIDE = 10
+# bumps shift every page boundary, so a board's whole page index is dropped this often
+PAGE_CURSOR_TTL = 60
+
+# sorts after every thread, so it selects an empty page
+PAST_LAST_PAGE: PageCursor = (-1, -1)
+
+page_cursor_index: dict[tuple[str, int], tuple[float, dict[int, PageCursor]]] = {}
+
+
+def get_keyset_where(cursor: PageCursor | None, phg: BasePlaceHolderGen) -> tuple[str, tuple]:
+    """Threads strictly after `cursor` in `time_bump desc, thread_num desc` order.
+
+    `time_bump <= ?` is kept separate from the tie-break so it can drive a range scan on the time_bump index.
+    """
+    if not cursor:
+        return '', ()
+    time_bump, thread_num = cursor
+    return f'where time_bump <= {phg()} and (time_bump < {phg()} or thread_num < {phg()})', (time_bump, time_bump, thread_num)
+
+
+async def get_page_threads_normal(board: str, post_count: int, cursor: PageCursor | None=None) -> list[dict]:
+    where, params = get_keyset_where(cursor, db_q.Phg())
     sql = f'''
-    select thread_num, nreplies, nimages
+    select thread_num, time_bump, nreplies, nimages
     from `{board}_threads`
-    order by time_bump desc limit {post_count}
-    {get_offset(page_num - 1, post_count)};
+    {where}
+    order by time_bump desc, thread_num desc limit {int(post_count)};
     '''
-    return await db_q.query_dict(sql)
+    return await db_q.query_dict(sql, params=params)
 
 
-async def get_page_threads_deferred(board: str, post_count: int, page_num: int=1) -> list[dict]:
+async def get_page_threads_deferred(board: str, post_count: int, cursor: PageCursor | None=None) -> list[dict]:
+    where, params = get_keyset_where(cursor, db_q.Phg())
     sql = f'''
     with thread_nums as (
         select thread_num from `{board}_threads`
-        order by time_bump desc limit {post_count}
-        {get_offset(page_num - 1, post_count)}
-    ) select thread_num, nreplies, nimages
+        {where}
+        order by time_bump desc, thread_num desc limit {int(post_count)}
+    ) select thread_num, time_bump, nreplies, nimages
     from thread_nums
-    left join `{board}_threads` using(thread_num);
+    left join `{board}_threads` using(thread_num)
+    order by time_bump desc, thread_num desc;
     '''
-    return await db_q.query_dict(sql)
+    return await db_q.query_dict(sql, params=params)
 
 
 get_page_threads = get_page_threads_deferred if db_q.db_type == DbType.mysql else get_page_threads_normal
 
 
-async def generate_index(board: str, page_num: int=1):
+def get_next_page_cursor(threads: list[dict], post_count: int) -> PageCursor | None:
+    """`None` when `threads` is the last page."""
+    if len(threads) < post_count:
+        return None
+    return (threads[-1]['time_bump'], threads[-1]['thread_num'])
+
+
+def get_page_cursors(board: str, post_count: int) -> dict[int, PageCursor]:
+    key = (board, post_count)
+    now = time.monotonic()
+    if (entry := page_cursor_index.get(key)) and now - entry[0] < PAGE_CURSOR_TTL:
+        return entry[1]
+
+    cursors = {}
+    page_cursor_index[key] = (now, cursors)
+    return cursors
+
+
+def is_page_cursor_anchor(page_num: int) -> bool:
+    return page_num > 1 and (page_num - 1) % PAGE_CURSOR_STRIDE == 0
+
+
+def remember_page_cursor(board: str, post_count: int, page_num: int, cursor: PageCursor | None) -> None:
+    if cursor and is_page_cursor_anchor(page_num):
+        get_page_cursors(board, post_count)[page_num] = cursor
+
+
+async def skip_threads(board: str, cursor: PageCursor | None, n_threads: int) -> PageCursor:
+    """Cursor of the `n_threads`-th thread after `cursor`, reading only the time_bump index."""
+    where, params = get_keyset_where(cursor, db_q.Phg())
+    sql = f'''
+    select time_bump, thread_num
+    from `{board}_threads`
+    {where}
+    order by time_bump desc, thread_num desc
+    limit 1 offset {int(n_threads) - 1};
+    '''
+    if not (rows := await db_q.query_tuple(sql, params=params)):
+        return PAST_LAST_PAGE
+    return tuple(rows[0])
+
+
+async def get_page_cursor(board: str, post_count: int, page_num: int) -> PageCursor | None:
+    """Resolves a page number to the cursor it starts after, for links that only carry a page number.
+
+    Walks forward from the nearest remembered anchor page rather than offsetting from the first thread.
+    `None` is the first page.
     """
-    - Generates the board index.
-    - The index shows the OP and its 3 latest comments, if any.
-    - The returned titles and comments are html escaped.
+    if page_num <= 1:
+        return None
 
-    Returns the dict:
+    cursors = get_page_cursors(board, post_count)
+    anchor = page_num - (page_num - 1) % PAGE_CURSOR_STRIDE
 
-    ```
-    {'threads': [
-        {'posts': [{OP1}, {reply1}, {reply2}, ...]},
-        {'posts': [{OP2}, {reply1}, {reply2}, ...]},
-    ]}
-    ```
+    known = anchor
+    while known > 1 and known not in cursors:
+        known -= PAGE_CURSOR_STRIDE
+    cursor = cursors.get(known)
 
-    OPs have these extra fields added to them:
-        - nreplies: int
-        - nimages: int
-        # - omitted_posts: int (to be implemented)
-        # - omitted_images: int (to be implemented)
+    if known < anchor:
+        if cursor == PAST_LAST_PAGE:
+            return cursor
+        cursor = await skip_threads(board, cursor, (anchor - known) * post_count)
+        cursors[anchor] = cursor
+
+    if anchor < page_num and cursor != PAST_LAST_PAGE:
+        cursor = await skip_threads(board, cursor, (page_num - anchor) * post_count)
+    return cursor
+
+
+async def get_page_version(board: str, post_count: int, page_num: int, cursor: PageCursor | None=None) -> tuple[tuple[int, int, int]]:
+    """`(thread_num, time_bump, nreplies)` of each thread on an index or catalog page, from `<board>_threads` alone.
+
+    New replies, bumps and deletions all change it, so it tells whether a rendered page is stale.
     """
-    index_post_count = 10
-    if not (threads := await get_page_threads(board, index_post_count, page_num)):
-        return {'threads': []}, {}
+    if cursor is None:
+        cursor = await get_page_cursor(board, post_count, page_num)
+    rows = await get_page_threads(board, post_count, cursor)
+    return tuple((row['thread_num'], row['time_bump'], row['nreplies']) for row in rows)
 
-    phg_size = db_q.Phg().size(threads)
 
-    op_query = f'''
+INDEX_THREAD_REPLIES = 3
+
+
+async def get_index_posts_lateral(board: str, thread_nums: tuple[int], n_replies: int) -> list[dict]:
+    """OPs and their latest `n_replies` replies, ordered by `num`, in one query."""
+    sql = f'''
     {get_selector(board)}
-    from `{board}`
-    where
-        op = 1
-        and thread_num in ({phg_size})
+    from `{board}_threads` as threads
+    cross join lateral (
+        (select * from `{board}` where num = threads.thread_num and op = 1)
+        union all
+        (select * from `{board}` where thread_num = threads.thread_num and op = 0 order by num desc limit {int(n_replies)})
+    ) as `{board}`
+    where threads.thread_num in ({db_q.Phg().size(thread_nums)})
+    order by num asc
     '''
+    return rows_2_posts(await db_q.query_tuple(sql, params=thread_nums))
+
 
-    replies_query = f'''
+async def get_index_posts_windowed(board: str, thread_nums: tuple[int], n_replies: int) -> list[dict]:
+    """Same as `get_index_posts_lateral()`, for mysql versions and mariadb without lateral joins."""
+    phg = db_q.Phg()
+    sql = f'''
     with latest_replies as (
         select
             num as reply_num,
@@ -649,46 +1017,123 @@ async def generate_index(board: str, page_num: int=1):
         from `{board}`
         where
             op = 0
-            and thread_num in ({phg_size})
+            and thread_num in ({phg.size(thread_nums)})
     )
     {get_selector(board)}
+    from `{board}`
+    where
+        op = 1
+        and thread_num in ({phg.size(thread_nums)})
+    union all
+    {get_selector(board)}
     from latest_replies
     left join `{board}` on
         latest_replies.reply_num = `{board}`.num
-    where latest_replies.reply_number <= 3
+    where latest_replies.reply_number <= {int(n_replies)}
     order by num asc
     '''
+    return rows_2_posts(await db_q.query_tuple(sql, params=thread_nums + thread_nums))
+
+
+async def get_index_posts_union(board: str, thread_nums: tuple[int], n_replies: int) -> list[dict]:
+    """Same as `get_index_posts_lateral()`, with one `limit` subquery per thread, each served by the thread_num index."""
+    phg = db_q.Phg()
+    ops = f'''
+    {get_selector(board)}
+    from `{board}`
+    where
+        op = 1
+        and thread_num in ({phg.size(thread_nums)})
+    '''
+    replies = 'union all'.join(
+        f'''
+        select * from (
+            {get_selector(board)}
+            from `{board}`
+            where thread_num = {phg()} and op = 0
+            order by num desc
+            limit {int(n_replies)}
+        )
+        '''
+        for _ in thread_nums
+    )
+    sql = f'{ops} union all {replies} order by num asc'
+    return rows_2_posts(await db_q.query_tuple(sql, params=thread_nums + thread_nums))
+
+
+match db_q.db_type:
+    case DbType.postgres:
+        get_index_posts = get_index_posts_lateral
+    case DbType.sqlite:
+        get_index_posts = get_index_posts_union
+    case _:
+        get_index_posts = get_index_posts_windowed
+
+
+async def generate_index(board: str, page_num: int=1, cursor: PageCursor | None=None):
+    """
+    - Generates the board index.
+    - The index shows the OP and its 3 latest comments, if any.
+    - The returned titles and comments are html escaped.
+
+    Returns the dict:
+
+    ```
+    {'threads': [
+        {'posts': [{OP1}, {reply1}, {reply2}, ...]},
+        {'posts': [{OP2}, {reply1}, {reply2}, ...]},
+    ]}
+    ```
+
+    OPs have these extra fields added to them:
+        - nreplies: int
+        - nimages: int
+        # - omitted_posts: int (to be implemented)
+        # - omitted_images: int (to be implemented)
+
+    The index also has `next_cursor`, which starts the page after this one without counting from the first thread.
+    `cursor` takes precedence over `page_num` when given, and is not remembered as the start of page_num + 1.
+    """
+    # a client's cursor need not start page_num, so only cursors resolved here are remembered as anchors
+    resolved = cursor is None
+    if resolved:
+        cursor = await get_page_cursor(board, INDEX_PAGE_THREADS, page_num)
+
+    if not (threads := await get_page_threads(board, INDEX_PAGE_THREADS, cursor)):
+        return {'threads': [], 'next_cursor': None}, {}
+
+    next_cursor = get_next_page_cursor(threads, INDEX_PAGE_THREADS)
+    if resolved:
+        remember_page_cursor(board, INDEX_PAGE_THREADS, page_num + 1, next_cursor)
+    for thread in threads:
+        del thread['time_bump']
 
     thread_nums = tuple(t['thread_num'] for t in threads)
     thread_nums_d = {t['thread_num']:t for t in threads}
 
-    ops, replies, ql_lookup = await asyncio.gather(
-        db_q.query_dict(op_query, params=thread_nums),
-        db_q.query_dict(replies_query, params=thread_nums),
+    posts, ql_lookup = await asyncio.gather(
+        get_index_posts(board, thread_nums, INDEX_THREAD_REPLIES),
         get_board_thread_quotelinks(board, thread_nums)
     )
 
-    for reply in replies:
-        reply['title'] = html_title(reply['title'])
-        reply['comment'] = html_comment(reply['comment'], reply['thread_num'], board)
+    rendered = await get_rendered_comments(board, posts)
 
     thread_posts = defaultdict(list)
-    for op in ops:
-        thread_num = op['num']
-        op['title'] = html_title(op['title'])
-        op['comment'] = html_comment(op['comment'], thread_num, board)
-
-        op.update(thread_nums_d[thread_num])
-        thread_posts[thread_num].append(op)
+    for post in posts:
+        thread_num = post['thread_num']
+        post['title'] = html_title(post['title'])
+        post['comment'] = html_comment_rendered(post, thread_num, board, rendered)
 
-    for reply in replies:
-        thread_posts[reply['thread_num']].append(reply)
+        if post['op']:
+            post.update(thread_nums_d[thread_num])
+        thread_posts[thread_num].append(post)
 
     threads = {
         'threads': [
             {'posts': thread_posts[thread['thread_num']]}
             for thread in threads
-        ]
+        ],
+        'next_cursor': next_cursor,
     }
     return threads, ql_lookup
 
@@ -700,32 +1145,26 @@ def get_counts_from_posts(posts: list[dict]) -> tuple[int]:
     return nreplies, nimages
 
 
-async def generate_catalog(board: str, page_num: int=1):
-    """
-    - Generates the catalog structure.
-    - Returns html escaped titles and comments.
-    """
-    catalog_post_count = 150
-    if not (rows := await get_page_threads(board, catalog_post_count, page_num)):
-        return []
-
-    threads = {row['thread_num']: (row['nreplies'], row['nimages']) for row in rows}
-
+async def get_catalog_ops(board: str, thread_nums: tuple[int]) -> list[dict]:
+    """html escaped OPs, ordered by thread_num desc."""
     posts_query = f'''
         {get_selector(board)}
     from `{board}`
     where op = 1
-    and thread_num in ({db_q.Phg().size(threads)})
+    and thread_num in ({db_q.Phg().size(thread_nums)})
     order by thread_num desc
     '''
-    posts = await db_q.query_dict(posts_query, params=tuple(threads.keys()))
-    if not posts:
-        return []
+    posts = rows_2_posts(await db_q.query_tuple(posts_query, params=tuple(thread_nums)))
+    rendered = await get_rendered_comments(board, posts)
 
     for post in posts:
         post['title'] = html_title(post['title'])
-        post['comment'] = html_comment(post['comment'], post['thread_num'], board)
+        post['comment'] = html_comment_rendered(post, post['thread_num'], board, rendered)
+    return posts
 
+
+def get_catalog_pages(posts: list[dict], threads: dict[int, tuple[int, int]]) -> list[dict]:
+    """`threads` is `{thread_num: (nreplies, nimages)}`."""
     batch_size = 15
     return [
         {
@@ -744,64 +1183,202 @@ async def generate_catalog(board: str, page_num: int=1):
     ]
 
 
-async def generate_thread(board: str, thread_num: int) -> tuple[dict]:
-    """Generates a thread.
+async def generate_catalog(board: str, page_num: int=1, cursor: PageCursor | None=None) -> tuple[list[dict], PageCursor | None]:
+    """
+    - Generates the catalog structure.
+    - Returns html escaped titles and comments.
+    - Returns the cursor of the next page, see `generate_index()`.
+    """
+    resolved = cursor is None
+    if resolved:
+        cursor = await get_page_cursor(board, CATALOG_PAGE_THREADS, page_num)
 
-    The post tuple is tuple[1]:
-    ```
-        {'posts': [{...}, {...}, {...}, ...]},
-    ```
+    if not (rows := await get_page_threads(board, CATALOG_PAGE_THREADS, cursor)):
+        return [], None
 
-    OPs have these extra fields added to them compared to comments:
-        - nreplies: int
-        - nimages: int
-    """
+    next_cursor = get_next_page_cursor(rows, CATALOG_PAGE_THREADS)
+    if resolved:
+        remember_page_cursor(board, CATALOG_PAGE_THREADS, page_num + 1, next_cursor)
 
-    thread_query = f'''
-        select
-            nreplies,
-            nimages
-        from `{board}_threads`
-        where thread_num = {db_q.Phg()()}
+    threads = {row['thread_num']: (row['nreplies'], row['nimages']) for row in rows}
+
+    if not (posts := await get_catalog_ops(board, tuple(threads))):
+        return [], None
+
+    return get_catalog_pages(posts, threads), next_cursor
+
+
+async def get_threads_bumped_since(board: str, time_bump: int, thread_nums: tuple[int]) -> list[dict]:
+    """`<board>_threads` rows bumped at or after `time_bump`, plus the current rows of `thread_nums`, which must not be empty."""
+    phg = db_q.Phg()
+    bumped_sql = f'''
+    select thread_num, time_bump, nreplies, nimages
+    from `{board}_threads`
+    where time_bump >= {phg()}
+    order by time_bump desc, thread_num desc limit {CATALOG_PAGE_THREADS};
+    '''
+    current_sql = f'''
+    select thread_num, time_bump, nreplies, nimages
+    from `{board}_threads`
+    where thread_num in ({db_q.Phg().size(thread_nums)});
+    '''
+    bumped, current = await asyncio.gather(
+        db_q.query_dict(bumped_sql, params=(time_bump,)),
+        db_q.query_dict(current_sql, params=thread_nums),
+    )
+    return list({row['thread_num']: row for row in current + bumped}.values())
+
+
+@cache
+def get_thread_details_sql(board: str) -> str:
+    return f'select nreplies, nimages from `{board}_threads` where thread_num = {db_q.Phg()()};'
+
+
+@cache
+def get_thread_version_sql(board: str) -> str:
+    return f'''
+        select t.time_bump, t.nreplies, op.timestamp_expired
+        from `{board}_threads` t
+        left join `{board}` op on op.num = t.thread_num and op.subnum = 0
+        where t.thread_num = {db_q.Phg()()}
     ;'''
 
-    posts_query = f'''
+
+@cache
+def get_thread_posts_sql(board: str) -> str:
+    return f'''
         {get_selector(board)}
         from `{board}`
         where thread_num = {db_q.Phg()()}
         order by num asc
     ;'''
-    threads_details, posts = await asyncio.gather(
-        db_q.query_dict(thread_query, params=(thread_num,)),
-        db_q.query_dict(posts_query, params=(thread_num,)),
+
+
+@cache
+def get_post_sql(board: str) -> str:
+    return f"""
+        {get_selector(board)}
+        from `{board}`
+        where num = {db_q.Phg()()}
+    ;"""
+
+
+async def get_thread_rows(board: str, thread_num: int) -> tuple[dict | None, list[tuple], RenderedLookup]:
+    """The thread's `<board>_threads` details, its posts as tuples of `selector_columns`, and their pre-rendered comments."""
+    threads_details, rows, rendered = await asyncio.gather(
+        db_q.query_prepared('thread_details', board, get_thread_details_sql(board), params=(thread_num,)),
+        db_q.query_prepared('thread_posts', board, get_thread_posts_sql(board), params=(thread_num,), dict_row=False),
+        get_thread_rendered_comments(board, thread_num),
     )
-    if not threads_details or not posts:
+    return (threads_details[0] if threads_details else None), rows, rendered
+
+
+def thread_rows_2_posts(board: str, thread_num: int, details: dict | None, rows: list[tuple], rendered: RenderedLookup) -> tuple[dict]:
+    """Same output as `generate_thread()`, from the output of `get_thread_rows()`. Doesn't touch the db."""
+    posts = rows_2_posts(rows)
+    if not details or not posts:
         return {}, {'posts': []}
 
     # post_2_quotelinks, posts = get_qls_and_posts(posts)
     post_2_quotelinks = get_quotelink_lookup_raw(posts)
     for post in posts:
-        if not (comment := post['comment']):
+        if not post['comment']:
             continue
 
         post['title'] = html_title(post['title'])
-        post['comment'] = html_comment(comment, thread_num, board)
+        post['comment'] = html_comment_rendered(post, thread_num, board, rendered)
 
-    posts[0].update(threads_details[0])
+    posts[0].update(details)
     results = {'posts': posts}
 
     return post_2_quotelinks, results
 
 
-async def generate_post(board: str, post_id: int) -> tuple[dict]:
-    """Returns {thread_num: 123, comment: 'hello', ...} with quotelinks"""
+async def generate_thread(board: str, thread_num: int) -> tuple[dict]:
+    """Generates a thread.
 
-    sql = f"""
-        {get_selector(board)}
+    The post tuple is tuple[1]:
+    ```
+        {'posts': [{...}, {...}, {...}, ...]},
+    ```
+
+    OPs have these extra fields added to them compared to comments:
+        - nreplies: int
+        - nimages: int
+    """
+    return thread_rows_2_posts(board, thread_num, *await get_thread_rows(board, thread_num))
+
+
+async def get_thread_version(board: str, thread_num: int) -> tuple[int, int, int | None] | None:
+    """Returns `(time_bump, nreplies, ts_expired)` from `<board>_threads` and the OP. Cheap enough to tell whether a rendered thread is stale."""
+    if not (rows := await db_q.query_prepared('thread_version', board, get_thread_version_sql(board), params=(thread_num,), dict_row=False)):
+        return None
+    return tuple(rows[0])
+
+
+@cache
+def get_post_version_sql(board: str) -> str:
+    return f'''
+        select doc_id, timestamp, timestamp_expired, deleted, {db_q.length_method}(comment)
         from `{board}`
         where num = {db_q.Phg()()}
+    ;'''
+
+
+async def get_post_version(board: str, num: int) -> tuple[int, int, int | None, int, int | None] | None:
+    """Returns `(doc_id, ts_unix, ts_expired, deleted, comment length)`. Cheap enough to tell whether a post's html is stale, without formatting it."""
+    if not (rows := await db_q.query_prepared('post_version', board, get_post_version_sql(board), params=(num,), dict_row=False)):
+        return None
+    return tuple(rows[0])
+
+
+async def get_thread_details(board: str, thread_num: int) -> dict | None:
+    """Returns `{'nreplies': int, 'nimages': int}` from `<board>_threads`."""
+    if not (rows := await db_q.query_prepared('thread_details', board, get_thread_details_sql(board), params=(thread_num,))):
+        return None
+    return rows[0]
+
+
+async def get_thread_quotelinks(board: str, thread_num: int) -> dict[int, list[int]]:
+    """Quotelink lookup for a whole thread without selecting every post.
+
+    Only posts that can contain a quotelink are read, unless the `<board>_quotelinks` table is available.
+    """
+    if QUOTELINKS_TABLE:
+        return await get_board_thread_quotelinks_indexed(board, (thread_num,))
+
+    sql = f"""
+        select num, comment
+        from `{board}`
+        where thread_num = {db_q.Phg()()}
+        and comment like '%>>%'
     ;"""
-    posts = await db_q.query_dict(sql, params=(post_id,))
+    rows = await db_q.query_dict(sql, params=(thread_num,))
+    return get_quotelink_lookup_raw(rows)
+
+
+async def generate_thread_stream(board: str, thread_num: int, size: int=500) -> AsyncIterator[list[dict]]:
+    """Yields batches of a thread's posts, in order, as they come off a server-side cursor.
+
+    Posts are prepared the same way `generate_thread()` prepares them.
+    Pair this with `get_thread_details()` and `get_thread_quotelinks()` since neither can be known from a single batch.
+    """
+    async for rows in db_q.query_iter(get_thread_posts_sql(board), params=(thread_num,), dict_row=False, size=size):
+        posts = rows_2_posts(rows)
+        rendered = await get_rendered_comments(board, posts)
+        for post in posts:
+            if not post['comment']:
+                continue
+
+            post['title'] = html_title(post['title'])
+            post['comment'] = html_comment_rendered(post, thread_num, board, rendered)
+        yield posts
+
+
+async def generate_post(board: str, post_id: int) -> tuple[dict]:
+    """Returns {thread_num: 123, comment: 'hello', ...} with quotelinks"""
+
+    posts = rows_2_posts(await db_q.query_prepared('post', board, get_post_sql(board), params=(post_id,), dict_row=False))
 
     if not posts:
         return None, None
@@ -811,15 +1388,13 @@ async def generate_post(board: str, post_id: int) -> tuple[dict]:
     return post_2_quotelinks, posts[0]
 
 
-async def get_post(board: str, post_id: int) -> dict:
-    """Returns {thread_num: 123, comment: 'hello', ...} without quotelinks"""
+async def get_post(board: str, post_id: int, primary: bool=False) -> dict:
+    """Returns {thread_num: 123, comment: 'hello', ...} without quotelinks
 
-    sql = f"""
-        {get_selector(board)}
-        from `{board}`
-        where num = {db_q.Phg()()}
-    ;"""
-    posts = await db_q.query_dict(sql, params=(post_id,))
+    Set `primary=True` to skip read replicas, e.g. before writing the post somewhere else.
+    """
+
+    posts = rows_2_posts(await db_q.query_prepared('post', board, get_post_sql(board), params=(post_id,), dict_row=False, primary=primary))
 
     if not posts:
         return dict()
@@ -830,12 +1405,7 @@ async def get_post(board: str, post_id: int) -> dict:
 async def get_post_with_doc_id(board: str, post_id: int) -> dict:
     """Returns {thread_num: 123, comment: 'hello', ...} without quotelinks"""
 
-    sql = f"""
-        {get_selector(board)}
-        from `{board}`
-        where num = {db_q.Phg()()}
-    ;"""
-    posts = await db_q.query_dict(sql, params=(post_id,))
+    posts = rows_2_posts(await db_q.query_prepared('post', board, get_post_sql(board), params=(post_id,), dict_row=False))
 
     if not posts:
         return dict()
@@ -875,6 +1445,12 @@ async def move_post_to_delete_table(post: dict) -> str:
 
     msg += f' Post deleted from `{board}` table.'
 
+    if QUOTELINKS_TABLE:
+        await delete_post_quotelinks(board, post['num'])
+
+    if RENDERED_TABLE:
+        await delete_post_rendered(board, post['doc_id'])
+
     return msg
 
 
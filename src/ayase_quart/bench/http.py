@@ -0,0 +1,302 @@
+import asyncio
+import random
+import statistics
+from bisect import bisect
+from collections import Counter, defaultdict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import accumulate
+from time import perf_counter
+from urllib.parse import urlencode
+
+from .suite import get_commit_info, get_machine_info
+
+"""
+Load tests the web app with a weighted mix of page views at a fixed concurrency, to size hypercorn `workers` and db pool sizes.
+
+By default the app runs in this process through Quart's test client, against the configured database,
+so requests skip the network and HTTP parsing but go through every hook, pool and cache a served request does.
+With a url, an already running server is loaded instead, e.g. hypercorn with the `workers` count being sized.
+
+Each page's Perf checkpoints come back in its Server-Timing header. They are summed per route,
+so a run also tells which stage, e.g. query, filter_reported or render, dominated.
+"""
+
+ROUTES = ('thread', 'index', 'catalog', 'post', 'search')
+DEFAULT_MIX = dict(thread=40, index=20, catalog=10, post=20, search=10)
+DEFAULT_CONCURRENCY = 16
+DEFAULT_DURATION = 30.0
+DEFAULT_WARMUP = 50
+MAX_INDEX_PAGES = 10
+POST_SAMPLE = 2_000
+SEARCH_TERMS = ('kernel', 'garlic', 'based', 'install linux', 'butter', 'python', 'recipe', 'thread')
+
+type Send = Callable[[str], Awaitable[tuple[int, str | None]]] # path -> status, Server-Timing header
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """'thread=40,index=20' -> {'thread': 40.0, 'index': 20.0}"""
+    mix = {}
+    for part in value.split(','):
+        route, _, weight = part.partition('=')
+        if route.strip() not in ROUTES:
+            raise ValueError(f'Unknown route {route}, expected one of {", ".join(ROUTES)}')
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+class WeightedChoice:
+    __slots__ = ('values', 'cum_weights', 'total')
+
+    def __init__(self, values: list, weights: list[float]):
+        self.values = values
+        self.cum_weights = list(accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def __call__(self, rng: random.Random):
+        return self.values[bisect(self.cum_weights, rng.random() * self.total)]
+
+
+@dataclass(slots=True)
+class BoardSample:
+    board: str
+    threads: WeightedChoice # thread_num, by number of posts, since big threads draw more views
+    pages: WeightedChoice # index page, early pages draw more views
+    nums: list[int]
+
+
+class RequestMix:
+    def __init__(self, samples: list[BoardSample], mix: dict[str, float], seed: int=0):
+        self.samples = samples
+        self.routes = WeightedChoice(list(mix), list(mix.values()))
+        self.rng = random.Random(seed)
+
+    def next(self) -> tuple[str, str]:
+        """A route, and a path to request for it."""
+        rng = self.rng
+        route = self.routes(rng)
+        sample = rng.choice(self.samples)
+        board = sample.board
+        match route:
+            case 'thread':
+                return route, f'/{board}/thread/{sample.threads(rng)}'
+            case 'index':
+                page_num = sample.pages(rng)
+                return route, f'/{board}' if page_num == 1 else f'/{board}/page/{page_num}'
+            case 'catalog':
+                return route, f'/{board}/catalog'
+            case 'post':
+                return route, f'/{board}/post/{rng.choice(sample.nums)}'
+            case 'search':
+                return route, '/sql?' + urlencode(dict(boards=board, comment=rng.choice(SEARCH_TERMS)))
+        raise ValueError(route)
+
+
+async def get_board_sample(board: str, rng: random.Random) -> BoardSample | None:
+    from ..asagi_converter import INDEX_PAGE_THREADS
+    from ..db import db_q
+
+    rows = await db_q.query_tuple(f'select thread_num, nreplies from `{board}_threads`')
+    if not rows:
+        return None
+    threads = WeightedChoice([thread_num for thread_num, _ in rows], [nreplies + 1 for _, nreplies in rows])
+
+    n_pages = min(MAX_INDEX_PAGES, max(1, -(-len(rows) // INDEX_PAGE_THREADS)))
+    pages = WeightedChoice(list(range(1, n_pages + 1)), [1 / page_num for page_num in range(1, n_pages + 1)])
+
+    # posts hovered are spread over the whole board, random doc_ids work on any db and skip the gaps
+    max_doc_id = (await db_q.query_tuple(f'select max(doc_id) from `{board}`'))[0][0] or 0
+    doc_ids = list({rng.randint(1, max_doc_id) for _ in range(POST_SAMPLE)}) if max_doc_id else []
+    nums = []
+    if doc_ids:
+        rows = await db_q.query_tuple(f'select num from `{board}` where doc_id in ({db_q.Phg().size(doc_ids)})', params=doc_ids)
+        nums = [num for (num,) in rows]
+    return BoardSample(board, threads, pages, nums or threads.values)
+
+
+@dataclass(slots=True)
+class RouteStats:
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: int = 0
+    stages: defaultdict[str, float] = field(default_factory=lambda: defaultdict(float)) # stage -> total seconds
+    timed: int = 0 # responses with a Server-Timing header
+
+
+def parse_server_timing(header: str) -> list[tuple[str, float]]:
+    """'query;dur=1.20, render;dur=3.40' -> [('query', 0.0012), ('render', 0.0034)]"""
+    stages = []
+    for metric in header.split(','):
+        name, *params = metric.strip().split(';')
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'dur':
+                try:
+                    stages.append((name.strip(), float(value) / 1000))
+                except ValueError:
+                    pass
+    return stages
+
+
+class LoadTest:
+    def __init__(self, send: Send, mix: RequestMix, concurrency: int=DEFAULT_CONCURRENCY):
+        self.send = send
+        self.mix = mix
+        self.concurrency = concurrency
+        self.routes: defaultdict[str, RouteStats] = defaultdict(RouteStats)
+        self.elapsed = 0.0
+
+    async def request(self, route: str, path: str, record: bool=True) -> None:
+        t0 = perf_counter()
+        try:
+            status, server_timing = await self.send(path)
+        except Exception:
+            status, server_timing = None, None
+        latency = perf_counter() - t0
+        if not record:
+            return
+
+        stats = self.routes[route]
+        stats.latencies.append(latency)
+        stats.statuses[status or 'error'] += 1
+        if status is None or status >= 500:
+            stats.errors += 1
+        if server_timing:
+            stats.timed += 1
+            for stage, seconds in parse_server_timing(server_timing):
+                if stage != 'total':
+                    stats.stages[stage] += seconds
+
+    async def warmup(self, n_requests: int) -> None:
+        for _ in range(n_requests):
+            await self.request(*self.mix.next(), record=False)
+
+    async def run(self, duration: float | None=DEFAULT_DURATION, n_requests: int | None=None) -> None:
+        """Keeps `concurrency` requests in flight, for `duration` seconds or until `n_requests` were sent."""
+        remaining = n_requests
+        start = perf_counter()
+        deadline = start + duration if duration else None
+
+        async def worker():
+            nonlocal remaining
+            while True:
+                if deadline and perf_counter() >= deadline:
+                    return
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                await self.request(*self.mix.next())
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        self.elapsed = perf_counter() - start
+
+    def get_results(self) -> dict:
+        routes = {}
+        for route in sorted(self.routes, key=lambda route: ROUTES.index(route)):
+            stats = self.routes[route]
+            routes[route] = get_route_results(stats, self.elapsed)
+
+        latencies = [latency for stats in self.routes.values() for latency in stats.latencies]
+        stages = defaultdict(float)
+        for stats in self.routes.values():
+            for stage, seconds in stats.stages.items():
+                stages[stage] += seconds
+        return dict(
+            concurrency=self.concurrency,
+            elapsed=self.elapsed,
+            requests=len(latencies),
+            errors=sum(stats.errors for stats in self.routes.values()),
+            throughput=len(latencies) / self.elapsed if self.elapsed else 0.0,
+            **get_percentiles(latencies),
+            dominant_stage=max(stages, key=stages.get) if stages else None,
+            routes=routes,
+        )
+
+
+def get_percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return dict(p50=None, p95=None, p99=None, mean=None, max=None)
+    if len(latencies) == 1:
+        p50 = p95 = p99 = latencies[0]
+    else:
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    return dict(p50=p50, p95=p95, p99=p99, mean=statistics.fmean(latencies), max=max(latencies))
+
+
+def get_route_results(stats: RouteStats, elapsed: float) -> dict:
+    stages = {stage: seconds / stats.timed for stage, seconds in sorted(stats.stages.items(), key=lambda item: -item[1])}
+    return dict(
+        requests=len(stats.latencies),
+        errors=stats.errors,
+        statuses={str(status): count for status, count in stats.statuses.items()},
+        throughput=len(stats.latencies) / elapsed if elapsed else 0.0,
+        **get_percentiles(stats.latencies),
+        stages=stages, # mean seconds per request
+        dominant_stage=next(iter(stages), None),
+    )
+
+
+async def get_request_mix(boards: list[str], mix: dict[str, float], seed: int=0) -> RequestMix:
+    rng = random.Random(seed)
+    samples = [sample for board in boards if (sample := await get_board_sample(board, rng))]
+    if not samples:
+        raise ValueError(f'No threads in {", ".join(boards)}')
+    return RequestMix(samples, {route: weight for route, weight in mix.items() if weight > 0}, seed)
+
+
+def in_process_sender(test_client) -> Send:
+    async def send(path: str) -> tuple[int, str | None]:
+        response = await test_client.get(path)
+        await response.get_data()
+        return response.status_code, response.headers.get('Server-Timing')
+    return send
+
+
+def http_sender(session, base_url: str) -> Send:
+    base_url = base_url.rstrip('/')
+
+    async def send(path: str) -> tuple[int, str | None]:
+        async with session.get(base_url + path, allow_redirects=False) as response:
+            await response.read()
+            return response.status, response.headers.get('Server-Timing')
+    return send
+
+
+def get_pool_conf() -> dict:
+    """The settings being sized, as this process sees them."""
+    from ..configs import db_conf
+
+    section = dict(mysql='mysql', sqlite='sqlite', postgres='postgresql')[db_conf['db_type'].name]
+    conf = db_conf.get(section, {})
+    return dict(db_type=db_conf['db_type'].name, **{key: conf[key] for key in ('minsize', 'maxsize', 'readers') if key in conf})
+
+
+async def run_load_test(
+    send: Send,
+    boards: list[str],
+    mix: dict[str, float]=DEFAULT_MIX,
+    concurrency: int=DEFAULT_CONCURRENCY,
+    duration: float | None=DEFAULT_DURATION,
+    n_requests: int | None=None,
+    warmup: int=DEFAULT_WARMUP,
+    seed: int=0,
+    url: str | None=None,
+) -> dict:
+    started = datetime.now(timezone.utc)
+    load_test = LoadTest(send, await get_request_mix(boards, mix, seed), concurrency)
+    await load_test.warmup(warmup)
+    await load_test.run(duration, n_requests)
+    return dict(
+        machine_info=get_machine_info(),
+        commit_info=get_commit_info(),
+        datetime=started.isoformat(),
+        target=url or 'in process',
+        pool=get_pool_conf(),
+        boards=boards,
+        mix=mix,
+        seed=seed,
+        results=load_test.get_results(),
+    )
@@ -0,0 +1,243 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from inspect import isawaitable
+from time import perf_counter
+
+"""
+Times the hot paths of page generation against whatever database config.toml points at,
+usually one made by `ayaseq bench db`.
+
+Each benchmark is warmed up, then called until it has run at least `min_rounds` times and for at least `min_time` seconds.
+Results are written as JSON in the same shape pytest-benchmark uses, so runs of different commits on one machine can be
+compared with `ayaseq bench compare`, or with pytest-benchmark's own tooling.
+"""
+
+DEFAULT_RESULTS_DIR = './data/bench'
+DEFAULT_MIN_ROUNDS = 5
+DEFAULT_MIN_TIME = 1.0
+DEFAULT_MAX_ROUNDS = 10_000
+DEFAULT_WARMUP_ROUNDS = 1
+DEFAULT_THRESHOLD = 0.10
+
+SEARCH_TERMS = ('kernel', 'garlic butter', 'based')
+
+
+@dataclass(slots=True)
+class Benchmark:
+    name: str
+    group: str
+    fn: Callable[[], Awaitable | object]
+    params: dict = field(default_factory=dict)
+
+
+async def time_benchmark(benchmark: Benchmark, min_rounds: int, min_time: float, warmup_rounds: int, max_rounds: int=DEFAULT_MAX_ROUNDS) -> list[float]:
+    for _ in range(warmup_rounds):
+        if isawaitable(result := benchmark.fn()):
+            await result
+
+    timings = []
+    start = perf_counter()
+    while len(timings) < min_rounds or (perf_counter() - start < min_time and len(timings) < max_rounds):
+        t0 = perf_counter()
+        if isawaitable(result := benchmark.fn()):
+            await result
+        timings.append(perf_counter() - t0)
+    return timings
+
+
+def get_stats(timings: list[float]) -> dict:
+    """The same fields pytest-benchmark writes, in seconds."""
+    q1, median, q3 = statistics.quantiles(timings, n=4, method='inclusive') if len(timings) > 1 else (timings[0],) * 3
+    mean = statistics.fmean(timings)
+    stddev = statistics.stdev(timings) if len(timings) > 1 else 0.0
+    return dict(
+        min=min(timings),
+        max=max(timings),
+        mean=mean,
+        stddev=stddev,
+        rounds=len(timings),
+        median=median,
+        iqr=q3 - q1,
+        q1=q1,
+        q3=q3,
+        total=sum(timings),
+        iterations=1,
+        ops=1 / mean if mean else 0.0,
+    )
+
+
+def git(*args: str) -> str:
+    try:
+        return subprocess.run(('git', *args), capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def get_commit_info() -> dict:
+    return dict(
+        id=git('rev-parse', 'HEAD'),
+        time=git('log', '-1', '--format=%cI'),
+        branch=git('rev-parse', '--abbrev-ref', 'HEAD'),
+        dirty=bool(git('status', '--porcelain', '--untracked-files=no')),
+    )
+
+
+def get_machine_info() -> dict:
+    return dict(
+        node=platform.node(),
+        processor=platform.processor(),
+        machine=platform.machine(),
+        python_implementation=platform.python_implementation(),
+        python_version=platform.python_version(),
+        release=platform.release(),
+        system=platform.system(),
+        cpu=dict(count=os.cpu_count()),
+    )
+
+
+async def get_board_benchmarks(board: str) -> list[Benchmark]:
+    # imported here, so generating a database does not need a config.toml
+    import orjson
+
+    from ..asagi_converter import generate_catalog, generate_index, generate_thread, search_posts
+    from ..configs import vanilla_search_conf
+    from ..db import db_q
+    from ..moderation import fc
+    from ..posts.comments import html_comment
+    from ..posts.template_optimizer import get_posts_t_thread
+    from ..search.loader import THREAD_BATCH, get_post_rows, process_post_rows
+
+    rows = await db_q.query_tuple(f'select thread_num, nreplies from `{board}_threads` order by nreplies desc')
+    if not rows:
+        return []
+    largest_thread, largest_nreplies = rows[0]
+    # the thread nine in ten threads are smaller than
+    typical_thread, typical_nreplies = rows[len(rows) // 10]
+
+    post_2_quotelinks, thread = await generate_thread(board, largest_thread)
+    posts = thread['posts']
+    comments = await db_q.query_tuple(f'select comment, thread_num from `{board}` where thread_num = {db_q.Phg()()} and comment is not null', params=[largest_thread])
+
+    def render_comments():
+        for comment, thread_num in comments:
+            html_comment(comment, thread_num, board)
+
+    def search(terms: str):
+        form_data = dict(boards=[board], comment=terms, hits_per_page=50, page=1, op_title=None, op_comment=None, order_by='desc')
+        return search_posts(form_data, vanilla_search_conf.get('max_hits', 1_000))
+
+    batch_thread_nums = [thread_num for thread_num, _ in rows[:THREAD_BATCH]]
+    post_rows = await get_post_rows(board, batch_thread_nums)
+
+    benchmarks = [
+        Benchmark(f'generate_thread[{board}-largest]', 'generate_thread', lambda: generate_thread(board, largest_thread), dict(board=board, thread_num=largest_thread, posts=largest_nreplies + 1)),
+        Benchmark(f'generate_thread[{board}-p90]', 'generate_thread', lambda: generate_thread(board, typical_thread), dict(board=board, thread_num=typical_thread, posts=typical_nreplies + 1)),
+        Benchmark(f'generate_index[{board}-1]', 'generate_index', lambda: generate_index(board, 1), dict(board=board, page_num=1)),
+        Benchmark(f'generate_catalog[{board}]', 'generate_catalog', lambda: generate_catalog(board), dict(board=board)),
+        Benchmark(f'html_comment[{board}-largest]', 'html_comment', render_comments, dict(board=board, comments=len(comments))),
+        Benchmark(f'get_posts_t_thread[{board}-largest]', 'get_posts_t_thread', lambda: get_posts_t_thread(posts, post_2_quotelinks), dict(board=board, posts=len(posts))),
+        Benchmark(f'filter_reported_posts[{board}-largest]', 'filter_reported_posts', lambda: fc.filter_reported_posts(posts), dict(board=board, posts=len(posts), filter_cache=type(fc).__name__)),
+        Benchmark(f'process_post_rows[{board}-{len(batch_thread_nums)}]', 'process_post_rows', lambda: process_post_rows(board, post_rows, lambda p: p, orjson.dumps), dict(board=board, threads=len(batch_thread_nums), rows=len(post_rows))),
+    ]
+    for terms in SEARCH_TERMS:
+        benchmarks.append(Benchmark(f'search_posts[{board}-{terms}]', 'search_posts', lambda terms=terms: search(terms), dict(board=board, comment=terms)))
+    return benchmarks
+
+
+async def get_database_info(boards: list[str]) -> dict:
+    from ..db import db_q
+
+    info = dict(type=db_q.db_type.name, boards={})
+    for board in boards:
+        posts = (await db_q.query_tuple(f'select count(*) from `{board}`'))[0][0]
+        threads = (await db_q.query_tuple(f'select count(*) from `{board}_threads`'))[0][0]
+        info['boards'][board] = dict(posts=posts, threads=threads)
+    return info
+
+
+async def run_suite(
+    boards: list[str],
+    keyword: str | None=None,
+    min_rounds: int=DEFAULT_MIN_ROUNDS,
+    min_time: float=DEFAULT_MIN_TIME,
+    warmup_rounds: int=DEFAULT_WARMUP_ROUNDS,
+    on_result: Callable[[dict], None] | None=None,
+) -> dict:
+    """Runs every benchmark whose name contains `keyword`, and returns the results document."""
+    started = datetime.now(timezone.utc)
+
+    results = []
+    for board in boards:
+        for benchmark in await get_board_benchmarks(board):
+            if keyword and keyword not in benchmark.name:
+                continue
+            timings = await time_benchmark(benchmark, min_rounds, min_time, warmup_rounds)
+            result = dict(
+                group=benchmark.group,
+                name=benchmark.name,
+                fullname=f'ayase_quart.bench::{benchmark.name}',
+                params=benchmark.params,
+                stats=get_stats(timings),
+            )
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+    return dict(
+        machine_info=get_machine_info(),
+        commit_info=get_commit_info(),
+        database=await get_database_info(boards),
+        benchmarks=results,
+        datetime=started.isoformat(),
+        version='1',
+    )
+
+
+def get_results_path(results: dict, results_dir: str=DEFAULT_RESULTS_DIR, prefix: str='') -> str:
+    commit = results['commit_info']['id'][:10] or 'nocommit'
+    dirty = '_dirty' if results['commit_info']['dirty'] else ''
+    stamp = datetime.fromisoformat(results['datetime']).strftime('%Y%m%d_%H%M%S')
+    return os.path.join(results_dir, f'{prefix}{stamp}_{commit}{dirty}.json')
+
+
+def save_results(results: dict, path: str) -> None:
+    if dir_name := os.path.dirname(path):
+        os.makedirs(dir_name, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+@dataclass(slots=True)
+class Comparison:
+    name: str
+    base: float | None # median seconds
+    new: float | None
+
+    @property
+    def change(self) -> float | None:
+        if not self.base or self.new is None:
+            return None
+        return self.new / self.base - 1
+
+
+def compare_results(base: dict, new: dict) -> list[Comparison]:
+    """Medians of the benchmarks in either run. Medians, since a stray slow round moves the mean a lot more."""
+    base_medians = {b['name']: b['stats']['median'] for b in base['benchmarks']}
+    new_medians = {b['name']: b['stats']['median'] for b in new['benchmarks']}
+    names = list(base_medians) + [name for name in new_medians if name not in base_medians]
+    return [Comparison(name, base_medians.get(name), new_medians.get(name)) for name in names]
+
+
+def get_regressions(comparisons: list[Comparison], threshold: float=DEFAULT_THRESHOLD) -> list[Comparison]:
+    return [c for c in comparisons if c.change is not None and c.change > threshold]
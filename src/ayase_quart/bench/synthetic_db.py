@@ -0,0 +1,401 @@
+import base64
+import os
+import random
+import sqlite3
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
+
+"""
+Builds an Asagi schema SQLite database of made up posts, for benchmarking on a known, repeatable data set.
+
+The same seed always gives the same database. Per board, it writes `<board>`, `<board>_threads`, `<board>_deleted`
+and `<board>_images`, with the indexes Asagi creates.
+
+Posts try to look like a real board to the code reading them:
+- nums interleave across threads in time order, and most threads are short while a few hit `max_replies`
+- quotelinks to the same thread, other threads and other boards, greentext, links, [spoiler], [code] and [banned]
+- comments with characters that need escaping, image-only posts, long posts
+- media on every OP and some replies, with reposted files sharing an `<board>_images` row
+- sage, trips, capcodes, deleted posts, archived, sticky and locked threads
+
+This module only uses the standard library, so it can be run without a config.toml.
+"""
+
+SCALES = {
+    'tiny': 50,
+    'small': 500,
+    'medium': 5_000,
+    'large': 25_000,
+}
+
+DEFAULT_BOARDS = ('g', 'ck')
+DEFAULT_MAX_REPLIES = 3_000
+BUMP_LIMIT = 300
+ARCHIVE_AFTER = 150 # threads newer than this many are still live, the rest have expired
+START_TIMESTAMP = 1_600_000_000
+FIRST_NUM = 80_000_000
+INSERT_BATCH = 10_000
+
+WORDS = (
+    'the', 'a', 'is', 'it', 'this', 'that', 'thread', 'anon', 'post', 'just', 'why', 'how', 'what', 'not', 'really', 'because',
+    'install', 'kernel', 'compile', 'rust', 'python', 'linux', 'windows', 'laptop', 'keyboard', 'monitor', 'cpu', 'gpu', 'ram',
+    'recipe', 'garlic', 'butter', 'pan', 'oven', 'bread', 'rice', 'knife', 'salt', 'pepper', 'cheese', 'sauce', 'eggs',
+    'based', 'cope', 'kek', 'lol', 'lmao', 'bump', 'sauce?', 'literally', 'unironically', 'desu', 'fren', 'wew',
+    'don\'t', 'it\'s', 'you\'re', '"quote"', '&', '<3', '<b>not bold</b>', 'a<b', 'x > y', '5 < 6', '%', '#', ';',
+    'café', 'naïve', 'ß', 'Ω', '日本語', 'ｗｗｗ', '草', '🙂',
+)
+NAMES = ('Anonymous', 'Anonymous', 'Anonymous', 'Anonymous', 'Anonymous', 'Anonymous', 'Anonymous', 'Anonymous', 'Anonymous', 'anon', 'moot', 'dev')
+URLS = (
+    'https://example.com/',
+    'https://example.com/a/long/path?with=query&and=more#fragment',
+    'http://example.org/file.pdf',
+    'https://en.wikipedia.org/wiki/Imageboard',
+    'www.example.net',
+)
+CODE_LINES = (
+    'def f(x):',
+    '    return x * 2',
+    'for (int i = 0; i < n; i++) {',
+    '    if (a[i] > b && b != 0) continue;',
+    '}',
+    'SELECT * FROM t WHERE a < 3;',
+    '<script>alert(1)</script>',
+)
+MEDIA_EXTS = ('jpg', 'jpg', 'jpg', 'png', 'png', 'gif', 'webm')
+
+BOARD_COLUMNS = (
+    'media_id', 'poster_ip', 'num', 'subnum', 'thread_num', 'op', 'timestamp', 'timestamp_expired', 'preview_orig', 'preview_w',
+    'preview_h', 'media_filename', 'media_w', 'media_h', 'media_size', 'media_hash', 'media_orig', 'spoiler', 'deleted', 'capcode',
+    'email', 'name', 'trip', 'title', 'comment', 'delpass', 'sticky', 'locked', 'poster_hash', 'poster_country', 'exif',
+)
+
+
+def get_schema(board: str) -> str:
+    columns = """
+        `media_id` integer not null default 0,
+        `poster_ip` text not null default '0',
+        `num` integer not null,
+        `subnum` integer not null default 0,
+        `thread_num` integer not null default 0,
+        `op` integer not null default 0,
+        `timestamp` integer not null,
+        `timestamp_expired` integer not null default 0,
+        `preview_orig` text,
+        `preview_w` integer not null default 0,
+        `preview_h` integer not null default 0,
+        `media_filename` text,
+        `media_w` integer not null default 0,
+        `media_h` integer not null default 0,
+        `media_size` integer not null default 0,
+        `media_hash` text,
+        `media_orig` text,
+        `spoiler` integer not null default 0,
+        `deleted` integer not null default 0,
+        `capcode` text not null default 'N',
+        `email` text,
+        `name` text,
+        `trip` text,
+        `title` text,
+        `comment` text,
+        `delpass` text,
+        `sticky` integer not null default 0,
+        `locked` integer not null default 0,
+        `poster_hash` text,
+        `poster_country` text,
+        `exif` text
+    """
+    return f"""
+        create table `{board}` (
+            `doc_id` integer primary key autoincrement,
+            {columns}
+        );
+        create unique index `{board}_num_subnum_index` on `{board}` (`num`, `subnum`);
+        create index `{board}_thread_num_subnum_index` on `{board}` (`thread_num`, `num`, `subnum`);
+        create index `{board}_subnum_index` on `{board}` (`subnum`);
+        create index `{board}_op_index` on `{board}` (`op`);
+        create index `{board}_media_id_index` on `{board}` (`media_id`);
+        create index `{board}_media_hash_index` on `{board}` (`media_hash`);
+        create index `{board}_media_orig_index` on `{board}` (`media_orig`);
+        create index `{board}_name_trip_index` on `{board}` (`name`, `trip`);
+        create index `{board}_trip_index` on `{board}` (`trip`);
+        create index `{board}_email_index` on `{board}` (`email`);
+        create index `{board}_poster_ip_index` on `{board}` (`poster_ip`);
+        create index `{board}_timestamp_index` on `{board}` (`timestamp`);
+
+        create table `{board}_deleted` (
+            `doc_id` integer primary key,
+            {columns}
+        );
+        create unique index `{board}_deleted_num_subnum_index` on `{board}_deleted` (`num`, `subnum`);
+        create index `{board}_deleted_thread_num_subnum_index` on `{board}_deleted` (`thread_num`, `num`, `subnum`);
+
+        create table `{board}_threads` (
+            `thread_num` integer primary key,
+            `time_op` integer not null,
+            `time_last` integer not null,
+            `time_bump` integer not null,
+            `time_ghost` integer,
+            `time_ghost_bump` integer,
+            `time_last_modified` integer not null,
+            `nreplies` integer not null default 0,
+            `nimages` integer not null default 0,
+            `sticky` integer not null default 0,
+            `locked` integer not null default 0
+        );
+        create index `{board}_threads_time_op_index` on `{board}_threads` (`time_op`);
+        create index `{board}_threads_time_bump_index` on `{board}_threads` (`time_bump`);
+        create index `{board}_threads_time_ghost_bump_index` on `{board}_threads` (`time_ghost_bump`);
+        create index `{board}_threads_time_last_modified_index` on `{board}_threads` (`time_last_modified`);
+        create index `{board}_threads_sticky_index` on `{board}_threads` (`sticky`);
+        create index `{board}_threads_locked_index` on `{board}_threads` (`locked`);
+
+        create table `{board}_images` (
+            `media_id` integer primary key autoincrement,
+            `media_hash` text not null,
+            `media` text,
+            `preview_op` text,
+            `preview_reply` text,
+            `total` integer not null default 0,
+            `banned` integer not null default 0
+        );
+        create unique index `{board}_images_media_hash_index` on `{board}_images` (`media_hash`);
+        create index `{board}_images_total_index` on `{board}_images` (`total`);
+        create index `{board}_images_banned_index` on `{board}_images` (`banned`);
+    """
+
+
+@dataclass(slots=True)
+class ThreadStats:
+    num: int
+    time_op: int
+    time_last: int = 0
+    time_bump: int = 0
+    nreplies: int = 0
+    nimages: int = 0
+    sticky: int = 0
+    locked: int = 0
+    nums: list[int] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class BoardStats:
+    board: str
+    posts: int = 0
+    threads: int = 0
+    deleted: int = 0
+    images: int = 0
+    largest_thread: int = 0
+    largest_thread_posts: int = 0
+
+
+def get_n_replies(rng: random.Random, max_replies: int) -> int:
+    """Most threads die young, a few run to the reply limit."""
+    r = rng.random()
+    if r < 0.55:
+        low, high = 0, 10
+    elif r < 0.90:
+        low, high = 11, 150
+    elif r < 0.99:
+        low, high = 151, 500
+    else:
+        low, high = 501, max_replies
+    return rng.randint(min(low, max_replies), min(high, max_replies))
+
+
+def get_post_times(rng: random.Random, n_threads: int, max_replies: int) -> tuple[list[tuple[int, int]], list[int]]:
+    """(timestamp, thread index) of every post, in posting order, and the timestamp of each thread's OP.
+    The first post of each thread is its OP.
+    """
+    post_times = []
+    op_times = []
+    time_op = START_TIMESTAMP
+    for i in range(n_threads):
+        time_op += int(rng.expovariate(1 / 300)) + 1
+        op_times.append(time_op)
+        # the first thread always has the most replies, so every database has a thread at the limit
+        n_replies = max_replies if i == 0 else get_n_replies(rng, max_replies)
+        post_times.append((time_op, i))
+        timestamp = time_op
+        gap = rng.choice((20, 60, 300))
+        for _ in range(n_replies):
+            timestamp += int(rng.expovariate(1 / gap)) + 1
+            post_times.append((timestamp, i))
+    # stable, so an OP stays before its replies on equal timestamps
+    post_times.sort(key=lambda post_time: post_time[0])
+    return post_times, op_times
+
+
+def get_sentence(rng: random.Random) -> str:
+    return ' '.join(rng.choices(WORDS, k=rng.randint(2, 18)))
+
+
+def get_comment(rng: random.Random, thread: ThreadStats, recent_nums: list[int], other_boards: Sequence[str]) -> str | None:
+    if thread.nums and rng.random() < 0.04:
+        return None # image only
+
+    lines = []
+    if thread.nums and rng.random() < 0.45:
+        # replies mostly quote the last few posts
+        for _ in range(rng.choice((1, 1, 1, 2, 3))):
+            lines.append(f'>>{rng.choice(thread.nums[-40:])}')
+    if recent_nums and rng.random() < 0.03:
+        lines.append(f'>>{rng.choice(recent_nums)}')
+    if other_boards and rng.random() < 0.01:
+        lines.append(f'>>>/{rng.choice(other_boards)}/{rng.randint(FIRST_NUM, FIRST_NUM + 1_000_000)}')
+
+    n_lines = rng.randint(20, 40) if rng.random() < 0.02 else rng.choice((1, 1, 1, 2, 2, 3, 4, 6))
+    for _ in range(n_lines):
+        r = rng.random()
+        if r < 0.20:
+            lines.append(f'>{get_sentence(rng)}')
+        elif r < 0.25:
+            lines.append(rng.choice(URLS))
+        elif r < 0.28:
+            lines.append('')
+        else:
+            lines.append(get_sentence(rng))
+
+    if rng.random() < 0.05:
+        i = rng.randrange(len(lines))
+        lines[i] = f'[spoiler]{lines[i]}[/spoiler]'
+    if rng.random() < 0.02:
+        lines.append('[code]' + '\n'.join(rng.choices(CODE_LINES, k=rng.randint(2, 8))) + '[/code]')
+    if rng.random() < 0.002:
+        lines.append('[banned](USER WAS BANNED FOR THIS POST)[/banned]')
+    return '\n'.join(lines)
+
+
+def get_media_hash(rng: random.Random) -> str:
+    return base64.b64encode(rng.randbytes(16)).decode()
+
+
+def iter_board_rows(rng: random.Random, stats: BoardStats, threads: list[ThreadStats], post_times: list[tuple[int, int]], other_boards: Sequence[str], images: dict) -> Iterator[tuple]:
+    recent_nums = []
+    used_hashes = []
+    last_live_op = len(threads) - ARCHIVE_AFTER
+    num = FIRST_NUM
+
+    for timestamp, i in post_times:
+        thread = threads[i]
+        is_op = not thread.nums
+        if is_op:
+            # nums are handed out in time order, so only now does the thread get its num
+            thread.num = num
+
+        comment = get_comment(rng, thread, recent_nums, other_boards)
+        title = get_sentence(rng)[:100] if rng.random() < (0.6 if is_op else 0.01) else None
+        email = 'sage' if not is_op and rng.random() < 0.03 else None
+
+        media = ()
+        media_id = 0
+        if is_op or rng.random() < 0.25:
+            if used_hashes and rng.random() < 0.05:
+                media_hash = rng.choice(used_hashes) # repost
+            else:
+                media_hash = get_media_hash(rng)
+                used_hashes.append(media_hash)
+            tim = timestamp * 1000 + rng.randrange(1000)
+            ext = rng.choice(MEDIA_EXTS)
+            media_orig = f'{tim}.{ext}'
+            preview_orig = f'{tim}s.jpg'
+            if (image := images.get(media_hash)) is None:
+                image = images[media_hash] = [len(images) + 1, media_hash, media_orig, None, None, 0, 0]
+            image[3 if is_op else 4] = image[3 if is_op else 4] or preview_orig
+            image[5] += 1
+            media_id = image[0]
+            media_w, media_h = rng.choice(((1920, 1080), (1280, 720), (800, 600), (640, 640), (3000, 4000)))
+            ratio = min(250 if is_op else 125, media_w, media_h) / max(media_w, media_h)
+            media = (
+                preview_orig, int(media_w * ratio), int(media_h * ratio),
+                f'{rng.choice(("IMG_", "Screenshot_", "", "image"))}{rng.randrange(10_000)}.{ext}',
+                media_w, media_h, rng.randint(10_000, 4_000_000), media_hash, media_orig,
+            )
+            thread.nimages += 1
+
+        deleted = int(not is_op and rng.random() < 0.01)
+        capcode = 'N'
+        if (r := rng.random()) < 0.001:
+            capcode = 'M'
+        elif r < 0.0015:
+            capcode = 'A'
+        trip = f'!{base64.b64encode(rng.randbytes(8)).decode()[:10]}' if rng.random() < 0.02 else None
+
+        yield (
+            media_id, '0', num, 0, thread.num, int(is_op), timestamp,
+            timestamp + 86_400 if is_op and i < last_live_op else 0,
+            *(media or (None, 0, 0, None, 0, 0, 0, None, None)),
+            int(bool(media) and rng.random() < 0.02), deleted, capcode,
+            email, rng.choice(NAMES), trip, title, comment, None,
+            int(is_op and thread.sticky), int(is_op and thread.locked), None, None, None,
+        )
+
+        if not is_op:
+            thread.nreplies += 1
+            if email != 'sage' and thread.nreplies <= BUMP_LIMIT:
+                thread.time_bump = timestamp
+        thread.time_last = timestamp
+        thread.nums.append(num)
+
+        recent_nums.append(num)
+        if len(recent_nums) > 1_000:
+            del recent_nums[:500]
+
+        stats.posts += 1
+        stats.deleted += deleted
+        num += 1 if rng.random() < 0.9 else rng.randint(2, 5) # posts on other boards share the counter
+    stats.images = len(images)
+
+
+def create_board(db: sqlite3.Connection, rng: random.Random, board: str, n_threads: int, max_replies: int, other_boards: Sequence[str]) -> BoardStats:
+    db.executescript(get_schema(board))
+
+    stats = BoardStats(board, threads=n_threads)
+    post_times, op_times = get_post_times(rng, n_threads, max_replies)
+    threads = [ThreadStats(0, time_op, time_bump=time_op) for time_op in op_times]
+    if n_threads > 2:
+        threads[1].sticky = 1
+        threads[2].locked = 1
+
+    images = {}
+    insert_sql = f'insert into `{board}` ({", ".join(BOARD_COLUMNS)}) values ({", ".join("?" * len(BOARD_COLUMNS))})'
+    rows = iter_board_rows(rng, stats, threads, post_times, other_boards, images)
+    while batch := [row for _, row in zip(range(INSERT_BATCH), rows)]:
+        db.executemany(insert_sql, batch)
+
+    db.execute(f'insert into `{board}_deleted` select * from `{board}` where deleted = 1')
+    db.executemany(
+        f'insert into `{board}_threads` values (?, ?, ?, ?, null, null, ?, ?, ?, ?, ?)',
+        [(t.num, t.time_op, t.time_last, t.time_bump, t.time_last, t.nreplies, t.nimages, t.sticky, t.locked) for t in threads],
+    )
+    db.executemany(f'insert into `{board}_images` values (?, ?, ?, ?, ?, ?, ?)', images.values())
+
+    largest = max(threads, key=lambda t: t.nreplies)
+    stats.largest_thread = largest.num
+    stats.largest_thread_posts = largest.nreplies + 1
+    return stats
+
+
+def create_synthetic_db(path: str, boards: Sequence[str]=DEFAULT_BOARDS, n_threads: int=SCALES['small'], max_replies: int=DEFAULT_MAX_REPLIES, seed: int=0, overwrite: bool=False) -> list[BoardStats]:
+    """Writes a new database at `path`, with `n_threads` threads per board."""
+    if os.path.exists(path):
+        if not overwrite:
+            raise FileExistsError(path)
+        os.remove(path)
+    if dir_name := os.path.dirname(path):
+        os.makedirs(dir_name, exist_ok=True)
+
+    rng = random.Random(seed)
+    db = sqlite3.connect(path)
+    try:
+        db.execute('pragma journal_mode = wal')
+        db.execute('pragma synchronous = off')
+        all_stats = []
+        for board in boards:
+            other_boards = [b for b in boards if b != board]
+            all_stats.append(create_board(db, rng, board, n_threads, max_replies, other_boards))
+            db.commit()
+        db.execute('analyze')
+        db.commit()
+    finally:
+        db.close()
+    return all_stats
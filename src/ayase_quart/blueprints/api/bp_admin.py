@@ -8,9 +8,13 @@ from quart_schema import validate_request
 from ...asagi_converter import get_latest_ops_as_catalog
 from ...boards import board_shortnames
 from ...configs import mod_conf
+from ...db import db_q
+from ...db.query_timings import query_timings
+from ...metrics import METRICS_ENABLED, metrics
 from ...moderation.auth_api import (
     login_api_usr_required,
     require_api_usr_is_active,
+    require_api_usr_is_admin,
     require_api_usr_permissions
 )
 from ...moderation.user import (
@@ -52,6 +56,46 @@ async def configs(current_api_usr_id: int):
     return jsonify([{'key': c, 'value': mod_conf[c]} for c in cs]), 200
 
 
+@bp.get("/query_timings")
+@login_api_usr_required
+@require_api_usr_is_active
+@require_api_usr_permissions([Permissions.archive_stats_view])
+async def get_query_timings(current_api_usr_id: int):
+    """Timings of this worker process only."""
+    return jsonify(query_timings.get_stats()), 200
+
+
+@bp.get("/metrics")
+@login_api_usr_required
+@require_api_usr_is_active
+@require_api_usr_is_admin
+async def get_metrics(current_api_usr_id: int):
+    """Prometheus text format, summed over every worker process."""
+    if not METRICS_ENABLED:
+        return {'error': 'Metrics are disabled'}, 404
+    return await metrics.respond()
+
+
+@bp.get("/slow_queries")
+@login_api_usr_required
+@require_api_usr_is_active
+@require_api_usr_is_admin
+async def get_slow_queries(current_api_usr_id: int):
+    """Slow statements with their plans, and the latest slow runs, merged over every worker process."""
+    if not db_q.slow_query_log:
+        return {'error': 'The slow query log is disabled'}, 404
+    return jsonify(await db_q.slow_query_log.collect()), 200
+
+
+@bp.get("/db_replicas")
+@login_api_usr_required
+@require_api_usr_is_active
+@require_api_usr_permissions([Permissions.archive_stats_view])
+async def get_db_replicas(current_api_usr_id: int):
+    """Replica health as seen by this worker process."""
+    return jsonify(db_q.replicas.get_status()), 200
+
+
 @bp.get('/users')
 @login_api_usr_required
 @require_api_usr_is_active
@@ -1,10 +1,23 @@
 from quart import Blueprint
 from urllib.parse import unquote
 
-from ...asagi_converter import generate_catalog, generate_index, generate_thread
+from ...asagi_converter import INDEX_PAGE_THREADS, generate_catalog, generate_index, generate_thread
 from ...configs import app_conf
 from ...moderation import fc
 from ...moderation.auth_api import api_usr_authenticated
+from ...render.catalog_snapshot import catalog_snapshots
+from ...render.http_cache import (
+    CATALOG_TTL,
+    HTTP_CACHE_ENABLED,
+    INDEX_TTL,
+    THREAD_TTL,
+    get_catalog_version_generation,
+    get_page_last_modified,
+    get_page_version_generation,
+    get_thread_last_modified,
+    get_thread_version_generation,
+    json_validators
+)
 from ...utils.validation import validate_board_query_parameter
 
 bp = Blueprint("bp_api_app", __name__, url_prefix='/api/v1')
@@ -15,26 +28,46 @@ if app_conf['api']:
     @api_usr_authenticated
     @validate_board_query_parameter
     async def catalog(board: str, authenticated: bool):
-        catalog = await generate_catalog(board)
-        catalog = [page | {'threads': (await fc.filter_reported_posts(page['threads'], is_authority=authenticated))} for page in catalog]
-        return catalog
+        snapshot = catalog_snapshots.get(board)
+
+        version = await get_catalog_version_generation(board, 1, None, snapshot)
+        validators = json_validators(version, get_page_last_modified(version), CATALOG_TTL, authenticated)
+        if validators.is_fresh():
+            return validators.not_modified()
+
+        if snapshot:
+            catalog = snapshot.catalog
+        else:
+            catalog, _ = await generate_catalog(board)
+        catalog = [page | {'threads': threads} for page, threads in zip(catalog, await fc.filter_reported_pages([page['threads'] for page in catalog], is_authority=authenticated))]
+        return await validators.respond(catalog)
 
 
     @bp.get("/<string:board>/thread/<int:thread_id>.json")
     @api_usr_authenticated
     @validate_board_query_parameter
     async def thread(board: str, thread_id: int, authenticated: bool):
+        version = await get_thread_version_generation(board, thread_id) if HTTP_CACHE_ENABLED else None
+        validators = json_validators(version, get_thread_last_modified(version), THREAD_TTL, authenticated)
+        if validators.is_fresh():
+            return validators.not_modified()
+
         post_2_quotelinks, thread_dict = await generate_thread(board, thread_id)
 
         thread_dict['posts'] = await fc.filter_reported_posts(thread_dict['posts'], is_authority=authenticated)
 
-        return thread_dict
+        return await validators.respond(thread_dict)
 
 
     @bp.get("/<string:board>/<int:page_num>.json")
     @api_usr_authenticated
     @validate_board_query_parameter
     async def board_index(board: str, page_num: int, authenticated: bool):
-        index = await generate_index(board, page_num=page_num)
-        index['threads'] = await fc.filter_reported_posts(index['threads'], is_authority=authenticated)
-        return index
+        version = await get_page_version_generation(board, INDEX_PAGE_THREADS, page_num)
+        validators = json_validators(version, get_page_last_modified(version), INDEX_TTL, authenticated)
+        if validators.is_fresh():
+            return validators.not_modified()
+
+        index, _ = await generate_index(board, page_num=page_num)
+        index['threads'] = [{'posts': posts} for posts in await fc.filter_reported_pages([thread['posts'] for thread in index['threads']], is_authority=authenticated)]
+        return await validators.respond(index)
@@ -1,13 +1,16 @@
-from quart import Blueprint, flash, redirect, request, url_for
+from quart import Blueprint, abort, flash, redirect, request, url_for
 from html import escape
 
 from ...asagi_converter import get_latest_ops_as_catalog
 from ...boards import board_shortnames
+from ...db import db_q
 from ...forms import UserCreateForm, UserEditForm, CSRFForm
+from ...metrics import METRICS_ENABLED, metrics
 from ...moderation.auth_web import (
     load_web_usr_data,
     login_web_usr_required,
     require_web_usr_is_active,
+    require_web_usr_is_admin,
     require_web_usr_permissions,
     web_usr_is_admin
 )
@@ -24,6 +27,7 @@ from ...posts.template_optimizer import render_catalog_card, wrap_post_t
 from ...render import render_controller
 from ...templates import (
     template_catalog,
+    template_slow_queries,
     template_users_create,
     template_users_delete,
     template_users_edit,
@@ -31,6 +35,7 @@ from ...templates import (
     template_users_view
 )
 from ...security import get_csrf_input
+from ...utils.timestamps import ts_2_formatted
 
 
 bp = Blueprint('bp_web_admin', __name__)
@@ -59,6 +64,56 @@ async def latest(is_admin: bool):
     )
 
 
+@bp.get('/metrics')
+@login_web_usr_required
+@load_web_usr_data
+@require_web_usr_is_active
+@require_web_usr_is_admin
+async def v_metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    return await metrics.respond()
+
+
+@bp.get('/slow_queries')
+@login_web_usr_required
+@load_web_usr_data
+@require_web_usr_is_active
+@require_web_usr_is_admin
+@web_usr_is_admin
+async def v_slow_queries(is_admin: bool):
+    if not db_q.slow_query_log:
+        abort(404)
+    log = await db_q.slow_query_log.collect()
+
+    queries = []
+    for q in log['queries']:
+        queries.append({
+            'Max ms': f'{q["max"] * 1000:.1f}',
+            'Avg ms': f'{q["total"] / q["count"] * 1000:.1f}',
+            'Count': q['count'],
+            'Last Seen': ts_2_formatted(int(q['last_seen'])),
+            'Statement': f'<pre>{escape(q["statement"])}</pre>',
+            'Param Shapes': list_to_html_ul(q['shapes'], klass='disc'),
+            'Plan': f'<pre>{escape(q["plan"] or q["plan_error"])}</pre>',
+        })
+    recent = [
+        {'Time': ts_2_formatted(int(t)), 'ms': f'{elapsed * 1000:.1f}', 'Params': shape, 'Statement': statement}
+        for t, statement, elapsed, shape in log['recent']
+    ]
+
+    # fields rendered in table() macro which escapes all columns by default
+    return await render_controller(
+        template_slow_queries,
+        queries=queries,
+        recent=recent,
+        threshold_ms=db_q.slow_query_log.threshold * 1000,
+        is_admin=is_admin,
+        title='Slow Queries',
+        tab_title='Slow Queries',
+    )
+
+
 def list_to_html_ul(items: list[str], klass=None) -> str:
     if not items:
         return ''
@@ -1,15 +1,28 @@
-from quart import Blueprint, Response, abort, current_app, jsonify
+from quart import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context
+)
 
 from ...asagi_converter import (
     generate_catalog,
     generate_index,
     generate_post,
-    generate_thread,
+    generate_thread_stream,
     get_counts_from_posts,
-    get_op_thread_count
+    get_op_thread_count,
+    get_thread_details,
+    get_thread_quotelinks,
+    get_thread_rows,
+    thread_rows_2_posts,
+    INDEX_PAGE_THREADS
 )
 from ...boards import get_title
-from ...configs import app_conf
+from ...configs import app_conf, render_cache_conf
 from ...moderation import fc
 from ...moderation.auth_web import (
      load_web_usr_data,
@@ -24,7 +37,25 @@ from ...posts.template_optimizer import (
      render_wrapped_post_t,
      wrap_post_t
  )
-from ...render import render_controller
+from ...render import render_controller, thread_cache
+from ...render.catalog_snapshot import CatalogSnapshot, catalog_snapshots
+from ...render.http_cache import (
+    CATALOG_TTL,
+    HTTP_CACHE_ENABLED,
+    INDEX_TTL,
+    POST_TTL,
+    THREAD_TTL,
+    get_catalog_version_generation,
+    get_page_last_modified,
+    get_page_version_generation,
+    get_post_last_modified,
+    get_post_version_generation,
+    get_thread_last_modified,
+    get_thread_version_generation,
+    json_validators,
+    web_validators
+)
+from ...render.thread_offload import thread_offload_min_posts, thread_render_pool
 from ...templates import (
      template_board_index,
      template_catalog,
@@ -33,6 +64,7 @@ from ...templates import (
  )
 from ...threads import render_thread_stats
 from ...perf import Perf
+from ...utils.cursors import decode_cursor, encode_cursor
 from ...utils.validation import validate_board_query_parameter
 from ...moderation.report import generate_report_form
 from ...security import inject_csrf_token_to_session, get_csrf_input
@@ -41,13 +73,23 @@ from ...security import inject_csrf_token_to_session, get_csrf_input
 bp = Blueprint("bp_web_app", __name__)
 
 
+def get_next_page_href(href: str, page_num: int, next_cursor: tuple | None) -> str | None:
+    """The next page link carries the cursor, so following it never counts from the first thread.
+    Page 0 is an alias of page 1, so its next link is left alone.
+    """
+    if not next_cursor or page_num < 1:
+        return None
+    return href.format(page_num + 1) + f'?cursor={encode_cursor(*next_cursor)}'
+
+
 async def make_pagination_board_index(board: str, index: dict, page_num: int) -> Pagination:
-    op_thread_count = await get_op_thread_count(board)
+    op_thread_count = await get_op_thread_count(board, fc.get_generation)
     # op_thread_removed_count = await fc.get_op_thread_removed_count(board)
     # op_thread_count -= op_thread_removed_count
 
     board_index_thread_count = len(index['threads'])
 
+    href = f'/{board}/page/' + '{0}'
     # https://flask-paginate.readthedocs.io/en/master/
     return Pagination(
         page=page_num,
@@ -55,7 +97,8 @@ async def make_pagination_board_index(board: str, index: dict, page_num: int) ->
         total=op_thread_count,
         search=False,
         record_name='threads',
-        href=f'/{board}/page/' + '{0}',
+        href=href,
+        next_href=get_next_page_href(href, page_num, index['next_cursor']),
         show_single_page=True,
     )
 
@@ -95,10 +138,16 @@ async def favicon():
 async def v_board_index(board: str, is_admin: bool, logged_in: bool):
     p = Perf('index')
 
+    version = await get_page_version_generation(board, INDEX_PAGE_THREADS, 1)
+    validators = web_validators(version, get_page_last_modified(version), INDEX_TTL, logged_in, is_admin, has_csrf=True)
+    if validators.is_fresh():
+        return validators.not_modified()
+    p.check('validators')
+
     index, quotelinks = await generate_index(board)
     p.check('query')
 
-    index['threads'] = [{'posts': await fc.filter_reported_posts(posts['posts'], is_authority=logged_in)} for posts in index['threads']]
+    index['threads'] = [{'posts': posts} for posts in await fc.filter_reported_pages([thread['posts'] for thread in index['threads']], is_authority=logged_in)]
     p.check('filter_reported')
 
     p.check('validate')
@@ -127,7 +176,7 @@ async def v_board_index(board: str, is_admin: bool, logged_in: bool):
     p.check('render')
     p.emit()
 
-    return rendered
+    return await validators.respond(rendered)
 
 
 @bp.get("/<string:board>/page/<int:page_num>")
@@ -138,11 +187,18 @@ async def v_board_index(board: str, is_admin: bool, logged_in: bool):
 @validate_board_query_parameter
 async def v_board_index_page(board: str, page_num: int, is_admin: bool, logged_in: bool):
     p = Perf('index page')
+    cursor = decode_cursor(request.args.get('cursor'))
+
+    version = await get_page_version_generation(board, INDEX_PAGE_THREADS, page_num, cursor)
+    validators = web_validators(version, get_page_last_modified(version), INDEX_TTL, logged_in, is_admin, has_csrf=True)
+    if validators.is_fresh():
+        return validators.not_modified()
+    p.check('validators')
 
-    index, quotelinks = await generate_index(board, page_num)
+    index, quotelinks = await generate_index(board, page_num, cursor=cursor)
     p.check('generate index')
 
-    index['threads'] = [{'posts': await fc.filter_reported_posts(posts['posts'], is_authority=logged_in)} for posts in index['threads']]
+    index['threads'] = [{'posts': posts} for posts in await fc.filter_reported_pages([thread['posts'] for thread in index['threads']], is_authority=logged_in)]
     p.check('filter_reported')
 
     p.check('validate thread')
@@ -172,11 +228,11 @@ async def v_board_index_page(board: str, page_num: int, is_admin: bool, logged_i
     p.check('rendered')
     p.emit()
 
-    return rendered
+    return await validators.respond(rendered)
 
 
-async def make_pagination_catalog(board: str, catalog: list[dict], page_num: int) -> Pagination:
-    op_thread_count = await get_op_thread_count(board)
+async def make_pagination_catalog(board: str, catalog: list[dict], page_num: int, next_cursor: tuple | None=None) -> Pagination:
+    op_thread_count = await get_op_thread_count(board, fc.get_generation)
     # op_thread_removed_count = await fc.get_op_thread_removed_count(board)
     # op_thread_count -= op_thread_removed_count
 
@@ -186,6 +242,7 @@ async def make_pagination_catalog(board: str, catalog: list[dict], page_num: int
     for c in catalog:
         catalog_page_thread_count += len(c['threads'])
 
+    href = f'/{board}/catalog/' + '{0}'
     # https://flask-paginate.readthedocs.io/en/master/
     return Pagination(
         page=page_num,
@@ -193,11 +250,27 @@ async def make_pagination_catalog(board: str, catalog: list[dict], page_num: int
         total=catalog_pages,
         search=False,
         record_name='threads',
-        href=f'/{board}/catalog/' + '{0}',
+        href=href,
+        next_href=get_next_page_href(href, page_num, next_cursor),
         show_single_page=True,
     )
 
 
+def render_catalog_cards(catalog: list[dict], is_admin: bool, snapshot: CatalogSnapshot | None=None) -> str:
+    csrf_input = get_csrf_input()
+    cards = []
+    for batch in catalog:
+        for op in batch['threads']:
+            if snapshot:
+                if not is_admin and (card := snapshot.get_card(op)):
+                    cards.append(card)
+                    continue
+                # snapshot ops are shared by every request, and wrap_post_t() writes to the op
+                op = op | {}
+            cards.append(render_catalog_card(wrap_post_t(op), show_nuke_btn=is_admin, csrf_input=csrf_input))
+    return ''.join(cards)
+
+
 @bp.get("/<string:board>/catalog")
 @inject_csrf_token_to_session
 @load_web_usr_data
@@ -206,22 +279,29 @@ async def make_pagination_catalog(board: str, catalog: list[dict], page_num: int
 @validate_board_query_parameter
 async def v_catalog(board: str, is_admin: bool, logged_in: bool):
     p = Perf('catalog')
-    catalog = await generate_catalog(board)
+    snapshot = catalog_snapshots.get(board)
+
+    # only the admin nuke buttons carry the csrf token
+    version = await get_catalog_version_generation(board, 1, None, snapshot)
+    validators = web_validators(version, get_page_last_modified(version), CATALOG_TTL, logged_in, is_admin, has_csrf=is_admin)
+    if validators.is_fresh():
+        return validators.not_modified()
+    p.check('validators')
+
+    if snapshot:
+        catalog = snapshot.catalog
+    else:
+        catalog, _ = await generate_catalog(board)
     p.check('query')
 
     # `nreplies` won't always be correct, but it does not effect paging
-    catalog = [page | {'threads': (await fc.filter_reported_posts(page['threads'], is_authority=logged_in))} for page in catalog]
+    catalog = [page | {'threads': threads} for page, threads in zip(catalog, await fc.filter_reported_pages([page['threads'] for page in catalog], is_authority=logged_in))]
     p.check('filter_reported')
 
     pagination = await make_pagination_catalog(board, catalog, 0)
     p.check('paginate')
 
-    csrf_input = get_csrf_input()
-    threads = ''.join(
-        render_catalog_card(wrap_post_t(op), show_nuke_btn=is_admin, csrf_input=csrf_input)
-        for batch in catalog
-        for op in batch['threads']
-    )
+    threads = render_catalog_cards(catalog, is_admin, snapshot)
     render = template_catalog.render(
         threads=threads,
         pagination=pagination,
@@ -234,7 +314,7 @@ async def v_catalog(board: str, is_admin: bool, logged_in: bool):
     p.check('render')
     p.emit()
 
-    return render
+    return await validators.respond(render)
 
 
 @bp.get("/<string:board>/catalog/<int:page_num>")
@@ -245,22 +325,29 @@ async def v_catalog(board: str, is_admin: bool, logged_in: bool):
 @validate_board_query_parameter
 async def v_catalog_page(board: str, page_num: int, is_admin: bool, logged_in: bool):
     p = Perf('catalog page')
-    catalog = await generate_catalog(board, page_num)
+    cursor = decode_cursor(request.args.get('cursor'))
+    snapshot = catalog_snapshots.get(board) if page_num <= 1 and not cursor else None
+
+    version = await get_catalog_version_generation(board, page_num, cursor, snapshot)
+    validators = web_validators(version, get_page_last_modified(version), CATALOG_TTL, logged_in, is_admin, has_csrf=is_admin)
+    if validators.is_fresh():
+        return validators.not_modified()
+    p.check('validators')
+
+    if snapshot:
+        catalog, next_cursor = snapshot.catalog, snapshot.next_cursor
+    else:
+        catalog, next_cursor = await generate_catalog(board, page_num, cursor=cursor)
     p.check('query')
 
     # `nreplies` won't always be correct, but it does not effect paging
-    catalog = [page | {'threads': (await fc.filter_reported_posts(page['threads'], is_authority=logged_in))} for page in catalog]
+    catalog = [page | {'threads': threads} for page, threads in zip(catalog, await fc.filter_reported_pages([page['threads'] for page in catalog], is_authority=logged_in))]
     p.check('filter_reported')
 
-    pagination = await make_pagination_catalog(board, catalog, page_num)
+    pagination = await make_pagination_catalog(board, catalog, page_num, next_cursor)
     p.check('paginate')
 
-    csrf_input = get_csrf_input()
-    threads = ''.join(
-        render_catalog_card(wrap_post_t(op), show_nuke_btn=is_admin, csrf_input=csrf_input)
-        for batch in catalog
-        for op in batch['threads']
-    )
+    threads = render_catalog_cards(catalog, is_admin, snapshot)
     render = template_catalog.render(
         threads=threads,
         pagination=pagination,
@@ -273,7 +360,83 @@ async def v_catalog_page(board: str, page_num: int, is_admin: bool, logged_in: b
     p.check('render')
     p.emit()
 
-    return render
+    return await validators.respond(render)
+
+
+render_cache_min_posts: int = render_cache_conf.get('min_posts', 100)
+
+
+async def get_thread_render_version(board: str, thread_num: int) -> tuple | None:
+    """`None` means the thread should not be served from, or put into, the render cache, nor get validators."""
+    if not (render_cache_conf['enabled'] or HTTP_CACHE_ENABLED):
+        return None
+    return await get_thread_version_generation(board, thread_num)
+
+
+thread_stream_min_posts: int = app_conf.get('thread_stream_min_posts', 0)
+thread_stream_batch_size: int = app_conf.get('thread_stream_batch_size', 500)
+THREAD_STREAM_MARKER = '<!--thread_stream_posts_t-->'
+
+
+async def stream_thread(board: str, thread_num: int, is_admin: bool, logged_in: bool, cache_key: str, version: tuple | None, p: Perf) -> Response | None:
+    """Flushes the page head, then each batch of posts as it comes off the db cursor, then the page tail.
+
+    Returns `None` when the thread should be rendered in one go instead.
+
+    Since the header is sent before any posts are read, the page shows `nreplies` and `nimages` from `<board>_threads`,
+    not from counting the posts that survive filtering. The cached render is counted like the non streamed one.
+    """
+    if not thread_stream_min_posts:
+        return None
+
+    details = await get_thread_details(board, thread_num)
+    if not details or details['nreplies'] + 1 < thread_stream_min_posts:
+        return None
+
+    # a removed op takes its whole thread with it, which a single batch can't know about
+    if await fc.is_post_removed(board, thread_num):
+        return None
+
+    post_2_quotelinks = await get_thread_quotelinks(board, thread_num)
+    p.check('quotelinks')
+
+    nreplies, nimages = details['nreplies'], details['nimages']
+    head, tail = template_thread.render(
+        posts_t=THREAD_STREAM_MARKER,
+        nreplies=nreplies,
+        nimages=nimages,
+        board=board,
+        thread_num=thread_num,
+        tab_title=f"/{board}/ #{thread_num}",
+        logged_in=logged_in,
+        is_admin=is_admin,
+        report_form_t=generate_report_form(),
+    ).split(THREAD_STREAM_MARKER, 1)
+
+    @stream_with_context
+    async def generate():
+        yield head
+
+        posts_ts = []
+        n_posts = 0
+        n_images = 0
+        async for posts in generate_thread_stream(board, thread_num, size=thread_stream_batch_size):
+            posts = await fc.filter_reported_posts(posts, is_authority=logged_in)
+            posts_t = get_posts_t_thread(posts, post_2_quotelinks)
+            posts_ts.append(posts_t)
+            n_posts += len(posts)
+            n_images += get_counts_from_posts(posts)[1]
+            yield posts_t
+        p.check('streamed')
+
+        yield tail
+
+        if version and n_posts >= render_cache_min_posts:
+            # the same counts as `get_counts_from_posts()` over the whole filtered thread
+            await thread_cache.set(cache_key, version, (''.join(posts_ts), n_posts - 1, n_images))
+        p.emit()
+
+    return Response(generate(), mimetype='text/html')
 
 
 @bp.get("/<string:board>/thread/<int:thread_num>")
@@ -284,21 +447,47 @@ async def v_catalog_page(board: str, page_num: int, is_admin: bool, logged_in: b
 @validate_board_query_parameter
 async def v_thread(board: str, thread_num: int, is_admin: bool, logged_in: bool):
     p = Perf('thread')
-    # use the existing json app function to grab the data
-    post_2_quotelinks, thread_dict = await generate_thread(board, thread_num)
-    p.check('queries')
 
-    thread_dict['posts'] = await fc.filter_reported_posts(thread_dict['posts'], is_authority=logged_in)
-    p.check('filter_reported')
+    cache_key = f'{board}:{thread_num}:{int(logged_in)}'
+    version = await get_thread_render_version(board, thread_num)
+    validators = web_validators(version, get_thread_last_modified(version), THREAD_TTL, logged_in, is_admin, has_csrf=True)
+    if validators.is_fresh():
+        return validators.not_modified()
 
-    # TODO: only count manually if we can't get the counts from the side tables
-    nreplies, nimages = get_counts_from_posts(thread_dict['posts'])
+    cached = await thread_cache.get(cache_key, version) if version else None
+    p.check('cache')
 
-    p.check('validate')
+    if cached:
+        posts_t, nreplies, nimages = cached
+    elif response := await stream_thread(board, thread_num, is_admin, logged_in, cache_key, version, p):
+        return validators.set_headers(response)
+    else:
+        details, rows, rendered = await get_thread_rows(board, thread_num)
+        p.check('queries')
 
-    # posts_t = get_posts_t(thread_dict['posts'], post_2_quotelinks)
-    posts_t = get_posts_t_thread(thread_dict['posts'], post_2_quotelinks)
-    p.check('posts_t')
+        if thread_offload_min_posts and details and len(rows) >= thread_offload_min_posts:
+            posts_t, nreplies, nimages = await thread_render_pool.render_thread(board, thread_num, details, rows, rendered, logged_in)
+            n_posts = len(rows)
+            p.check('offloaded')
+        else:
+            post_2_quotelinks, thread_dict = thread_rows_2_posts(board, thread_num, details, rows, rendered)
+            p.check('posts')
+
+            thread_dict['posts'] = await fc.filter_reported_posts(thread_dict['posts'], is_authority=logged_in)
+            p.check('filter_reported')
+
+            # TODO: only count manually if we can't get the counts from the side tables
+            nreplies, nimages = get_counts_from_posts(thread_dict['posts'])
+            n_posts = len(thread_dict['posts'])
+
+            p.check('validate')
+
+            # posts_t = get_posts_t(thread_dict['posts'], post_2_quotelinks)
+            posts_t = get_posts_t_thread(thread_dict['posts'], post_2_quotelinks)
+            p.check('posts_t')
+
+        if version and n_posts >= render_cache_min_posts:
+            await thread_cache.set(cache_key, version, (posts_t, nreplies, nimages))
 
     title = f"/{board}/ #{thread_num}"
 
@@ -315,7 +504,7 @@ async def v_thread(board: str, thread_num: int, is_admin: bool, logged_in: bool)
     )
     p.check('rendered')
     p.emit()
-    return render
+    return await validators.respond(render)
 
 
 @bp.get("/<string:board>/post/<int:post_id>")
@@ -324,13 +513,20 @@ async def v_post(board: str, post_id: int):
     """Called by the client to generate posts not on the page - e.g. when viewing search results.
     """
     p = Perf('post')
+    # removals bump the moderation generation, so a removed post is never answered with a 304
+    version = await get_post_version_generation(board, post_id) if HTTP_CACHE_ENABLED else None
+    validators = json_validators(version, get_post_last_modified(version), POST_TTL, False)
+    if validators.is_fresh():
+        return validators.not_modified()
+    p.check('validators')
+
     post_2_quotelinks, post = await generate_post(board, post_id)
     p.check('query')
 
     if not post:
         return {}
 
-    is_removed = await fc.is_post_removed(post.board_shortname, post.num)
+    is_removed = await fc.is_post_removed(post['board_shortname'], post['num'])
     p.check('is_post_removed')
     if is_removed:
         return {}
@@ -339,4 +535,4 @@ async def v_post(board: str, post_id: int):
 
     p.check('render')
     p.emit()
-    return jsonify(html_content=html_content, thread_num=post['thread_num'])
+    return await validators.respond(jsonify(html_content=html_content, thread_num=post['thread_num']))
@@ -4,19 +4,29 @@ from quart import flash
 from jinja2 import Template
 from quart_wtf import QuartForm
 
+from ...asagi_converter import SEARCH_COUNT_ESTIMATED, html_comments
 from ...configs import app_conf, index_search_conf, vanilla_search_conf, search_plugins_conf, SITE_NAME
 from ...forms import SearchFormFTS, SearchForm, SearchFormSQL
 from ...moderation import fc
-from ...posts.comments import html_comment, html_highlight
+from ...posts.comments import html_highlight
 from ...posts.template_optimizer import (
     get_media_img_t,
     render_wrapped_post_t,
     wrap_post_t
 )
-from ...search import get_posts_and_total_hits_fts, get_posts_and_total_hits_sql
-from ...search.pagination import template_pagination_links, total_pages
+from ...search import (
+    get_posts_and_total_hits_fts,
+    get_posts_and_total_hits_sql,
+    get_posts_and_total_hits_sql_keyset
+)
+from ...search.pagination import (
+    template_cursor_links,
+    template_pagination_links,
+    total_pages
+)
 from ...templates import template_search
 from ...perf import Perf
+from ...utils.cursors import encode_cursor
 from ...plugins.i_search import search_plugins, intersect_search_plugin_results, SearchPlugin
 from ...moderation.report import generate_report_form
 
@@ -29,6 +39,9 @@ class SearchHandler:
     enabled: bool
     multi_board_search: bool
     highlight: bool
+    keyset_pagination: bool = False
+    next_cursor: str | None = None
+    hits_estimated: bool = False
     board_2_nums: dict[str, set[int]] = dict()
 
     @property
@@ -50,12 +63,10 @@ class SearchHandler:
         raise NotImplementedError
 
     def get_posts_t(self, posts: list[dict]):
+        """Comments must already be html, see `html_comments()`."""
         posts_t = []
         if not self.is_gallery_mode:
             for post in posts:
-
-                post['comment'] = html_comment(post['comment'], post['thread_num'], post['board_shortname'])
-
                 if self.highlight:
                     hl_search_term_comment = self.form.comment.data if self.form.comment.data else None
                     hl_search_term_title = self.form.title.data if self.form.title.data else None
@@ -87,8 +98,14 @@ class SearchHandlerSQL(SearchHandler):
     highlight: bool = vanilla_search_conf['highlight']
     html_search_memo = 'SQL search will always yield existing results, but it is slower than index search. Results are exact matching.'
     html_message_error: str = 'There seems to be a problem with the submitted query.'
+    keyset_pagination: bool = vanilla_search_conf.get('keyset_pagination', False)
+    hits_estimated: bool = SEARCH_COUNT_ESTIMATED and keyset_pagination
 
     async def get_posts_and_total_hits(self):
+        if self.keyset_pagination:
+            posts, total_hits, next_cursor = await get_posts_and_total_hits_sql_keyset(self.form_data)
+            self.next_cursor = encode_cursor(*next_cursor) if next_cursor else None
+            return posts, total_hits
         return await get_posts_and_total_hits_sql(self.form_data)
 
 
@@ -192,6 +209,10 @@ async def search_handler(handler: SearchHandler, request_args: dict, endpoint_pa
             posts, total_hits = await handler.filter_posts_and_total_hits(posts, total_hits, logged_in=logged_in)
             p.check('filter_reported')
 
+            if not handler.is_gallery_mode:
+                await html_comments(posts)
+                p.check('html comments')
+
             posts_t = handler.get_posts_t(posts)
             p.check('templated posts')
 
@@ -200,6 +221,9 @@ async def search_handler(handler: SearchHandler, request_args: dict, endpoint_pa
                 total_hits = min(total_hits, handler.form.hits_per_page.data)
                 # if total_hits == handler.form.hits_per_page.data:
                 #     await flash('- Max page size reached. Note that AQ does not perform pagination with search plugins. To find other results, specify other query arguments.')
+            elif handler.keyset_pagination:
+                page_links = template_cursor_links(endpoint_path, handler.form.data, handler.next_cursor, section='resulttop')
+                p.check('templated links')
             else:
                 page_count = total_pages(total_hits, handler.form.hits_per_page.data)
                 page_links = template_pagination_links(endpoint_path, handler.form.data, page_count, section='resulttop')
@@ -209,7 +233,7 @@ async def search_handler(handler: SearchHandler, request_args: dict, endpoint_pa
 
     yield_message = ''
     if did_any_search:
-        yield_message = f'Searched archive in {time_search_end-time_search_start:,.3f}s. Post search hits: {total_hits:,}'
+        yield_message = f'Searched archive in {time_search_end-time_search_start:,.3f}s. Post search hits: {"≈" if handler.hits_estimated else ""}{total_hits:,}'
 
     # this search field is a bit unusual
     # - its value is configured
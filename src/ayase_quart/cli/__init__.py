@@ -13,5 +13,27 @@ def main():
                 asyncio.run(search_cli(args))
             except KeyboardInterrupt:
                 pass
+        case Cmd.quotelinks:
+            import asyncio
+            from ..posts.quotelink_table import quotelinks_tailer
+            from .tailer_cli import tailer_cli
+            try:
+                asyncio.run(tailer_cli(args, quotelinks_tailer, 'scanned {:,} posts'))
+            except KeyboardInterrupt:
+                pass
+        case Cmd.rendered:
+            import asyncio
+            from ..posts.rendered_table import rendered_tailer
+            from .tailer_cli import tailer_cli
+            try:
+                asyncio.run(tailer_cli(args, rendered_tailer, 'rendered {:,} comments'))
+            except KeyboardInterrupt:
+                pass
+        case Cmd.bench:
+            from .bench_cli import bench_cli
+            bench_cli(args)
+        case Cmd.db:
+            from .db_cli import db_cli
+            db_cli(args)
         case Cmd.mod:
             pass
@@ -19,6 +19,10 @@ class Cmd(StrEnum):
     search = 'search'
     mod = 'mod'
     prep = 'prep'
+    quotelinks = 'quotelinks'
+    rendered = 'rendered'
+    bench = 'bench'
+    db = 'db'
 
 @dataclass(slots=True, frozen=True, init=False)
 class CmdArg:
@@ -125,6 +129,99 @@ after_date_flag = CmdArg(
     '--after', help='after date',
     type=valid_date, default=None, metavar='YY-MM-DD',
 )
+db_path_arg = CmdArg(
+    'path', help='sqlite file to write',
+    type=str, metavar='PATH',
+)
+scale_flag = CmdArg(
+    '--scale', help='threads per board: tiny 50, small 500, medium 5k, large 25k',
+    choices=['tiny', 'small', 'medium', 'large'],
+    default='small', metavar='SCALE',
+)
+threads_flag = CmdArg(
+    '--threads', help='threads per board, overrides --scale',
+    type=int, default=None, metavar='QTY',
+)
+max_replies_flag = CmdArg(
+    '--max-replies', help='replies in the largest threads',
+    type=int, default=3_000, metavar='QTY',
+)
+seed_flag = CmdArg(
+    '--seed', help='random seed, the same seed gives the same database',
+    type=int, default=0, metavar='SEED',
+)
+force_flag = CmdArg(
+    '-f', '--force', help='replace the file if it exists',
+    action='store_true',
+)
+keyword_flag = CmdArg(
+    '-k', '--keyword', help='only run benchmarks whose name contains this',
+    type=str, default=None, metavar='KEYWORD',
+)
+min_rounds_flag = CmdArg(
+    '--min-rounds', help='run each benchmark at least this many times',
+    type=int, default=5, metavar='QTY',
+)
+min_time_flag = CmdArg(
+    '--min-time', help='run each benchmark for at least this long',
+    type=float, default=1.0, metavar='SECONDS',
+)
+warmup_flag = CmdArg(
+    '--warmup', help='untimed runs before timing each benchmark',
+    type=int, default=1, metavar='QTY',
+)
+out_flag = CmdArg(
+    '-o', '--out', help='results file, defaults to ./data/bench/<time>_<commit>.json',
+    type=str, default=None, metavar='PATH',
+)
+threshold_flag = CmdArg(
+    '--threshold', help='exit with 1 when a median is slower by more than this fraction',
+    type=float, default=0.10, metavar='FRACTION',
+)
+base_results_arg = CmdArg(
+    'base', help='results file to compare against',
+    type=str, metavar='BASE',
+)
+new_results_arg = CmdArg(
+    'new', help='results file to compare',
+    type=str, metavar='NEW',
+)
+url_flag = CmdArg(
+    '--url', help='load a running server at this base url instead of the app in this process',
+    type=str, default=None, metavar='URL',
+)
+fixture_flag = CmdArg(
+    '--db', help='sqlite database to serve in process, e.g. one made by `bench db`, instead of the configured one',
+    type=str, default=None, metavar='PATH',
+)
+concurrency_flag = CmdArg(
+    '-c', '--concurrency', help='requests in flight',
+    type=int, default=16, metavar='QTY',
+)
+duration_flag = CmdArg(
+    '-d', '--duration', help='seconds to run for',
+    type=float, default=30.0, metavar='SECONDS',
+)
+requests_flag = CmdArg(
+    '-n', '--requests', help='stop after this many requests instead of after --duration',
+    type=int, default=None, metavar='QTY',
+)
+warmup_requests_flag = CmdArg(
+    '--warmup', help='untimed requests before the run',
+    type=int, default=50, metavar='QTY',
+)
+mix_flag = CmdArg(
+    '--mix', help='route weights, default thread=40,index=20,catalog=10,post=20,search=10',
+    type=str, default=None, metavar='ROUTE=WEIGHT,...',
+)
+json_flag = CmdArg(
+    '--json', help='print as json',
+    action='store_true',
+)
+limit_flag = CmdArg(
+    '-l', '--limit', help='show at most this many statements',
+    type=int, default=20, metavar='QTY',
+)
 
 root_args = []
 report_filter_flags = [
@@ -169,6 +266,39 @@ root_cmds = [
             ),
         ]),
     ]),
+    Command(Cmd.quotelinks, 'quotelink table management', [
+        Command('full', 'create and fill <board>_quotelinks for selected boards', post_args=[board_arg]),
+        Command('incr', 'load quotelinks of posts added since the last run',
+            pre_args=[cron_flag],
+            post_args=[board_arg],
+        ),
+    ]),
+    Command(Cmd.rendered, 'pre-rendered comment table management', [
+        Command('full', 'create and fill <board>_rendered for selected boards', post_args=[board_arg]),
+        Command('incr', 'render comments of posts added since the last run',
+            pre_args=[cron_flag],
+            post_args=[board_arg],
+        ),
+    ]),
+    Command(Cmd.bench, 'benchmarks', [
+        Command('db', 'generate a synthetic asagi sqlite database',
+            pre_args=[scale_flag, threads_flag, max_replies_flag, seed_flag, force_flag, board_flag],
+            post_args=[db_path_arg],
+        ),
+        Command('run', 'time the hot paths against the configured database and save the results as json',
+            pre_args=[keyword_flag, min_rounds_flag, min_time_flag, warmup_flag, out_flag, board_flag],
+        ),
+        Command('http', 'load test the web app with a weighted request mix, and report latency percentiles per route',
+            pre_args=[url_flag, fixture_flag, concurrency_flag, duration_flag, requests_flag, warmup_requests_flag, mix_flag, seed_flag, out_flag, board_flag],
+        ),
+        Command('compare', 'compare the medians of two results files',
+            pre_args=[threshold_flag],
+            post_args=[base_results_arg, new_results_arg],
+        ),
+    ]),
+    Command(Cmd.db, 'database diagnostics', [
+        Command('slowlog', 'print the slow query log of every worker, with query plans', pre_args=[json_flag, limit_flag]),
+    ]),
     Command(Cmd.mod, 'moderation managemnt', [
         Command('report', 'manage user reports', [
             Command('list', 'list reports with filters', post_args=report_filter_flags),
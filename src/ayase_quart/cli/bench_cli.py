@@ -0,0 +1,177 @@
+from argparse import Namespace
+
+
+def bench_db_cli(args: Namespace) -> None:
+    from ..bench.synthetic_db import SCALES, create_synthetic_db
+
+    n_threads = args.threads or SCALES[args.scale]
+    try:
+        all_stats = create_synthetic_db(args.path, args.boards or ('g', 'ck'), n_threads, args.max_replies, args.seed, overwrite=args.force)
+    except FileExistsError:
+        print(f'{args.path} exists, pass --force to replace it')
+        return
+
+    for stats in all_stats:
+        print(f'/{stats.board}/ {stats.threads:,} threads, {stats.posts:,} posts, {stats.deleted:,} deleted, {stats.images:,} images, largest thread {stats.largest_thread} ({stats.largest_thread_posts:,} posts)')
+    print(f'Point config.toml and boards.toml at {args.path} to benchmark it')
+
+
+def bench_run_cli(args: Namespace) -> None:
+    import asyncio
+
+    # imported outside the loop, loading the boards runs a loop of its own
+    from ..bench.suite import get_results_path, run_suite, save_results
+    from ..boards import board_shortnames
+    from ..db import db_m, db_q
+    from ..moderation import fc, init_moderation
+
+    boards = args.boards or list(board_shortnames)
+    if unknown := [board for board in boards if board not in board_shortnames]:
+        print(f'Unknown boards: {" ".join(unknown)}')
+        return
+
+    def on_result(result: dict):
+        stats = result['stats']
+        print(f'{result["name"]:<48} median {stats["median"] * 1000:>10.3f} ms  iqr {stats["iqr"] * 1000:>9.3f} ms  rounds {stats["rounds"]:>6}')
+
+    async def run():
+        try:
+            await init_moderation()
+            await fc.init(in_background=False)
+            return await run_suite(boards, args.keyword, args.min_rounds, args.min_time, args.warmup, on_result)
+        finally:
+            await fc.stop()
+            await db_q.close_db_pool()
+            await db_m.close_db_pool()
+
+    results = asyncio.run(run())
+    path = args.out or get_results_path(results)
+    save_results(results, path)
+    print(f'Saved {path}')
+
+
+def bench_compare_cli(args: Namespace) -> None:
+    from tabulate import tabulate
+
+    from ..bench.suite import compare_results, get_regressions, load_results
+
+    base, new = load_results(args.base), load_results(args.new)
+    comparisons = compare_results(base, new)
+
+    def fmt_ms(seconds: float | None) -> str:
+        return '' if seconds is None else f'{seconds * 1000:.3f}'
+
+    rows = []
+    for c in comparisons:
+        change = c.change
+        rows.append((c.name, fmt_ms(c.base), fmt_ms(c.new), '' if change is None else f'{change:+.1%}'))
+    print(f'base {base["commit_info"]["id"][:10]} {base["datetime"]}')
+    print(f'new  {new["commit_info"]["id"][:10]} {new["datetime"]}')
+    print(tabulate(rows, headers=('benchmark', 'base median ms', 'new median ms', 'change'), tablefmt='simple'))
+
+    if regressions := get_regressions(comparisons, args.threshold):
+        print(f'{len(regressions)} benchmark(s) slower by more than {args.threshold:.0%}: {", ".join(c.name for c in regressions)}')
+        raise SystemExit(1)
+
+
+def print_http_results(results: dict) -> None:
+    from tabulate import tabulate
+
+    def fmt_ms(seconds: float | None) -> str:
+        return '' if seconds is None else f'{seconds * 1000:.1f}'
+
+    def fmt_stage(route: dict) -> str:
+        if not (stage := route['dominant_stage']):
+            return ''
+        total = sum(route['stages'].values())
+        return f'{stage} ({route["stages"][stage] / total:.0%})'
+
+    rows = [
+        (name, r['requests'], r['errors'], f'{r["throughput"]:.1f}', fmt_ms(r['p50']), fmt_ms(r['p95']), fmt_ms(r['p99']), fmt_ms(r['max']), fmt_stage(r))
+        for name, r in results['routes'].items()
+    ]
+    rows.append(('all', results['requests'], results['errors'], f'{results["throughput"]:.1f}', fmt_ms(results['p50']), fmt_ms(results['p95']), fmt_ms(results['p99']), fmt_ms(results['max']), results['dominant_stage'] or ''))
+    print(tabulate(rows, headers=('route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'dominant stage'), tablefmt='simple'))
+    if not results['dominant_stage']:
+        print('No Server-Timing headers came back, set [metrics] server_timing = true on the server to see stages')
+
+
+def bench_http_cli(args: Namespace) -> None:
+    import asyncio
+
+    from ..bench.http import DEFAULT_MIX, parse_mix
+    from ..configs import app_conf, db_conf, metrics_conf
+
+    in_process = not args.url
+    if in_process:
+        # read when the app is imported, so set before importing it.
+        # every response should carry its Perf checkpoints, and the rate limiter would turn the load into 429s.
+        metrics_conf['server_timing'] = True
+        metrics_conf['server_timing_sample_rate'] = 1.0
+        app_conf['rate_limiter'] = False
+    if args.db:
+        if db_conf['db_type'].name != 'sqlite':
+            print('--db needs db_type = \'sqlite\' in config.toml')
+            return
+        db_conf['sqlite']['database'] = args.db
+
+    try:
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    except ValueError as e:
+        print(e)
+        return
+
+    # imported outside the loop, loading the boards runs a loop of its own
+    from ..bench.http import http_sender, in_process_sender, run_load_test
+    from ..bench.suite import get_results_path, save_results
+    from ..boards import board_shortnames
+    from ..configs import vanilla_search_conf
+    from ..db import db_q
+
+    boards = args.boards or list(board_shortnames)
+    if unknown := [board for board in boards if board not in board_shortnames]:
+        print(f'Unknown boards: {" ".join(unknown)}')
+        return
+    if mix.get('search') and not vanilla_search_conf.get('enabled', False):
+        print('[vanilla_search] is disabled, leaving search out of the mix')
+        mix = {route: weight for route, weight in mix.items() if route != 'search'}
+
+    duration = None if args.requests else args.duration
+    kwargs = dict(boards=boards, mix=mix, concurrency=args.concurrency, duration=duration, n_requests=args.requests, warmup=args.warmup, seed=args.seed, url=args.url)
+
+    if in_process:
+        from ..main import app
+
+    async def run_in_process():
+        async with app.test_app() as test_app:
+            return await run_load_test(in_process_sender(test_app.test_client()), **kwargs)
+
+    async def run_http():
+        import aiohttp
+
+        try:
+            connector = aiohttp.TCPConnector(limit=args.concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                return await run_load_test(http_sender(session, args.url), **kwargs)
+        finally:
+            await db_q.close_db_pool()
+
+    print(f'Loading {args.url or "the app in process"} with {args.concurrency} requests in flight, ' + (f'{args.requests:,} requests' if args.requests else f'for {args.duration:g}s'))
+    results = asyncio.run(run_in_process() if in_process else run_http())
+    print_http_results(results['results'])
+
+    path = args.out or get_results_path(results, prefix='http_')
+    save_results(results, path)
+    print(f'Saved {path}')
+
+
+def bench_cli(args: Namespace) -> None:
+    match args.cmd_1:
+        case 'db':
+            bench_db_cli(args)
+        case 'run':
+            bench_run_cli(args)
+        case 'http':
+            bench_http_cli(args)
+        case 'compare':
+            bench_compare_cli(args)
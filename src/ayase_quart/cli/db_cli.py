@@ -0,0 +1,40 @@
+import asyncio
+from argparse import Namespace
+from datetime import datetime
+
+
+def slowlog_cli(args: Namespace) -> None:
+    from ..configs import db_conf
+    from ..db.slow_queries import collect_slow_queries
+
+    slow_query_conf = db_conf.get('slow_query_log', {})
+    if not slow_query_conf.get('enabled'):
+        print('[db.slow_query_log] is disabled, showing what was logged while it was enabled')
+    log = asyncio.run(collect_slow_queries(slow_query_conf.get('dir', './data/slow_queries')))
+    log['queries'] = log['queries'][:args.limit]
+
+    if args.json:
+        import json
+        print(json.dumps(log, indent=4))
+        return
+
+    if not log['queries']:
+        print('No slow queries logged')
+        return
+
+    for q in log['queries']:
+        last_seen = datetime.fromtimestamp(q['last_seen']).strftime('%Y-%m-%d %H:%M:%S')
+        print(f'max {q["max"] * 1000:.1f} ms, avg {q["total"] / q["count"] * 1000:.1f} ms, {q["count"]:,} slow runs, last {last_seen}')
+        print(f'  {q["statement"]}')
+        for shape in q['shapes']:
+            print(f'  params: {shape or "none"}')
+        if plan := q['plan'] or q['plan_error']:
+            print('  plan:')
+            print('\n'.join(f'    {line}' for line in plan.splitlines()))
+        print()
+
+
+def db_cli(args: Namespace) -> None:
+    match args.cmd_1:
+        case 'slowlog':
+            slowlog_cli(args)
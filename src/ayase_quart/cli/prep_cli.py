@@ -22,6 +22,22 @@ def collect_js_integrities(js_root: str) -> dict:
 def make_path(*path):
     return os.path.join(os.path.dirname(__file__), *path)
 
+def populate_filter_cache() -> None:
+    import asyncio
+    # imported outside the loop, loading the boards runs a loop of its own
+    from ..db import db_m, db_q
+    from ..moderation import fc, init_moderation
+
+    async def populate():
+        try:
+            await init_moderation()
+            await fc.init(in_background=False)
+        finally:
+            await db_q.close_db_pool()
+            await db_m.close_db_pool()
+
+    asyncio.run(populate())
+
 def prep_cli(args: Namespace) -> None:
     match args.cmd_1:
         case 'secret':
@@ -52,6 +68,4 @@ def prep_cli(args: Namespace) -> None:
             validate_boards_in_db()
             print('ok')
         case 'filtercache':
-            import asyncio
-            from ..moderation import fc
-            asyncio.run(fc._create_cache())
+            populate_filter_cache()
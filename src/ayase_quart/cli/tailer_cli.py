@@ -0,0 +1,33 @@
+import asyncio
+from argparse import Namespace
+
+from ..boards import board_shortnames
+from ..db import db_q
+from ..posts.doc_id_tailer import DocIdTailer
+
+
+async def tailer_cli(args: Namespace, tailer: DocIdTailer, done: str) -> None:
+    """`full` and `incr` subcommands of a `DocIdTailer`. `done` says what was done to the posts, e.g. 'scanned {:,} posts'."""
+    boards = args.boards
+    if unknown := [board for board in boards if board not in board_shortnames]:
+        print(f'Unknown boards: {" ".join(unknown)}')
+        return
+
+    try:
+        match args.cmd_1:
+            case 'full':
+                for board in boards:
+                    print(f'/{board}/ {done.format(await tailer.full(board))}')
+            case 'incr':
+                cron = args.cron
+                while True:
+                    try:
+                        for board in boards:
+                            print(f'/{board}/ {done.format(await tailer.incremental(board))} since the last run')
+                        if not cron:
+                            break
+                        await asyncio.sleep(cron)
+                    except asyncio.CancelledError:
+                        break
+    finally:
+        await db_q.close_db_pool()
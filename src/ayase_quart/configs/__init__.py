@@ -83,11 +83,20 @@ if mod_conf['enabled'] and db_mod_conf['database']:
 stats_conf = conf.get('stats', {'enabled': False})
 
 
+render_cache_conf = conf.get('render_cache', {'enabled': False})
+catalog_snapshot_conf = conf.get('catalog_snapshot', {'enabled': False})
+http_cache_conf = conf.get('http_cache', {'enabled': False})
+metrics_conf = conf.get('metrics', {'enabled': False})
+
+
 search_plugins_conf = conf.get('search_plugins', {'enabled': False})
 
 
 if sqlite_db := db_conf.get('sqlite', {}).get('database'):
     db_conf['database'] = sqlite_db
+    for key in ('cached_statements', 'readers', 'wal', 'mmap_size'):
+        if key in db_conf['sqlite']:
+            db_conf[key] = db_conf['sqlite'][key]
 fuvii(db_mod_conf, 'database') # ^ not sure what the logic of this one is
 
 
@@ -1,9 +1,15 @@
 import asyncio
+from collections.abc import Awaitable
 from functools import cache, wraps
+from time import perf_counter
 
 from ..configs import db_conf, db_mod_conf
-from ..db.base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner
+from ..db.base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner, acquire_waits
 from ..enums import DbType
+from ..metrics import metrics
+from .query_timings import query_timings
+from .slow_queries import SlowQueryLog, fmt_plan
+from .replicas import Replica, ReplicaSet, get_replica_conf, get_replica_name
 
 
 @cache
@@ -76,18 +82,113 @@ class DbHandler:
         self.query_runner: BaseQueryRunner = query_runner or self.db_module['QueryRunner'](self.pool_manager)
         self.Phg: type[BasePlaceHolderGen] = self.db_module['PlaceholderGenerator'] # "Place Holder Generator"
         self.length_method = 'CHAR_LENGTH' if db_type == DbType.mysql else 'LENGTH' # sqlite and pg
+        self.prepared_statements = db_conf.get('prepared_statements', True)
+        self.replicas = self.get_replica_set(db_conf)
+        slow_query_conf = db_conf.get('slow_query_log', {})
+        self.slow_query_log = SlowQueryLog(slow_query_conf) if slow_query_conf.get('enabled') else None
+
+    def get_replica_set(self, db_conf: dict) -> ReplicaSet:
+        replicas_conf = db_conf.get('replicas', {})
+        replicas = []
+        for server in replicas_conf.get('servers', []):
+            pool_manager = self.db_module['PoolManager'](get_replica_conf(db_conf, self.db_type, server))
+            replicas.append(Replica(get_replica_name(server), pool_manager, self.db_module['QueryRunner'](pool_manager)))
+        return ReplicaSet(
+            replicas,
+            self.db_type,
+            health_check_interval=replicas_conf.get('health_check_interval', 5),
+            max_lag=replicas_conf.get('max_lag', 30),
+        )
 
     async def get_db_pool(self):
         await self.pool_manager.get_pool()
 
     async def close_db_pool(self):
+        await self.replicas.stop()
+        await self.replicas.close_pools()
         await self.pool_manager.close_pool()
 
-    async def query_tuple(self, query: str, params=None, commit=False):
-        return await self.query_runner.run_query_fast(query, params=params, commit=commit)
-
-    async def query_dict(self, query: str, params=None, commit=False, dict_row=True):
-        return await self.query_runner.run_query(query, params=params, commit=commit, dict_row=dict_row)
+    async def read(self, run_query, primary=False):
+        """Runs `run_query(query_runner)` on a read replica, or on the primary if `primary=True` or no replica is healthy."""
+        if primary or not self.replicas.replicas:
+            return await run_query(self.query_runner)
+        return await self.replicas.run(run_query, self.query_runner)
+
+    async def query_tuple(self, query: str, params=None, commit=False, primary=False):
+        if commit:
+            run = self.query_runner.run_query_fast(query, params=params, commit=commit)
+        else:
+            run = self.read(lambda runner: runner.run_query_fast(query, params=params), primary=primary)
+        return await self.log_if_slow(run, query, params) if self.slow_query_log else await run
+
+    async def query_dict(self, query: str, params=None, commit=False, dict_row=True, primary=False):
+        if commit:
+            run = self.query_runner.run_query(query, params=params, commit=commit, dict_row=dict_row)
+        else:
+            run = self.read(lambda runner: runner.run_query(query, params=params, dict_row=dict_row), primary=primary)
+        return await self.log_if_slow(run, query, params) if self.slow_query_log else await run
+
+    async def log_if_slow(self, run: Awaitable, query: str, params):
+        """Times `run` without the time spent waiting for a pooled or replica connection."""
+        waits = []
+        token = acquire_waits.set(waits)
+        start = perf_counter()
+        try:
+            return await run
+        finally:
+            elapsed = perf_counter() - start
+            acquire_waits.reset(token)
+            self.slow_query_log.observe(query, params, elapsed - sum(waits), self.explain)
+
+    async def explain(self, query: str, params=None) -> str:
+        """The plan of a read query, as text. Not timed, so it never lands in the slow query log itself."""
+        explain_query = f'explain query plan {query}' if self.db_type == DbType.sqlite else f'explain {query}'
+        rows = await self.read(lambda runner: runner.run_query(explain_query, params=params, dict_row=True))
+        return fmt_plan(self.db_type, rows)
+
+    async def query_iter(self, query: str, params=None, dict_row=True, size: int=500, primary=False):
+        replica = None if primary else self.replicas.pick()
+        query_runner = replica.query_runner if replica else self.query_runner
+
+        if replica:
+            replica.outstanding += 1
+        try:
+            async for rows in query_runner.run_query_iter(query, params=params, dict_row=dict_row, size=size):
+                yield rows
+        except Exception as e:
+            # rows may have been yielded already, so there is no falling back to the primary here
+            if replica and query_runner.is_connection_error(e):
+                replica.eject(repr(e))
+            raise
+        finally:
+            if replica:
+                replica.outstanding -= 1
+
+    async def query_prepared(self, kind: str, board: str, query: str, params=None, dict_row=True, primary=False):
+        """For hot read queries whose text only depends on `(kind, board)`, e.g. built by a `@cache`'d function.
+
+        They run as the named prepared statement `<kind>_<board>` where the driver allows it, and are timed per `kind` in `query_timings`.
+        """
+        name = f'{kind}_{board}'
+
+        async def run_query(query_runner: BaseQueryRunner):
+            if self.prepared_statements:
+                return await query_runner.run_query_prepared(name, query, params=params, dict_row=dict_row)
+            return await query_runner.run_query(query, params=params, dict_row=dict_row)
+
+        waits = []
+        token = acquire_waits.set(waits)
+        start = perf_counter()
+        try:
+            return await self.read(run_query, primary=primary)
+        finally:
+            elapsed = perf_counter() - start
+            acquire_waits.reset(token)
+            query_timings.add(kind, elapsed)
+            metrics.observe('aq_db_query_duration_seconds', elapsed, kind)
+            if self.slow_query_log:
+                # the slow query log is about the statements, not the pool
+                self.slow_query_log.observe(query, params, elapsed - sum(waits), self.explain)
 
     async def run_script(self, query: str):
         return await self.query_runner.run_script(query)
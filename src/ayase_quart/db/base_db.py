@@ -1,5 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import Iterable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import AsyncContextManager, AsyncIterator, Iterable
+
+
+acquire_waits: ContextVar[list[float] | None] = ContextVar('acquire_waits', default=None)
+"""When set, query runners append the seconds they waited for a pooled connection, so callers can time the query alone."""
+
+
+@asynccontextmanager
+async def timed_acquire(acquire: AsyncContextManager) -> AsyncIterator:
+    """Wraps a pool's `acquire()`, recording its wait in `acquire_waits`."""
+    start = perf_counter()
+    async with acquire as conn:
+        if (waits := acquire_waits.get()) is not None:
+            waits.append(perf_counter() - start)
+        yield conn
 
 
 class BasePoolManager(ABC):
@@ -25,6 +42,23 @@ class BaseQueryRunner(ABC):
         """Executes a fast query mainly by avoiding the creation of dict objects."""
         pass
 
+    @abstractmethod
+    def run_query_iter(self, query: str, params=None, dict_row=True, size: int=500) -> AsyncIterator[list]:
+        """Yields lists of up to `size` rows from a server-side cursor, so large results are never held in memory at once."""
+        pass
+
+    async def run_query_prepared(self, name: str, query: str, params=None, dict_row=True):
+        """Executes a read query as the server-side prepared statement `name`.
+
+        `query` must be the same text on every call with a given `name`.
+        Defaults to `run_query()` for drivers that already cache prepared statements by their text.
+        """
+        return await self.run_query(query, params=params, dict_row=dict_row)
+
+    def is_connection_error(self, e: Exception) -> bool:
+        """Whether `e` came from reaching the server rather than from the query itself."""
+        return isinstance(e, OSError)
+
     @abstractmethod
     async def run_script(self, query: str):
         """Executes multiple sql statements, no params available"""
@@ -1,7 +1,10 @@
+from weakref import WeakKeyDictionary
+
 import aiomysql
 from aiomysql.pool import _PoolContextManager
+from pymysql.constants.ER import CON_COUNT_ERROR, UNKNOWN_STMT_HANDLER
 
-from .base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner
+from .base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner, timed_acquire
 
 
 class AttrDict(dict):
@@ -14,6 +17,10 @@ class AttrDictCursor(aiomysql.DictCursor):
     dict_type = AttrDict
 
 
+class AttrDictSSCursor(aiomysql.SSDictCursor):
+    dict_type = AttrDict
+
+
 class MysqlPoolManager(BasePoolManager):
     def __init__(self, mysql_conf: dict | None=None):
         """
@@ -56,13 +63,14 @@ class MysqlQueryRunner(BaseQueryRunner):
     def __init__(self, pool_manager: MysqlPoolManager, sql_echo=False):
         self.pool_manager = pool_manager
         self.sql_echo = sql_echo
+        self.prepared: WeakKeyDictionary[aiomysql.Connection, set[str]] = WeakKeyDictionary() # statement names prepared per session
 
 
     async def run_query(self, query: str, params=None, commit=False, dict_row=True):
         pool: _PoolContextManager = await self.pool_manager.get_pool()
         cursor_class = AttrDictCursor if dict_row else aiomysql.Cursor
 
-        async with pool.acquire() as conn:
+        async with timed_acquire(pool.acquire()) as conn:
             async with conn.cursor(cursor_class) as cursor:
                 if self.sql_echo:
                     final_sql = cursor.mogrify(query, params)
@@ -84,6 +92,71 @@ class MysqlQueryRunner(BaseQueryRunner):
         return await self.run_query(query, params, dict_row=False, commit=commit)
 
 
+    async def run_query_iter(self, query: str, params=None, dict_row=True, size: int=500):
+        pool: _PoolContextManager = await self.pool_manager.get_pool()
+        cursor_class = AttrDictSSCursor if dict_row else aiomysql.SSCursor
+
+        async with pool.acquire() as conn:
+            async with conn.cursor(cursor_class) as cursor:
+                if self.sql_echo:
+                    final_sql = cursor.mogrify(query, params)
+                    print('::SQL::', final_sql, '')
+
+                await cursor.execute(query, params)
+
+                while rows := await cursor.fetchmany(size):
+                    yield rows
+
+
+    async def run_query_prepared(self, name: str, query: str, params=None, dict_row=True):
+        """aiomysql has no binary protocol, so this uses SQL-level `PREPARE` and `EXECUTE ... USING`.
+
+        Statements live per session, so each pooled connection prepares `name` on first use.
+        The parameters are sent as user variables in the same round trip as the `EXECUTE`.
+        """
+        pool: _PoolContextManager = await self.pool_manager.get_pool()
+        cursor_class = AttrDictCursor if dict_row else aiomysql.Cursor
+        params = params or ()
+
+        variables = [f'@{name}_{i}' for i in range(len(params))]
+        sql = f'execute {name};'
+        if params:
+            sql = f"set {', '.join(f'{v} = %s' for v in variables)}; execute {name} using {', '.join(variables)};"
+
+        async with timed_acquire(pool.acquire()) as conn:
+            async with conn.cursor(cursor_class) as cursor:
+                prepared = self.prepared.setdefault(conn, set())
+
+                for retry in (False, True):
+                    if name not in prepared:
+                        statement = query.strip().rstrip(';').replace('%s', '?')
+                        if self.sql_echo:
+                            print('::SQL::', f'prepare {name} from', statement)
+                        await cursor.execute(f'prepare {name} from %s', (statement,))
+                        prepared.add(name)
+
+                    if self.sql_echo:
+                        print('::SQL::', cursor.mogrify(sql, params or None))
+
+                    try:
+                        await cursor.execute(sql, params or None)
+                        if params:
+                            await cursor.nextset() # the `execute` result follows the `set` result
+                        return await cursor.fetchall()
+                    except aiomysql.Error as e:
+                        # the session no longer knows the statement, prepare it again once
+                        if retry or e.args[0] != UNKNOWN_STMT_HANDLER:
+                            raise
+                        prepared.discard(name)
+
+
+    def is_connection_error(self, e: Exception) -> bool:
+        # 2xxx are client errors, e.g. 2003 can't connect, 2013 lost connection
+        if isinstance(e, aiomysql.OperationalError):
+            return e.args[0] == CON_COUNT_ERROR or 2000 <= e.args[0] < 3000
+        return isinstance(e, OSError)
+
+
     async def run_query_many(self, query: str, params=None, commit=False, dict_row=True):
         pool: _PoolContextManager = await self.pool_manager.get_pool()
         cursor_class = AttrDictCursor if dict_row else aiomysql.Cursor
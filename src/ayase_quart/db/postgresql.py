@@ -1,6 +1,6 @@
 import asyncpg
 
-from .base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner
+from .base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner, timed_acquire
 
 
 class PostgresqlPoolManager(BasePoolManager):
@@ -33,7 +33,7 @@ class PostgresqlQueryRunner(BaseQueryRunner):
         """kwargs to soak up `dict_row`"""
         pool = await self.pool_manager.get_pool()
 
-        async with pool.acquire() as conn:
+        async with timed_acquire(pool.acquire()) as conn:
             if self.sql_echo:
                 print('::SQL::', query)
                 print('::PARAMS::', params)
@@ -53,8 +53,28 @@ class PostgresqlQueryRunner(BaseQueryRunner):
             return await conn.fetch(query, *params if params else [])
 
 
-    async def run_query_fast(self, query: str, params=None):
-        return await self.run_query(query, params, dict_row=False)
+    async def run_query_fast(self, query: str, params=None, commit=False):
+        return await self.run_query(query, params, commit=commit, dict_row=False)
+
+
+    async def run_query_iter(self, query: str, params=None, size: int=500, **kwargs):
+        """kwargs to soak up `dict_row`"""
+        pool = await self.pool_manager.get_pool()
+
+        async with pool.acquire() as conn:
+            if self.sql_echo:
+                print('::SQL::', query)
+                print('::PARAMS::', params)
+
+            # asyncpg cursors only exist within a transaction
+            async with conn.transaction():
+                cursor = await conn.cursor(query, *params if params else [])
+                while rows := await cursor.fetch(size):
+                    yield rows
+
+
+    def is_connection_error(self, e: Exception) -> bool:
+        return isinstance(e, (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError))
 
 
     async def run_script(self, query: str):
@@ -0,0 +1,44 @@
+class QueryKindTiming:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class QueryTimings:
+    """Per-process latency of queries grouped by kind, e.g. `thread_posts` or `post`, across all boards."""
+
+    def __init__(self):
+        self.kinds: dict[str, QueryKindTiming] = {}
+
+    def add(self, kind: str, elapsed: float) -> None:
+        if not (timing := self.kinds.get(kind)):
+            timing = self.kinds[kind] = QueryKindTiming()
+        timing.add(elapsed)
+
+    def get_stats(self) -> list[dict]:
+        """Kinds sorted by total time spent, most expensive first. Times are in milliseconds."""
+        return [
+            dict(
+                kind=kind,
+                count=timing.count,
+                total_ms=round(timing.total * 1000, 3),
+                avg_ms=round(timing.total / timing.count * 1000, 3),
+                max_ms=round(timing.max * 1000, 3),
+            )
+            for kind, timing in sorted(self.kinds.items(), key=lambda item: item[1].total, reverse=True)
+        ]
+
+    def reset(self) -> None:
+        self.kinds.clear()
+
+
+query_timings = QueryTimings()
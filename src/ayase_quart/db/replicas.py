@@ -0,0 +1,160 @@
+import asyncio
+import traceback
+from random import random
+from typing import Any, Awaitable, Callable
+
+from ..enums import DbType
+from .base_db import BasePoolManager, BaseQueryRunner
+
+"""
+Read replicas of the primary database.
+
+Reads that don't commit go to the healthy replica with the fewest queries in flight, and to the primary when none is healthy.
+A replica is ejected when it raises a connection error, fails a health check, or lags more than `max_lag` seconds.
+Only the health checks let it back in.
+"""
+
+DB_TYPE_2_SECTION = {
+    DbType.mysql: 'mysql',
+    DbType.sqlite: 'sqlite',
+    DbType.postgres: 'postgresql',
+}
+
+
+def get_replica_conf(db_conf: dict, db_type: DbType, server: dict) -> dict:
+    """`server` holds the replica's connection keys, the rest come from the primary's `[db.<db_type>]` table."""
+    section = DB_TYPE_2_SECTION[db_type]
+    replica_conf = db_conf | {section: db_conf.get(section, {}) | server}
+    if db_type == DbType.sqlite:
+        replica_conf |= server
+    return replica_conf
+
+
+def get_replica_name(server: dict) -> str:
+    if 'database' in server and 'host' not in server:
+        return server['database']
+    return f"{server.get('host', server.get('unix_socket', ''))}:{server.get('port', '')}"
+
+
+class Replica:
+    __slots__ = ('name', 'pool_manager', 'query_runner', 'outstanding', 'healthy', 'lag', 'error')
+
+    def __init__(self, name: str, pool_manager: BasePoolManager, query_runner: BaseQueryRunner):
+        self.name = name
+        self.pool_manager = pool_manager
+        self.query_runner = query_runner
+        self.outstanding = 0
+        self.healthy = True # until the first health check says otherwise
+        self.lag: float | None = None
+        self.error: str | None = None
+
+    def eject(self, error: str) -> None:
+        if self.healthy:
+            print(f'Ejected read replica {self.name}: {error}')
+        self.healthy = False
+        self.error = error
+
+    async def get_lag(self, db_type: DbType) -> float | None:
+        """Seconds behind the primary, `None` when the server doesn't report replication."""
+        match db_type:
+            case DbType.mysql:
+                try:
+                    rows = await self.query_runner.run_query('show replica status;')
+                except Exception:
+                    rows = await self.query_runner.run_query('show slave status;') # mysql < 8.0.22, mariadb < 10.5
+                if not rows:
+                    return None
+                lag = rows[0].get('Seconds_Behind_Source', rows[0].get('Seconds_Behind_Master'))
+                if lag is None:
+                    raise ValueError('replication is not running')
+                return float(lag)
+            case DbType.postgres:
+                # an idle primary writes no wal, so a fully replayed replica is never behind
+                rows = await self.query_runner.run_query_fast("""
+                    select case
+                        when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+                        else coalesce(extract(epoch from now() - pg_last_xact_replay_timestamp()), 0)
+                    end
+                ;""")
+                return float(rows[0][0])
+            case _:
+                await self.query_runner.run_query_fast('select 1;')
+                return None
+
+    async def check(self, db_type: DbType, max_lag: float) -> None:
+        try:
+            self.lag = await self.get_lag(db_type)
+        except Exception as e:
+            self.eject(repr(e))
+            return
+
+        if self.lag is not None and self.lag > max_lag:
+            self.eject(f'{self.lag:.0f}s behind the primary')
+            return
+
+        if not self.healthy:
+            print(f'Read replica {self.name} is back')
+        self.healthy = True
+        self.error = None
+
+    def get_status(self) -> dict:
+        return dict(name=self.name, healthy=self.healthy, outstanding=self.outstanding, lag=self.lag, error=self.error)
+
+
+class ReplicaSet:
+    def __init__(self, replicas: list[Replica], db_type: DbType, health_check_interval: float=5, max_lag: float=30):
+        self.replicas = replicas
+        self.db_type = db_type
+        self.health_check_interval = health_check_interval
+        self.max_lag = max_lag
+        self.task: asyncio.Task | None = None
+
+    def pick(self) -> Replica | None:
+        """Least outstanding requests, ties are broken randomly so idle replicas share the load."""
+        if not (healthy := [replica for replica in self.replicas if replica.healthy]):
+            return None
+        return min(healthy, key=lambda replica: (replica.outstanding, random()))
+
+    async def run(self, run_query: Callable[[BaseQueryRunner], Awaitable[Any]], primary_runner: BaseQueryRunner) -> Any:
+        if not (replica := self.pick()):
+            return await run_query(primary_runner)
+
+        replica.outstanding += 1
+        try:
+            return await run_query(replica.query_runner)
+        except Exception as e:
+            if not replica.query_runner.is_connection_error(e):
+                raise
+            replica.eject(repr(e))
+        finally:
+            replica.outstanding -= 1
+
+        return await run_query(primary_runner)
+
+    async def check(self) -> None:
+        await asyncio.gather(*(replica.check(self.db_type, self.max_lag) for replica in self.replicas))
+
+    async def run_health_checks(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print('Read replica health checks failed')
+                traceback.print_exception(e)
+            await asyncio.sleep(self.health_check_interval)
+
+    async def start(self) -> None:
+        if self.replicas and not self.task:
+            self.task = asyncio.create_task(self.run_health_checks())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def close_pools(self) -> None:
+        for replica in self.replicas:
+            await replica.pool_manager.close_pool()
+
+    def get_status(self) -> list[dict]:
+        return [replica.get_status() for replica in self.replicas]
@@ -0,0 +1,202 @@
+import asyncio
+import re
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from itertools import groupby
+
+from ..enums import DbType
+from ..utils.worker_files import WorkerFiles, read_worker_files
+
+"""
+Statements that took longer than `threshold_ms`, grouped by their normalized text, i.e. with literals,
+placeholders and `in (...)` lists folded, so each dynamic `search_posts()` WHERE clause shape gets one entry.
+
+Each worker keeps at most `maxsize` statements, dropping the fastest first, and a ring buffer of the last `recent` slow runs.
+The first time a statement is slow, and again once its plan is `explain_interval` seconds old, its plan is captured with
+`EXPLAIN` (`EXPLAIN QUERY PLAN` on sqlite) in the background, with the parameters of the slow run.
+
+Like the metrics, workers write their log to `<dir>/<pid>.json` every `flush_interval` seconds when it changed,
+and readers merge every worker's file, so the admin page and `ayaseq db slowlog` see all of them.
+"""
+
+SQL_LITERAL_RE = re.compile(r"(`[^`]*`)|'(?:[^']|'')*'|\$\d+|%s|\?|\b\d+(?:\.\d+)?\b")
+SQL_LIST_RE = re.compile(r'\?(?:\s*,\s*\?)+')
+MAX_SQL_LENGTH = 20_000
+MAX_SHAPES = 8
+
+
+def normalize_sql(query: str) -> str:
+    """`select * from `g` where num in (%s,%s) and op = 1 limit 10` -> `select * from `g` where num in (?, ...) and op = ? limit ?`"""
+    query = SQL_LITERAL_RE.sub(lambda m: m.group(1) or '?', query)
+    query = SQL_LIST_RE.sub('?, ...', query)
+    return ' '.join(query.split()).rstrip(';').strip()
+
+
+def get_params_shape(params) -> str:
+    """The types of the parameters, with runs counted, e.g. `str, int x80`."""
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        return ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items())
+    return ', '.join(
+        name if (count := sum(1 for _ in run)) == 1 else f'{name} x{count}'
+        for name, run in groupby(type(param).__name__ for param in params)
+    )
+
+
+def fmt_plan(db_type: DbType, rows: list[dict]) -> str:
+    match db_type:
+        case DbType.sqlite:
+            # rows are (id, parent, notused, detail), children are indented under their parent
+            depths = {0: -1}
+            lines = []
+            for row in rows:
+                depth = depths[row['id']] = depths.get(row['parent'], -1) + 1
+                lines.append(f'{"  " * depth}{row["detail"]}')
+            return '\n'.join(lines)
+        case DbType.mysql:
+            from tabulate import tabulate
+            return tabulate(rows, headers='keys', tablefmt='simple')
+        case _:
+            return '\n'.join(str(next(iter(row.values()))) for row in rows)
+
+
+class SlowQuery:
+    __slots__ = ('statement', 'count', 'total', 'max', 'last', 'last_seen', 'shapes', 'sql', 'plan', 'plan_time', 'plan_error')
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.last_seen = 0.0
+        self.shapes: list[str] = []
+        self.sql = '' # the last slow run, as sent
+        self.plan = ''
+        self.plan_time = 0.0
+        self.plan_error = ''
+
+    def add(self, query: str, shape: str, elapsed: float, now: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.last = elapsed
+        self.last_seen = now
+        self.sql = query[:MAX_SQL_LENGTH]
+        if shape not in self.shapes and len(self.shapes) < MAX_SHAPES:
+            self.shapes.append(shape)
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+def merge_slow_queries(entries: list[dict]) -> dict:
+    """One statement's entries from several workers."""
+    merged = dict(entries[0])
+    merged['shapes'] = list(merged['shapes'])
+    for entry in entries[1:]:
+        merged['count'] += entry['count']
+        merged['total'] += entry['total']
+        merged['max'] = max(merged['max'], entry['max'])
+        if entry['last_seen'] > merged['last_seen']:
+            merged.update(last=entry['last'], last_seen=entry['last_seen'], sql=entry['sql'])
+        if entry['plan_time'] > merged['plan_time']:
+            merged.update(plan=entry['plan'], plan_time=entry['plan_time'], plan_error=entry['plan_error'])
+        merged['shapes'].extend(shape for shape in entry['shapes'] if shape not in merged['shapes'])
+    return merged
+
+
+type Explain = Callable[[str, object], Awaitable[str]] # query, params -> plan
+
+
+class SlowQueryLog(WorkerFiles):
+    def __init__(self, conf: dict):
+        super().__init__(conf.get('dir', './data/slow_queries'), conf.get('flush_interval', 5.0))
+        self.threshold: float = conf.get('threshold_ms', 250) / 1000
+        self.maxsize: int = conf.get('maxsize', 100)
+        self.explain: bool = conf.get('explain', True)
+        self.explain_interval: float = conf.get('explain_interval', 3_600)
+
+        self.queries: dict[str, SlowQuery] = {}
+        self.recent: deque[tuple[float, str, float, str]] = deque(maxlen=conf.get('recent', 200)) # time, statement, elapsed, params shape
+        self.explaining: set[str] = set()
+        self.tasks: set[asyncio.Task] = set()
+        self.changed = False
+
+    def observe(self, query: str, params, elapsed: float, explain: Explain) -> None:
+        if elapsed < self.threshold:
+            return
+
+        now = time.time()
+        statement = normalize_sql(query)
+        shape = get_params_shape(params)
+        if (slow_query := self.queries.get(statement)) is None:
+            slow_query = self.queries[statement] = SlowQuery(statement)
+        slow_query.add(query, shape, elapsed, now)
+        if len(self.queries) > self.maxsize:
+            del self.queries[min(self.queries.values(), key=lambda q: q.max).statement]
+        self.recent.append((now, statement, elapsed, shape))
+        self.changed = True
+
+        if (
+            self.explain
+            and statement in self.queries
+            and statement not in self.explaining
+            and now - slow_query.plan_time > self.explain_interval
+            and statement.lower().startswith(('select', 'with'))
+        ):
+            self.explaining.add(statement)
+            task = asyncio.create_task(self.capture_plan(slow_query, query, params, explain))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def capture_plan(self, slow_query: SlowQuery, query: str, params, explain: Explain) -> None:
+        try:
+            slow_query.plan = await explain(query, params)
+            slow_query.plan_error = ''
+        except Exception as e:
+            slow_query.plan_error = repr(e)
+        finally:
+            slow_query.plan_time = time.time()
+            self.explaining.discard(slow_query.statement)
+            self.changed = True
+
+    def to_dict(self) -> dict:
+        return dict(
+            queries=[q.to_dict() for q in self.queries.values()],
+            recent=list(self.recent),
+        )
+
+    def needs_flush(self) -> bool:
+        return self.changed
+
+    async def flush(self) -> None:
+        self.changed = False
+        await super().flush()
+
+    async def stop(self) -> None:
+        for task in list(self.tasks):
+            task.cancel()
+        await super().stop()
+
+    async def collect(self) -> dict:
+        if self.changed:
+            await self.flush()
+        return await collect_slow_queries(self.files_dir)
+
+
+async def collect_slow_queries(log_dir: str) -> dict:
+    """Every worker's log merged. Queries are sorted by their slowest run, slowest first, and recent runs by time, latest first."""
+    by_statement: dict[str, list[dict]] = {}
+    recent = []
+    for data in await read_worker_files(log_dir):
+        for entry in data['queries']:
+            by_statement.setdefault(entry['statement'], []).append(entry)
+        recent.extend(data['recent'])
+
+    queries = [merge_slow_queries(entries) for entries in by_statement.values()]
+    queries.sort(key=lambda q: q['max'], reverse=True)
+    recent.sort(key=lambda run: run[0], reverse=True)
+    return dict(queries=queries, recent=recent)
@@ -1,7 +1,14 @@
+import asyncio
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.request import pathname2url
+
 import aiosqlite
 
 from ..configs import mod_conf
-from .base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner
+from .base_db import BasePlaceHolderGen, BasePoolManager, BaseQueryRunner, timed_acquire
 
 
 class DotDict(dict):
@@ -18,33 +25,93 @@ def row_factory(cursor: aiosqlite.Cursor, row: tuple):
 
 class SqlitePoolManager(BasePoolManager):
     def __init__(self, sqlite_conf=None, sql_echo=False):
+        """With `readers` set in `sqlite_conf`, reads are spread over that many read-only connections,
+        each with its own aiosqlite thread, and `get_pool()` only serves writes.
+        """
         self.sqlite_conf = sqlite_conf or {}
         self.sql_echo = sql_echo
-        self.pool = None
+        self.pool = None # the writer
+        self.n_readers = self.sqlite_conf.get('readers', 0)
+        self.readers: asyncio.Queue[aiosqlite.Connection] | None = None
+        self.reader_conns: list[aiosqlite.Connection] = []
+        self.readers_lock = asyncio.Lock()
 
 
-    async def get_pool(self):
+    async def connect(self, read_only: bool=False) -> aiosqlite.Connection:
         db_path = self.sqlite_conf['database']
+        if read_only:
+            db_path = f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro'
 
-        if self.pool is None:
-            self.pool = await aiosqlite.connect(db_path)
+        # sqlite3 keeps this many compiled statements per connection, keyed by their text
+        conn = await aiosqlite.connect(db_path, uri=read_only, cached_statements=self.sqlite_conf.get('cached_statements', 128))
+
+        if mmap_size := self.sqlite_conf.get('mmap_size'):
+            await conn.execute_fetchall(f'pragma mmap_size = {int(mmap_size)};')
 
         if mod_conf['enabled'] and mod_conf['regex_filter'] and mod_conf['path_to_regex_so']:
-            await self.pool.enable_load_extension(True)
-            await self.pool.load_extension(mod_conf['path_to_regex_so'])
+            await conn.enable_load_extension(True)
+            await conn.load_extension(mod_conf['path_to_regex_so'])
 
-            async with self.pool.execute('select regex_version();') as cursor:
+            async with conn.execute('select regex_version();') as cursor:
                 result = await cursor.fetchone()
                 print(result)
 
+        return conn
+
+
+    async def get_pool(self):
+        """The writer connection. It also serves reads when `readers` is 0."""
+        if self.pool is None:
+            self.pool = await self.connect()
+
+            # readers can't change the journal mode, and in wal mode commits don't block them
+            if self.sqlite_conf.get('wal'):
+                await self.pool.execute_fetchall('pragma journal_mode = wal;')
+
         return self.pool
 
 
+    async def get_readers(self) -> asyncio.Queue[aiosqlite.Connection]:
+        async with self.readers_lock:
+            if self.readers is None:
+                if self.sqlite_conf.get('wal'):
+                    await self.get_pool()
+
+                readers = asyncio.Queue()
+                for _ in range(self.n_readers):
+                    conn = await self.connect(read_only=True)
+                    self.reader_conns.append(conn)
+                    readers.put_nowait(conn)
+                self.readers = readers
+        return self.readers
+
+
+    @asynccontextmanager
+    async def acquire(self, write: bool=False) -> AsyncIterator[aiosqlite.Connection]:
+        """A read-only connection, or the writer for writes and when `readers` is 0."""
+        if write or not self.n_readers:
+            yield await self.get_pool()
+            return
+
+        readers = self.readers if self.readers is not None else await self.get_readers()
+        conn = await readers.get()
+        try:
+            yield conn
+        finally:
+            readers.put_nowait(conn)
+
+
     async def close_pool(self):
+        for conn in self.reader_conns:
+            await conn.close()
+        self.reader_conns = []
+        self.readers = None
+
         if self.pool is None:
             return
 
         await self.pool.close()
+        self.pool = None
 
 
 class SqliteQueryRunner(BaseQueryRunner):
@@ -54,29 +121,46 @@ class SqliteQueryRunner(BaseQueryRunner):
 
 
     async def run_query(self, query: str, params=None, commit=False, dict_row=True):
-        pool = await self.pool_manager.get_pool()
-
         if self.sql_echo:
             print('::SQL::', query)
             print('::PARAMS::', params)
 
-        async with pool.execute(query, params) as cursor:
-            if dict_row:
-                cursor.row_factory = row_factory
+        async with timed_acquire(self.pool_manager.acquire(write=commit)) as pool:
+            async with pool.execute(query, params) as cursor:
+                if dict_row:
+                    cursor.row_factory = row_factory
 
-            results = await cursor.fetchall()
+                results = await cursor.fetchall()
 
-            # commit comes after `fetchall` to support `returing` statements
-            if commit:
-                await pool.commit()
+                # commit comes after `fetchall` to support `returing` statements
+                if commit:
+                    await pool.commit()
 
-            return results
+                return results
 
 
     async def run_query_fast(self, query: str, params=None, commit=False):
         return await self.run_query(query, params, dict_row=False, commit=commit)
 
 
+    async def run_query_iter(self, query: str, params=None, dict_row=True, size: int=500):
+        if self.sql_echo:
+            print('::SQL::', query)
+            print('::PARAMS::', params)
+
+        async with self.pool_manager.acquire() as pool:
+            async with pool.execute(query, params) as cursor:
+                if dict_row:
+                    cursor.row_factory = row_factory
+
+                while rows := await cursor.fetchmany(size):
+                    yield rows
+
+
+    def is_connection_error(self, e: Exception) -> bool:
+        return isinstance(e, OSError) or getattr(e, 'sqlite_errorcode', None) == sqlite3.SQLITE_CANTOPEN
+
+
     async def run_query_many(self, query: str, params=None, commit=False, dict_row=True):
         pool: aiosqlite.Connection = await self.pool_manager.get_pool()
 
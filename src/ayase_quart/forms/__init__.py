@@ -143,6 +143,7 @@ class SearchForm(StripForm):
     is_sticky = BooleanField('Sticky', default=False, validators=[Optional()])
     is_not_sticky = BooleanField('Not sticky', default=False, validators=[Optional()])
     page = IntegerField(default=1, validators=[NumberRange(min=1)])
+    cursor = StringField(validators=[Optional(), Length(max=64)]) # used instead of `page` with [vanilla_search] keyset_pagination
     width = IntegerField('Media width', default=None, validators=[Optional(), NumberRange(0, 10_000)])
     wop = SelectField('Width cmp', default=None, choices=valid_numeric_cmp_choices, validate_choice=False)
     height = IntegerField('Media height', default=None, validators=[Optional(), NumberRange(0, 10_000)])
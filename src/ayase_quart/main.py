@@ -7,11 +7,15 @@ from quart_schema import RequestSchemaValidationError
 from werkzeug.exceptions import HTTPException
 
 from .blueprints import blueprints
-from .configs import QuartConfig, app_conf, mod_conf, index_search_conf, search_plugins_conf
+from .configs import QuartConfig, app_conf, mod_conf, index_search_conf, search_plugins_conf, catalog_snapshot_conf
 from .db import db_q
 from .db.redis import close_redis
+from .metrics import METRICS_ENABLED, metrics, record_request, record_request_start
+from .perf import SERVER_TIMING, add_server_timing, sample_server_timing
 from .moderation import fc, init_moderation
 from .render import render_controller
+from .render.catalog_snapshot import catalog_snapshots
+from .render.thread_offload import thread_offload_min_posts, thread_render_pool
 from .templates import render_constants, template_error_message
 from .utils.web_helpers import Quart2
 from .plugins.i_blueprints import register_blueprint_plugins
@@ -77,6 +81,33 @@ def create_app():
     if mod_conf['enabled']:
         app.before_serving(init_moderation)
         app.before_serving(fc.init)
+        app.after_serving(fc.stop)
+
+    if db_q.replicas.replicas:
+        app.before_serving(db_q.replicas.start) # stopped by close_dbs()
+
+    if db_q.slow_query_log:
+        app.before_serving(db_q.slow_query_log.start)
+        app.after_serving(db_q.slow_query_log.stop)
+
+    if catalog_snapshot_conf.get('enabled', False):
+        # after fc.init, refreshes read the moderation generation
+        app.before_serving(catalog_snapshots.start)
+        app.after_serving(catalog_snapshots.stop)
+
+    if thread_offload_min_posts:
+        app.before_serving(thread_render_pool.start)
+        app.after_serving(thread_render_pool.stop)
+
+    if METRICS_ENABLED:
+        app.before_serving(metrics.start)
+        app.after_serving(metrics.stop)
+        app.before_request(record_request_start)
+        app.after_request(record_request)
+
+    if SERVER_TIMING:
+        app.before_request(sample_server_timing)
+        app.after_request(add_server_timing)
 
     # https://quart.palletsprojects.com/en/latest/how_to_guides/startup_shutdown.html#startup-and-shutdown
     app.after_serving(close_dbs)
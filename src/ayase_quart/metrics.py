@@ -0,0 +1,139 @@
+from bisect import bisect_left
+from collections import defaultdict
+from time import perf_counter
+
+from quart import Response, g, request
+
+from .configs import metrics_conf
+from .utils.worker_files import WorkerFiles, read_worker_files
+
+"""
+Always on latency histograms and counters, exposed in the Prometheus text format at `/metrics`.
+
+Each worker records into its own memory, which costs a dict lookup and a bisect per observation,
+and writes its totals to `<dir>/<pid>.json` every `flush_interval` seconds.
+A scrape can land on any worker, so it flushes that worker and sums every worker's file.
+Files of workers that are gone are removed when a worker starts, which Prometheus reads as a counter reset.
+"""
+
+METRICS_ENABLED: bool = metrics_conf.get('enabled', False)
+METRICS_DIR: str = metrics_conf.get('dir', './data/metrics')
+FLUSH_INTERVAL: float = metrics_conf.get('flush_interval', 5.0)
+
+# upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, label names, help)
+METRICS = {
+    'aq_request_duration_seconds': ('histogram', ('endpoint', 'status'), 'Time to build a response, per route and status code.'),
+    'aq_stage_duration_seconds': ('histogram', ('topic', 'stage'), 'Time spent in each Perf checkpoint, e.g. query, filter_reported, render.'),
+    'aq_db_query_duration_seconds': ('histogram', ('kind',), 'Latency of prepared read queries, per query kind.'),
+    'aq_cache_requests_total': ('counter', ('cache', 'result'), 'Cache lookups, per cache, by hit or miss.'),
+}
+
+type MetricKey = tuple[str, ...] # (name, *label values)
+
+
+class Metrics(WorkerFiles):
+    def __init__(self, enabled: bool, metrics_dir: str, flush_interval: float):
+        super().__init__(metrics_dir, flush_interval)
+        self.enabled = enabled
+
+        self.counters: defaultdict[MetricKey, float] = defaultdict(float)
+        # count per bucket, then the count above the last bucket, then the sum
+        self.histograms: dict[MetricKey, list[float]] = {}
+
+    def inc(self, name: str, *labels: str, amount: float=1) -> None:
+        if self.enabled:
+            self.counters[(name, *labels)] += amount
+
+    def observe(self, name: str, value: float, *labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, *labels)
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def hit(self, cache: str, is_hit: bool) -> None:
+        self.inc('aq_cache_requests_total', cache, 'hit' if is_hit else 'miss')
+
+    def to_dict(self) -> dict:
+        return dict(
+            counters=list(self.counters.items()),
+            histograms=list(self.histograms.items()),
+        )
+
+    async def collect(self) -> tuple[dict[MetricKey, float], dict[MetricKey, list[float]]]:
+        """Every worker's counters and histograms, summed."""
+        await self.flush()
+
+        counters = defaultdict(float)
+        histograms = {}
+        for data in await read_worker_files(self.files_dir):
+            for key, value in data['counters']:
+                counters[tuple(key)] += value
+            for key, values in data['histograms']:
+                if (histogram := histograms.get(key := tuple(key))) is None:
+                    histograms[key] = values
+                    continue
+                for i, value in enumerate(values):
+                    histogram[i] += value
+        return counters, histograms
+
+    async def render(self) -> str:
+        """The Prometheus text exposition format."""
+        counters, histograms = await self.collect()
+
+        series = defaultdict(list)
+        for key in counters.keys() | histograms.keys():
+            series[key[0]].append(key)
+
+        lines = []
+        for name, (metric_type, label_names, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for key in sorted(series[name]):
+                labels = fmt_labels(label_names, key[1:])
+                if metric_type == 'counter':
+                    lines.append(f'{name}{{{labels}}} {fmt_value(counters[key])}')
+                    continue
+
+                histogram = histograms[key]
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, '+Inf'), histogram):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {fmt_value(cumulative)}')
+                lines.append(f'{name}_sum{{{labels}}} {fmt_value(histogram[-1])}')
+                lines.append(f'{name}_count{{{labels}}} {fmt_value(cumulative)}')
+        return '\n'.join(lines) + '\n'
+
+    async def respond(self) -> Response:
+        return Response(await self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def fmt_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    return ','.join(f'{name}="{escape_label_value(str(value))}"' for name, value in zip(names, values))
+
+
+def fmt_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+metrics = Metrics(METRICS_ENABLED, METRICS_DIR, FLUSH_INTERVAL)
+
+
+async def record_request_start() -> None:
+    g.request_start = perf_counter()
+
+
+async def record_request(response: Response) -> Response:
+    if (start := g.get('request_start')) is not None:
+        endpoint = request.url_rule.endpoint if request.url_rule else 'none'
+        metrics.observe('aq_request_duration_seconds', perf_counter() - start, endpoint, str(response.status_code))
+    return response
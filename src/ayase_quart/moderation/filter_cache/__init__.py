@@ -10,6 +10,9 @@ def get_filter_cache(mod_conf: dict) -> BaseFilterCache:
         case 'sqlite':
             from .sqlite_fc import FilterCacheSqlite
             return FilterCacheSqlite(mod_conf)
+        case 'bitmap':
+            from .bitmap_fc import FilterCacheBitmap
+            return FilterCacheBitmap(mod_conf)
         # case 'redis':
             # from .redis_fc import FilterCacheRedis
             # return FilterCacheRedis(mod_conf)
@@ -1,14 +1,40 @@
+import asyncio
+import fcntl
+import os
 import re
+import traceback
 from abc import ABC, abstractmethod
-from typing import Any, Generator
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from functools import partial
+from hashlib import blake2b
+from typing import Any, AsyncGenerator, Callable
 
 from ...boards import board_shortnames
-from ...db import db_q
+from ...db import db_m, db_q
+from ...metrics import metrics
 
-type NumOpGen = Generator[list[tuple[int, int]], Any, None]
+"""
+Population fills the cache with posts removed by upstream staff and posts matching `regex_filter`, by paging through
+every board of the archive. Boards are scanned `populate_concurrency` at a time, and each board's progress is
+checkpointed in `filter_cache_progress`, so an interrupted run picks up where it stopped.
+
+With `populate_in_background`, workers serve while the cache fills. Until it's done, removals are also checked against
+hidden reports in the moderation db. Deleted and regex matched posts are caught from the posts themselves by `should_filter()`,
+so all that's missing meanwhile is hiding replies to removed OPs that aren't on the same page.
+
+Regex matches are only valid for the patterns that found them. When `regex_filter` changes, the matches of the old
+patterns are dropped and the boards are scanned again with the new ones.
+"""
+
+FC_DEFAULT_POPULATE_CONCURRENCY = 4
+FC_DEFAULT_POPULATE_LOCK_PATH = './data/filter_cache/populate.lock'
+REGEX_SOURCE_PREFIX = 'regex:'
+
+type NumOpGen = AsyncGenerator[tuple[int, list[tuple[int, int]]], Any]
 
 async def board_numops_deleted_gen(board: str, after_num: int=0, limit: int=5000) -> NumOpGen:
-    """Returns all nums marked as deleted by upstream imageboard staff in the format [(num, op), ...]"""
+    """Returns all nums marked as deleted by upstream imageboard staff in the format (after_num, [(num, op), ...])"""
     while True:
         sql = f"""
         select num, op from `{board}`
@@ -20,63 +46,238 @@ async def board_numops_deleted_gen(board: str, after_num: int=0, limit: int=5000
         if not (rows := await db_q.query_tuple(sql)):
             break
         after_num = rows[-1][0]
-        yield rows
+        yield after_num, rows
 
-async def board_numops_regex_gen(board: str, pattern: str, after_num: int=0, limit: int=5000) -> NumOpGen:
+async def board_numops_regex_gen(board: str, regex_filter: 'RegexFilter', after_num: int=0, limit: int=5000) -> NumOpGen:
+    """Returns all nums whose comment matches `regex_filter` in the format (after_num, [(num, op), ...])
+
+    Comments are matched here rather than with sql `regexp`, so population and `should_filter()` agree on what matches,
+    and no regex extension is needed in the db.
+    `after_num` is the last num scanned, so batches without a match are yielded too.
+    """
     while True:
-        phg = db_q.Phg()
         sql = f"""
-        select num, op from `{board}`
+        select num, op, comment from `{board}`
         where
             comment is not null
-            and comment regexp {phg()}
             and num > {after_num}
         order by num asc limit {limit}
         ;"""
-        if not (rows := await db_q.query_tuple(sql, (pattern,))):
+        if not (rows := await db_q.query_tuple(sql)):
             break
         after_num = rows[-1][0]
-        yield rows
+        yield after_num, [(num, op) for num, op, comment in rows if regex_filter.search(comment)]
+
+class RegexFilter:
+    """`regex_filter` patterns compiled once into a single case insensitive alternation.
+
+    Posts are immutable once archived, so verdicts are memoized per `(board, num, comment)` in a bounded LRU.
+    The comment is part of the key, hashed, so a post whose comment does get edited upstream is matched again.
+    The memo belongs to this pattern set; a new set of patterns means a new `RegexFilter`.
+    """
+
+    def __init__(self, patterns: str | list[str], cache_size: int=100_000):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns = [pattern for pattern in patterns if pattern]
+        self.matcher = re.compile('|'.join(f'(?:{pattern})' for pattern in self.patterns), re.IGNORECASE) if self.patterns else None
+        self.cache_size = cache_size
+        self.verdicts: OrderedDict[tuple[str, int, int], bool] = OrderedDict()
+
+    def __bool__(self) -> bool:
+        return self.matcher is not None
+
+    @property
+    def version(self) -> str:
+        return blake2b(self.matcher.pattern.encode(), digest_size=8).hexdigest()
+
+    def search(self, comment: str) -> bool:
+        return self.matcher.search(comment) is not None
+
+    def is_match(self, post: dict) -> bool:
+        if not self.cache_size:
+            return self.search(post['comment'])
+
+        key = (post['board_shortname'], post['num'], hash(post['comment']))
+        if (verdict := self.verdicts.get(key)) is not None:
+            self.verdicts.move_to_end(key)
+            metrics.hit('regex_filter', True)
+            return verdict
+        metrics.hit('regex_filter', False)
+
+        verdict = self.verdicts[key] = self.search(post['comment'])
+        if len(self.verdicts) > self.cache_size:
+            self.verdicts.popitem(last=False)
+        return verdict
 
 class BaseFilterCache(ABC):
     def __init__(self, mod_conf: dict):
         self.enabled = mod_conf['enabled']
         self.remove_replies_to_hidden_op = mod_conf['remove_replies_to_hidden_op']
-        self.regex_filter = mod_conf['regex_filter']
+        self.regex_filter = RegexFilter(mod_conf['regex_filter'], mod_conf.get('regex_filter_cache_size', 100_000))
         self.hide_upstream_deleted_posts = mod_conf['hide_upstream_deleted_posts']
 
+        self.populate_concurrency: int = mod_conf.get('populate_concurrency', FC_DEFAULT_POPULATE_CONCURRENCY)
+        self.populate_in_background: bool = mod_conf.get('populate_in_background', True)
+        self.populate_lock_path = FC_DEFAULT_POPULATE_LOCK_PATH
+        self.populated = False
+        self.populate_task: asyncio.Task | None = None
+
         super().__init__()
 
-    async def init(self):
+    async def init(self, in_background: bool | None=None):
         if not self.enabled:
             return
         await self._create_cache()
 
-    async def get_deleted_numops_per_board_iter(self):
-        """Returns a tuple[str, tuple[int, int]]
+        if in_background is None:
+            in_background = self.populate_in_background
+        if in_background:
+            self.populate_task = asyncio.create_task(self.populate_or_log())
+            return
+        await self.populate()
+
+    async def stop(self) -> None:
+        """Interrupts a background population, the next start resumes it."""
+        if self.populate_task:
+            self.populate_task.cancel()
+            self.populate_task = None
+
+    async def populate(self) -> None:
+        async with self.populate_lock():
+            await self.clear_stale_regex_numops()
+            if not await self._is_cache_populated():
+                await self._populate_cache()
+        self.populated = True
+
+    async def populate_or_log(self) -> None:
+        try:
+            await self.populate()
+        except Exception as e:
+            print('Filter cache population failed, removals are checked against reports until the next start')
+            traceback.print_exception(e)
 
-        `(board, [(num, op), ...])`
+    @asynccontextmanager
+    async def populate_lock(self):
+        """Only one worker populates, the others wait for it and then find the cache populated."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.populate_lock_path)), exist_ok=True)
+        lock_fd = os.open(self.populate_lock_path, os.O_CREAT | os.O_RDWR)
+        try:
+            await asyncio.to_thread(fcntl.flock, lock_fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(lock_fd)
+
+    def get_populate_sources(self) -> list[tuple[str, Callable[..., NumOpGen]]]:
+        """`[(source, numops_gen), ...]` to populate each board from. The regex source is named after its patterns,
+        so changing `regex_filter` scans the boards again.
+        """
+        sources = []
+        if regex_source := self.get_regex_source():
+            sources.append((regex_source, partial(board_numops_regex_gen, regex_filter=self.regex_filter)))
+        if self.hide_upstream_deleted_posts:
+            sources.append(('deleted', board_numops_deleted_gen))
+        return sources
+
+    async def populate_boards(self, checkpoint: bool=True) -> None:
+        """Feeds every board's removed posts to `_insert_numops()`, `populate_concurrency` boards at a time.
+        With `checkpoint`, progress is saved after each batch is inserted, and finished boards are skipped.
         """
-        if not (self.hide_upstream_deleted_posts and board_shortnames):
+        sources = self.get_populate_sources()
+        semaphore = asyncio.Semaphore(self.populate_concurrency)
+
+        async def populate_board(board: str) -> None:
+            async with semaphore:
+                for source, numops_gen in sources:
+                    after_num, done = await self.get_progress(board, source) if checkpoint else (0, False)
+                    if done:
+                        continue
+                    insert_numops = self._insert_regex_numops if source.startswith(REGEX_SOURCE_PREFIX) else self._insert_numops
+                    async for after_num, numops in numops_gen(board, after_num=after_num):
+                        if numops:
+                            await insert_numops(board, numops)
+                        if checkpoint:
+                            await self.set_progress(board, source, after_num)
+                    if checkpoint:
+                        await self.set_progress(board, source, after_num, done=True)
+
+        await asyncio.gather(*(populate_board(board) for board in board_shortnames))
+
+    async def get_progress(self, board: str, source: str) -> tuple[int, bool]:
+        """`(after_num, done)`"""
+        phg = db_m.Phg()
+        sql = f'select after_num, done from filter_cache_progress where board_shortname = {phg()} and source = {phg()}'
+        if not (rows := await db_m.query_tuple(sql, params=[board, source])):
+            return 0, False
+        return rows[0][0], bool(rows[0][1])
+
+    async def set_progress(self, board: str, source: str, after_num: int, done: bool=False) -> None:
+        phg = db_m.Phg()
+        await db_m.query_tuple(
+            f"""insert into filter_cache_progress (board_shortname, source, after_num, done) values ({phg()}, {phg()}, {phg()}, {phg()})
+            on conflict(board_shortname, source) do update set after_num = excluded.after_num, done = excluded.done""",
+            params=[board, source, after_num, int(done)],
+            commit=True,
+        )
+
+    async def is_progress_done(self) -> bool:
+        """Whether every board has been populated from every current source."""
+        sources = [source for source, _ in self.get_populate_sources()]
+        if not (sources and board_shortnames):
+            return True
+        rows = await db_m.query_tuple('select board_shortname, source from filter_cache_progress where done = 1')
+        return {(board, source) for board in board_shortnames for source in sources} <= set(rows)
+
+    async def reset_progress(self) -> None:
+        await db_m.query_tuple('delete from filter_cache_progress', commit=True)
+
+    def get_regex_source(self) -> str | None:
+        """The progress source of the current patterns, named after them."""
+        return f'{REGEX_SOURCE_PREFIX}{self.regex_filter.version}' if self.regex_filter else None
+
+    async def clear_stale_regex_numops(self) -> None:
+        """Drops every regex match, and the regex progress, once a board was populated with other patterns than the current ones."""
+        rows = await db_m.query_tuple(f"select distinct source from filter_cache_progress where source like '{REGEX_SOURCE_PREFIX}%'")
+        if not {source for (source,) in rows} - {self.get_regex_source()}:
             return
-        for board in board_shortnames:
-            async for numops in board_numops_deleted_gen(board):
-                if not numops:
-                    continue
-                yield board, numops
+        await self._delete_regex_numops()
+        await db_m.query_tuple(f"delete from filter_cache_progress where source like '{REGEX_SOURCE_PREFIX}%'", commit=True)
 
-    async def get_numops_by_board_and_regex_iter(self):
-        """Returns a tuple[str, tuple[int, int]]
+    async def get_hidden_report_board_num_pairs(self, posts: list) -> set[tuple[str, int]]:
+        """Hidden reports among `posts`, straight from the moderation db. Used while the cache is being populated."""
+        board_and_nums = [(board, num) for board, nums in self.get_board_nums(posts).items() for num in nums]
 
-        `(board, [(num, op), ...])`
+        phg = db_m.Phg()
+        ph = ','.join(f'({phg()},{phg()})' for _ in range(len(board_and_nums)))
+        sql = f"""
+            select board_shortname, num
+            from report_parent
+            where public_access = 'h' and (board_shortname, num) in ({ph})
         """
-        if not (self.regex_filter and board_shortnames):
-            return
-        for board in board_shortnames:
-            async for numops in board_numops_regex_gen(board):
-                if not numops:
-                    continue
-                yield board, numops
+        rows = await db_m.query_tuple(sql, [item for bn in board_and_nums for item in bn])
+        return {(row[0], row[1]) for row in rows}
+
+    async def get_removed_board_num_pairs(self, posts: list) -> set[tuple[str, int]]:
+        board_num_pairs = await self.get_board_num_pairs(posts)
+        if not self.populated:
+            board_num_pairs = board_num_pairs | await self.get_hidden_report_board_num_pairs(posts)
+        return board_num_pairs
+
+    async def get_generation(self, board: str) -> int:
+        """Counter bumped on every moderation change to `board`. Used to invalidate rendered pages across workers."""
+        sql = f'select generation from board_generation where board_shortname = {db_m.Phg()()}'
+        if not (rows := await db_m.query_tuple(sql, params=[board])):
+            return 0
+        return rows[0][0]
+
+    async def bump_generation(self, board: str) -> None:
+        phg = db_m.Phg()
+        await db_m.query_tuple(
+            f"""insert into board_generation (board_shortname, generation) values ({phg()}, 1)
+            on conflict(board_shortname) do update set generation = generation + 1""",
+            params=[board],
+            commit=True,
+        )
 
     @abstractmethod
     async def _create_cache(self) -> None:
@@ -92,6 +293,19 @@ class BaseFilterCache(ABC):
     async def _populate_cache(self) -> None:
         raise NotImplementedError()
 
+    @abstractmethod
+    async def _insert_numops(self, board: str, numops: list[tuple[int, int]]) -> None:
+        """Add a batch of `populate_boards()` results"""
+        raise NotImplementedError()
+
+    async def _insert_regex_numops(self, board: str, numops: list[tuple[int, int]]) -> None:
+        """Add a batch of regex matches. Backends that can drop them apart from other removals keep them apart."""
+        await self._insert_numops(board, numops)
+
+    async def _delete_regex_numops(self) -> None:
+        """Remove every regex match added by `_insert_regex_numops()`."""
+        pass
+
     @abstractmethod
     async def _teardown(self) -> None:
         """Remove all inserts"""
@@ -119,6 +333,16 @@ class BaseFilterCache(ABC):
         """`set[('g', 12345), ('x', 6789), ...]`"""
         raise NotImplementedError()
 
+    def get_board_nums(self, posts: list[dict]) -> dict[str, set[int]]:
+        """Every num to check for `posts`, per board. Thread nums are included when replies to hidden OPs are removed."""
+        board_nums = defaultdict(set)
+        for post in posts:
+            nums = board_nums[post['board_shortname']]
+            nums.add(post['num'])
+            if self.remove_replies_to_hidden_op:
+                nums.add(post['thread_num'])
+        return board_nums
+
     def should_filter(self, board_num_pairs: set, post: dict) -> bool:
         return (
             (self.remove_replies_to_hidden_op and (post['board_shortname'], post['thread_num']) in board_num_pairs)
@@ -127,7 +351,7 @@ class BaseFilterCache(ABC):
             or
             (self.hide_upstream_deleted_posts and post['deleted'])
             or
-            (self.regex_filter and post['comment'] and re.search(self.regex_filter, post['comment'], re.IGNORECASE))
+            (self.regex_filter and post['comment'] and self.regex_filter.is_match(post))
         )
 
     async def filter_reported_posts(self, posts: list[dict], is_authority: bool=False) -> list:
@@ -137,7 +361,25 @@ class BaseFilterCache(ABC):
         if not posts:
             return posts
 
-        board_num_pairs = await self.get_board_num_pairs(posts)
+        board_num_pairs = await self.get_removed_board_num_pairs(posts)
+        return self.filter_posts(board_num_pairs, posts, is_authority)
+
+    async def filter_reported_pages(self, post_lists: list[list[dict]], is_authority: bool=False) -> list[list[dict]]:
+        """`filter_reported_posts()` for each list of posts on a page, e.g. the threads of an index page,
+        with a single removal check for the whole page.
+        """
+        if not self.enabled:
+            return post_lists
+
+        if not (posts := [post for posts in post_lists for post in posts]):
+            return post_lists
+
+        board_num_pairs = await self.get_removed_board_num_pairs(posts)
+        return [self.filter_posts(board_num_pairs, posts, is_authority) for posts in post_lists]
+
+    def filter_posts(self, board_num_pairs: set, posts: list[dict], is_authority: bool) -> list:
+        if not posts:
+            return posts
 
         note = 'Only visible to AQ staff.'
 
@@ -0,0 +1,233 @@
+import mmap
+import os
+import struct
+import time
+from collections import defaultdict
+
+import aiofiles
+
+from ...db import db_m
+from ...utils import make_src_path, read_file
+from ...utils.bitmap import Bitmap
+from .base_fc import BaseFilterCache
+
+"""
+Keeps each board's removed nums, and its removed OP nums, as compressed bitmaps in worker memory.
+Checking a page is a few dict lookups and bisects per post, with no db or network hop, and no false positives.
+
+Workers start from a snapshot of the bitmaps, mmapped so its containers are only copied once they change.
+Only one worker builds the snapshot when there is none, the others wait on a file lock and then load it.
+
+Moderation changes go to `filter_bitmap_log` in the moderation db. The worker making a change applies it right away,
+the others replay the log at most every `sync_interval` seconds, so they trail by up to that long.
+Every `snapshot_every` replayed changes, a worker writes a fresh snapshot.
+
+A snapshot holds regex matches, so it's only loaded with the `regex_filter` patterns it was built with.
+Otherwise it's rebuilt, and the whole log is replayed over it to restore moderation changes.
+"""
+
+FC_DEFAULT_SNAPSHOT_PATH = './data/filter_cache/bitmaps.snapshot'
+FC_DEFAULT_SYNC_INTERVAL = 1.0
+FC_DEFAULT_SNAPSHOT_EVERY = 10_000
+
+# magic, number of boards, last log id in the snapshot, regex_filter version
+SNAPSHOT_HEADER = struct.Struct('=4sIQ8s')
+# length of the board name that follows
+SNAPSHOT_BOARD = struct.Struct('=I')
+SNAPSHOT_MAGIC = b'AQF2'
+
+
+class FilterCacheBitmap(BaseFilterCache):
+    def __init__(self, mod_conf: dict):
+        super().__init__(mod_conf)
+        bitmap_conf = mod_conf.get('bitmap', {})
+        self.snapshot_path: str = bitmap_conf.get('snapshot_path', FC_DEFAULT_SNAPSHOT_PATH)
+        self.sync_interval: float = bitmap_conf.get('sync_interval', FC_DEFAULT_SYNC_INTERVAL)
+        self.snapshot_every: int = bitmap_conf.get('snapshot_every', FC_DEFAULT_SNAPSHOT_EVERY)
+        self.populate_lock_path = f'{self.snapshot_path}.lock'
+
+        self.removed: defaultdict[str, Bitmap] = defaultdict(Bitmap)
+        self.ops: defaultdict[str, Bitmap] = defaultdict(Bitmap)
+        self.last_log_id = 0
+        self.last_sync = 0.0
+        self.n_unsnapshotted = 0
+        self.snapshot: mmap.mmap | None = None # kept open while bitmap containers point into it
+
+
+    async def _create_cache(self) -> None:
+        for sql in read_file(make_src_path('moderation', 'sql', 'filter_bitmap_log.sql')).split(';'):
+            if sql.strip():
+                await db_m.query_dict(sql + ';', commit=True)
+
+
+    async def populate(self) -> None:
+        async with self.populate_lock():
+            if not self.load_snapshot():
+                self.last_log_id = 0
+                await self._populate_cache()
+                await self.sync(force=True)
+                await self.write_snapshot()
+
+        await self.sync(force=True)
+        self.populated = True
+
+
+    async def _is_cache_populated(self) -> bool:
+        return os.path.isfile(self.snapshot_path)
+
+
+    async def _populate_cache(self) -> None:
+        # nothing to resume from, the bitmaps only outlive the process in a finished snapshot
+        await self.populate_boards(checkpoint=False)
+
+        rows = await db_m.query_tuple("select board_shortname, num, op from report_parent where public_access = 'h'")
+        for board, num, op in rows:
+            self.apply(board, num, op, True)
+
+
+    async def _insert_numops(self, board: str, numops: list[tuple[int, int]]) -> None:
+        for num, op in numops:
+            self.apply(board, num, op, True)
+
+
+    async def _teardown(self) -> None:
+        await db_m.query_tuple('delete from filter_bitmap_log', commit=True)
+        if os.path.isfile(self.snapshot_path):
+            os.remove(self.snapshot_path)
+        self.removed.clear()
+        self.ops.clear()
+        self.last_log_id = 0
+        self.n_unsnapshotted = 0
+
+
+    def apply(self, board: str, num: int, op: int, removed: bool) -> None:
+        if removed:
+            self.removed[board].add(num)
+            if op:
+                self.ops[board].add(num)
+            return
+
+        if bitmap := self.removed.get(board):
+            bitmap.discard(num)
+        if bitmap := self.ops.get(board):
+            bitmap.discard(num)
+
+
+    async def sync(self, force: bool=False) -> None:
+        """Replays changes other workers logged since the last sync."""
+        now = time.monotonic()
+        if not force and (not self.populated or now - self.last_sync < self.sync_interval):
+            return
+        self.last_sync = now
+
+        sql = f"""
+            select filter_bitmap_log_id, board_shortname, num, op, removed
+            from filter_bitmap_log
+            where filter_bitmap_log_id > {db_m.Phg()()}
+            order by filter_bitmap_log_id asc
+        """
+        if not (rows := await db_m.query_tuple(sql, params=[self.last_log_id])):
+            return
+
+        for _, board, num, op, removed in rows:
+            self.apply(board, num, op, removed)
+        self.last_log_id = rows[-1][0]
+
+        self.n_unsnapshotted += len(rows)
+        if self.snapshot_every and self.n_unsnapshotted >= self.snapshot_every:
+            await self.write_snapshot()
+
+
+    def get_regex_version(self) -> bytes:
+        return bytes.fromhex(self.regex_filter.version) if self.regex_filter else bytes(8)
+
+
+    def load_snapshot(self) -> bool:
+        if not os.path.isfile(self.snapshot_path) or not os.path.getsize(self.snapshot_path):
+            return False
+
+        with open(self.snapshot_path, 'rb') as f:
+            snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(snapshot)
+
+        magic, n_boards, last_log_id, regex_version = SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC or regex_version != self.get_regex_version():
+            buffer.release()
+            snapshot.close()
+            return False
+        offset = SNAPSHOT_HEADER.size
+
+        removed = defaultdict(Bitmap)
+        ops = defaultdict(Bitmap)
+        for _ in range(n_boards):
+            (name_size,) = SNAPSHOT_BOARD.unpack_from(buffer, offset)
+            offset += SNAPSHOT_BOARD.size
+            board = bytes(buffer[offset:offset + name_size]).decode()
+            offset += name_size + (-name_size % 4)
+
+            removed[board], offset = Bitmap.from_buffer(buffer, offset)
+            ops[board], offset = Bitmap.from_buffer(buffer, offset)
+
+        self.removed = removed
+        self.ops = ops
+        self.last_log_id = last_log_id
+        self.n_unsnapshotted = 0
+        self.snapshot = snapshot
+        return True
+
+
+    async def write_snapshot(self) -> None:
+        boards = sorted(self.removed.keys() | self.ops.keys())
+        parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(boards), self.last_log_id, self.get_regex_version())]
+        for board in boards:
+            name = board.encode()
+            parts.append(SNAPSHOT_BOARD.pack(len(name)))
+            parts.append(name + b'\0' * (-len(name) % 4))
+            parts.append(self.removed[board].to_bytes())
+            parts.append(self.ops[board].to_bytes())
+
+        # replaced in one go, so workers never map a half written snapshot
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(b''.join(parts))
+        os.replace(tmp_path, self.snapshot_path)
+        self.n_unsnapshotted = 0
+
+
+    async def log_change(self, board: str, num: int, op: int, removed: bool) -> None:
+        phg = db_m.Phg()
+        await db_m.query_tuple(
+            f'insert into filter_bitmap_log (board_shortname, num, op, removed) values ({phg()}, {phg()}, {phg()}, {phg()})',
+            params=[board, num, op, int(removed)],
+            commit=True,
+        )
+        self.apply(board, num, op, removed)
+
+
+    async def get_op_thread_removed_count(self, board: str) -> int:
+        await self.sync()
+        return len(bitmap) if (bitmap := self.ops.get(board)) else 0
+
+
+    async def get_board_num_pairs(self, posts: list) -> set[tuple[str, int]]:
+        await self.sync()
+        board_num_pairs = set()
+        for board, nums in self.get_board_nums(posts).items():
+            if bitmap := self.removed.get(board):
+                board_num_pairs.update((board, num) for num in nums if num in bitmap)
+        return board_num_pairs
+
+
+    async def is_post_removed(self, board: str, num: int) -> bool:
+        await self.sync()
+        return bool((bitmap := self.removed.get(board)) and num in bitmap)
+
+
+    async def insert_post(self, board: str, num: int, op: int):
+        await self.log_change(board, num, op, True)
+        await self.bump_generation(board)
+
+
+    async def delete_post(self, board: str, num: int, op: int):
+        await self.log_change(board, num, op, False)
+        await self.bump_generation(board)
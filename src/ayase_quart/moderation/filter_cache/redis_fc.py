@@ -1,5 +1,6 @@
+import asyncio
 import os
-from collections import defaultdict, Counter
+from collections import defaultdict
 from functools import cache
 from dataclasses import dataclass, field
 from itertools import product, batched
@@ -7,8 +8,8 @@ from typing import Literal
 
 import aiofiles
 from coredis import Redis
-from coredis.pipeline import Pipeline
 from coredis.modules.filters import BloomFilter, CuckooFilter
+from coredis.pipeline import Pipeline
 
 from ...configs import mod_conf
 from ...boards import board_shortnames
@@ -117,8 +118,9 @@ class FilterCacheRedis(BaseFilterCache):
         self.cf = RedisFilter(CuckooFilter(client=self.redis), self.redis)
 
     async def _create_cache(self) -> None:
-        if await self._is_cache_populated():
-            return
+        async with self.redis:
+            if await self.redis.keys(f'{FC_KEY_PREFIX}*'):
+                return
         for board in board_shortnames:
             await self.bf.reserve(
                 board,
@@ -132,33 +134,13 @@ class FilterCacheRedis(BaseFilterCache):
                 bucketsize=mod_r_conf.get('cuckoo_bucket', CF_DEFAULT_BUCKET),
                 maxiterations=mod_r_conf.get('cuckoo_iter_max', CF_DEFAULT_ITER_MAX),
             )
-        await self._populate_cache()
 
     async def _is_cache_populated(self) -> bool:
-        async with self.redis:
-            if not (keys := await self.redis.keys(f'{FC_KEY_PREFIX}*')):
-                return False
-            return len(keys) > 0
+        # hidden reports are copied last, under a progress row of their own
+        return await self.is_progress_done() and (await self.get_progress('', 'reports'))[1]
 
     async def _populate_cache(self) -> None:
-        iter_funcs = [
-            self.get_numops_by_board_and_regex_iter,
-            self.get_deleted_numops_per_board_iter,
-        ]
-        board_del_ops = Counter()
-
-        for iter_func in iter_funcs:
-            async for board, numops in iter_func():
-                board_del_ops[board] += sum(1 for _, op in numops if op == 1)
-                await self.bf.bulk_add(board, [num for num, _ in numops])
-
-        async with self.redis:
-            async with self.redis.pipeline(transaction=True) as pipe:
-                pipe: Pipeline
-                for board, del_ops in board_del_ops.items():
-                    pipe.incrby(fmt_op_count_key(board), del_ops)
-        
-        # auto execute()s on context exit in coredis 6.x
+        await self.populate_boards()
 
         sql = """
         select board_shortname, num
@@ -167,14 +149,19 @@ class FilterCacheRedis(BaseFilterCache):
             and mod_status = 'o'
         group by board_shortname, num
         ;"""
-        if not (rows := await db_m.query_tuple(sql)):
-            return
         board_nums = defaultdict(list)
-        for board, num in rows:
+        for board, num in await db_m.query_tuple(sql):
             board_nums[board].append(num)
         for board, nums in board_nums.items():
             for batch in batched(nums, FILTER_INSERT_BATCH):
                 await self.cf.bulk_add(board, batch)
+        await self.set_progress('', 'reports', 0, done=True)
+
+    async def _insert_numops(self, board: str, numops: list[tuple[int, int]]) -> None:
+        await self.bf.bulk_add(board, [num for num, _ in numops])
+        if del_ops := sum(1 for _, op in numops if op == 1):
+            async with self.redis:
+                await self.redis.incrby(fmt_op_count_key(board), del_ops)
 
     async def export_dump(self) -> None:
         for board, rfilter in product(board_shortnames, (self.bf, self.cf)):
@@ -190,6 +177,7 @@ class FilterCacheRedis(BaseFilterCache):
         async with self.redis:
             if keys := await self.redis.keys(f'{self.FC_PREFIX}*'):
                 await self.redis.delete(*keys)
+        await self.reset_progress()
 
     async def get_op_thread_removed_count(self, board: str) -> int:
         async with self.redis:
@@ -199,23 +187,46 @@ class FilterCacheRedis(BaseFilterCache):
 
     # TODO: need to thread in hide_deleted, hide_reported and hide_reported_after_n
     async def get_board_num_pairs(self, posts: list[dict], hide_deleted: bool=True, hide_reported: bool=True) -> set[tuple[str, int]]:
+        """Checks every board's nums against both filters in one pipelined round trip,
+        then confirms the maybes against the databases.
+        """
         if not posts or not (hide_deleted or hide_reported):
             return set()
-        board_nums = defaultdict(list)
-        for post in posts:
-            board_nums[post['board_shortname']].append(post['num'])
+        board_nums = {board: list(nums) for board, nums in self.get_board_nums(posts).items()}
+
+        async with self.redis:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe: Pipeline
+                requests = []
+                for board, nums in board_nums.items():
+                    nums_bytes = [u32_to_bytes(num) for num in nums]
+                    requests.append((
+                        board,
+                        pipe.bf.mexists(self.bf.fmt_key(board), nums_bytes) if hide_deleted else None,
+                        pipe.cf.mexists(self.cf.fmt_key(board), nums_bytes) if hide_reported else None,
+                    ))
+        # auto execute()s on context exit in coredis 6.x
+
+        confirms = []
+        for board, bf_request, cf_request in requests:
+            nums = board_nums[board]
+            if bf_request and (maybe_nums := [num for num, f_res in zip(nums, await bf_request) if f_res]):
+                confirms.append(self.confirm_deleted(board, maybe_nums))
+            if cf_request and (maybe_nums := [num for num, f_res in zip(nums, await cf_request) if f_res]):
+                confirms.append(self.confirm_reported(board, maybe_nums))
 
         board_num_pairs = set()
-        for board, nums in board_nums.items():
-            if hide_deleted:
-                board_num_pairs |= await self.get_deleted(board, nums)
-            if hide_reported:
-                board_num_pairs |= await self.get_reported(board, nums)
+        for pairs in await asyncio.gather(*confirms):
+            board_num_pairs |= pairs
         return board_num_pairs
 
     async def get_deleted(self, board: str, nums: list[int]) -> set[tuple[str, int]]:
         if not (maybe_nums := await self.bf.get_maybe_nums(board, nums)):
             return set()
+        return await self.confirm_deleted(board, maybe_nums)
+
+    async def confirm_deleted(self, board: str, maybe_nums: list[int]) -> set[tuple[str, int]]:
+        """Drops the bloom filter's false positives."""
         sql = f'select num from `{board}` where deleted = 1 and num in ({db_q.Phg().qty(len(maybe_nums))});'
         return {
             (board, row[0]) for row in
@@ -223,8 +234,12 @@ class FilterCacheRedis(BaseFilterCache):
         }
 
     async def get_reported(self, board: str, nums: list[int]) -> set[tuple[str, int]]:
-        if not (maybe_nums := await self.bf.get_maybe_nums(board, nums)):
+        if not (maybe_nums := await self.cf.get_maybe_nums(board, nums)):
             return set()
+        return await self.confirm_reported(board, maybe_nums)
+
+    async def confirm_reported(self, board: str, maybe_nums: list[int]) -> set[tuple[str, int]]:
+        """Drops the cuckoo filter's false positives."""
         phg = db_m.Phg()
         sql = f"""
         select num from report_parent where
@@ -261,9 +276,11 @@ class FilterCacheRedis(BaseFilterCache):
         if op == 1:
             async with self.redis:
                 await self.redis.incr(fmt_op_count_key(board))
+        await self.bump_generation(board)
 
     async def delete_post(self, board: str, num: int, op: int) -> None:
         # no deleting from bloom filter, rebuild from scratch
         if op == 1:
             async with self.redis:
                 await self.redis.decr(fmt_op_count_key(board))
+        await self.bump_generation(board)
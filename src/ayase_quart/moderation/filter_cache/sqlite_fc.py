@@ -5,7 +5,7 @@ from ...utils import make_src_path, read_file
 from .base_fc import BaseFilterCache
 
 class FilterCacheSqlite(BaseFilterCache):
-    """Uses a single table in the moderation sqlite database."""
+    """Uses two tables in the moderation sqlite database, `board_nums_cache`, and `board_regex_nums_cache` for regex matches."""
 
     def __init__(self, mod_conf: dict):
         super().__init__(mod_conf)
@@ -21,8 +21,8 @@ class FilterCacheSqlite(BaseFilterCache):
 
 
     async def _is_cache_populated(self) -> bool:
-        bn_count = await db_m.query_tuple("select count(*) from board_nums_cache")
-        return bool(bn_count[0][0])
+        # hidden reports are copied last, under a progress row of their own
+        return await self.is_progress_done() and (await self.get_progress('', 'reports'))[1]
 
 
     async def _populate_cache(self) -> None:
@@ -32,39 +32,54 @@ class FilterCacheSqlite(BaseFilterCache):
         It's also better than adding extra filters (is deleted, and regexes) in our database queries.
         We will populate our cache with reported posts only.
         """
+        await self.populate_boards()
+
         pool: Connection = await db_m.pool_manager.get_pool()
-        iter_funcs = [
-            self.get_numops_by_board_and_regex_iter,
-            self.get_deleted_numops_per_board_iter,
-        ]
-        for iter_func in iter_funcs:
-            async for board_and_numops in iter_func():
-                if not (board_and_numops and board_and_numops[1]):
-                    continue
+        rows = await db_m.query_tuple("select board_shortname, num, op from report_parent where public_access = 'h'")
+        await pool.executemany("insert or ignore into board_nums_cache (board_shortname, num, op) values (?, ?, ?)", rows)
+        await pool.commit()
+        await self.set_progress('', 'reports', 0, done=True)
+
 
-                params = [(board_and_numops[0], numop[0], numop[1]) for numop in board_and_numops[1]]
-                await pool.executemany("insert or ignore into board_nums_cache (board_shortname, num, op) values (?, ?, ?)", params)
-                await pool.commit()
+    async def _insert_numops(self, board: str, numops: list[tuple[int, int]]) -> None:
+        pool: Connection = await db_m.pool_manager.get_pool()
+        await pool.executemany("insert or ignore into board_nums_cache (board_shortname, num, op) values (?, ?, ?)", [(board, num, op) for num, op in numops])
+        await pool.commit()
+
+
+    async def _insert_regex_numops(self, board: str, numops: list[tuple[int, int]]) -> None:
+        pool: Connection = await db_m.pool_manager.get_pool()
+        await pool.executemany("insert or ignore into board_regex_nums_cache (board_shortname, num, op) values (?, ?, ?)", [(board, num, op) for num, op in numops])
+        await pool.commit()
 
-            rows = await db_m.query_tuple("select board_shortname, op, group_concat(distinct num) as nums from report_parent group by board_shortname, op")
-            await pool.executemany("insert or ignore into board_nums_cache (board_shortname, op, num) values (?, ?, ?)", rows)
-            await pool.commit()
+
+    async def _delete_regex_numops(self) -> None:
+        await db_m.query_tuple('delete from board_regex_nums_cache', commit=True)
 
 
     async def _teardown(self):
-        sql = """delete from board_nums_cache"""
         pool: Connection = await db_m.pool_manager.get_pool()
-        await pool.execute(sql)
+        await pool.execute("""delete from board_nums_cache""")
+        await pool.execute("""delete from board_regex_nums_cache""")
         await pool.commit()
+        await self.reset_progress()
 
 
     async def get_op_thread_removed_count(self, board: str) -> int:
-        rows = await db_m.query_tuple(f'select count(*) from board_nums_cache where board_shortname = {db_m.Phg()()} and op = 1', params=[board])
+        phg = db_m.Phg()
+        sql = f"""
+            select count(*) from (
+                select num from board_nums_cache where board_shortname = {phg()} and op = 1
+                union
+                select num from board_regex_nums_cache where board_shortname = {phg()} and op = 1
+            )
+        """
+        rows = await db_m.query_tuple(sql, params=[board, board])
         return rows[0][0]
 
 
     async def get_board_num_pairs(self, posts: list) -> set[tuple[str, int]]:
-        board_and_nums = [(p['board_shortname'], p['num']) for p in posts]
+        board_and_nums = [(board, num) for board, nums in self.get_board_nums(posts).items() for num in nums]
 
         phg = db_m.Phg()
         ph = ','.join(f'({phg()},{phg()})' for _ in range(len(board_and_nums)))
@@ -75,16 +90,25 @@ class FilterCacheSqlite(BaseFilterCache):
             select board_shortname, num
             from board_nums_cache
             where (board_shortname, num) in ({ph})
+            union
+            select board_shortname, num
+            from board_regex_nums_cache
+            where (board_shortname, num) in ({ph})
         """
-        rows = await db_m.query_tuple(sql, expanded)
+        rows = await db_m.query_tuple(sql, expanded + expanded)
 
         return {(row[0], row[1]) for row in rows}
 
 
     async def is_post_removed(self, board: str, num: int) -> bool:
         phg = db_m.Phg()
-        sql = f"""select num from board_nums_cache where board_shortname = {phg()} and num = {phg()}"""
-        row = await db_m.query_tuple(sql, params=[board, num])
+        sql = f"""
+            select num from board_nums_cache where board_shortname = {phg()} and num = {phg()}
+            union all
+            select num from board_regex_nums_cache where board_shortname = {phg()} and num = {phg()}
+            limit 1
+        """
+        row = await db_m.query_tuple(sql, params=[board, num, board, num])
         if not row:
             return False
         return True
@@ -97,6 +121,7 @@ class FilterCacheSqlite(BaseFilterCache):
             params=[board, num, op],
             commit=True,
         )
+        await self.bump_generation(board)
 
 
     async def delete_post(self, board: str, num: int, op: int):
@@ -106,3 +131,4 @@ class FilterCacheSqlite(BaseFilterCache):
             params=[board, num, op],
             commit=True,
         )
+        await self.bump_generation(board)
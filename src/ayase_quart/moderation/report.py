@@ -344,9 +344,9 @@ async def delete_post_from_index_if_applicable(board: str, post: dict, remove_en
     board_int = board_2_int(board)
 
     if remove_entire_thread_if_post_is_op and post['op']:
-        rows = await db_q.query_dict(f"""select doc_id from `{board}` where thread_num = {db_q.Phg()()}""", params=(post['num'],))
+        rows = await db_q.query_dict(f"""select doc_id from `{board}` where thread_num = {db_q.Phg()()}""", params=(post['num'],), primary=True)
     else:
-        rows = await db_q.query_dict(f"""select doc_id from `{board}` where num = {db_q.Phg()()}""", params=(post['num'],))
+        rows = await db_q.query_dict(f"""select doc_id from `{board}` where num = {db_q.Phg()()}""", params=(post['num'],), primary=True)
 
     pk_ids = [board_int_doc_id_2_pk(board_int, row['doc_id']) for row in rows]
     if not pk_ids:
@@ -367,7 +367,7 @@ async def delete_post(current_usr: User, board_shortname: str, num: int, report_
 
     flash_msg = ''
 
-    post = await get_post(board_shortname, num)
+    post = await get_post(board_shortname, num, primary=True) # a lagging replica may not have the post yet
     if not post:
         # This block shouldn't be executed much, if at all.
         # We delete the post from the index, THEN delete the post from the database.
@@ -388,6 +388,7 @@ async def delete_post(current_usr: User, board_shortname: str, num: int, report_
 
     # Old Note: do not delete the report here. It is still needed to filter outgoing posts from full text search.
     flash_msg += (await move_post_to_delete_table(post))
+    await fc.bump_generation(board_shortname)
 
     full_del, prev_del = post_files_delete(post)
     flash_msg += ' Deleted full media.' if full_del else ' Did not delete full media.'
@@ -0,0 +1,4 @@
+CREATE TABLE IF NOT EXISTS board_generation (
+    board_shortname TEXT NOT NULL PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0
+);
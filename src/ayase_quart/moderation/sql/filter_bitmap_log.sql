@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS filter_bitmap_log (
+    filter_bitmap_log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    board_shortname TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    op INTEGER NOT NULL,
+    removed INTEGER NOT NULL -- 1 when the post was removed, 0 when it was restored
+);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS filter_cache_progress (
+    board_shortname TEXT NOT NULL,
+    source TEXT NOT NULL,
+    after_num INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    UNIQUE(board_shortname, source)
+);
@@ -184,6 +184,9 @@ class Pagination(object):
             **href**: Add custom href for links - this supports forms \
             with post method. It MUST contain {0} to format page number
 
+            **next_href**: href of the next page link, overrides **href** \
+            for that one link, e.g. to carry a cursor
+
             **show_single_page**: decide whether or not a single page \
             returns pagination
 
@@ -255,6 +258,7 @@ class Pagination(object):
                 self.alignment = " justify-content-end"
 
         self.href = kwargs.get("href")
+        self.next_href = kwargs.get("next_href")
         self.anchor = kwargs.get("anchor")
         self.show_single_page = get_param_value("show_single_page", kwargs, False)
 
@@ -323,7 +327,7 @@ class Pagination(object):
     @property
     def next_page(self):
         if self.has_next:
-            url = self.page_href(self.page + 1)
+            url = self.next_href or self.page_href(self.page + 1)
             args = (url, self.next_label, self.next_rel)
 
             return self.next_page_fmt.format(*args)
@@ -1,10 +1,20 @@
+import re
+from functools import cache
+from random import random
 from time import perf_counter
 from logging import getLogger
 
-from .configs import TESTING
+from quart import Response, g
+
+from .configs import TESTING, metrics_conf
+from .metrics import METRICS_ENABLED, metrics
 
 logger = getLogger('perf')
 
+# checkpoints of sampled requests are sent as a Server-Timing header, for browser devtools and CDN logs
+SERVER_TIMING: bool = metrics_conf.get('server_timing', False)
+SERVER_TIMING_SAMPLE_RATE: float = metrics_conf.get('server_timing_sample_rate', 1.0)
+
 class DummyPerf:
     __slots__ = ()
     def __init__(self, topic: str=None): pass
@@ -12,12 +22,17 @@ class DummyPerf:
     def __repr__(self) -> str: return ''
     def emit(self) -> None: pass
 
-class RealPerf:
+class MetricsPerf:
+    """Checkpoints go to the `aq_stage_duration_seconds` histogram when emitted,
+    and to the Server-Timing header of sampled requests.
+    """
     __slots__ = ('previous', 'checkpoints', 'topic')
     def __init__(self, topic: str=None):
         self.topic = topic
         self.checkpoints = []
         self.previous = perf_counter()
+        if SERVER_TIMING and g.get('server_timing'):
+            g.perf = self
 
     def check(self, name: str=""):
         now = perf_counter()
@@ -25,6 +40,22 @@ class RealPerf:
         self.previous = now
         self.checkpoints.append((name, elapsed))
 
+    def __repr__(self) -> str: return ''
+
+    def emit(self) -> None:
+        for name, elapsed in self.checkpoints:
+            metrics.observe('aq_stage_duration_seconds', elapsed, self.topic or '', name)
+
+    def server_timing(self) -> str:
+        total = sum(elapsed for _, elapsed in self.checkpoints)
+        return ', '.join(
+            f'{fmt_server_timing_name(name)};dur={elapsed * 1000:.2f}'
+            for name, elapsed in (*self.checkpoints, ('total', total))
+        )
+
+class RealPerf(MetricsPerf):
+    __slots__ = ()
+
     def __repr__(self) -> str:
         total = sum(point[1] for point in self.checkpoints)
         longest = max(max(len(point[0]) for point in self.checkpoints), 5) # 5 is len of 'total'
@@ -37,7 +68,24 @@ class RealPerf:
     # TODO: fix logging situation
     # nothing shows up even with hypercorn's default logging INFO level
     def emit(self) -> None:
+        super().emit()
         # logger.info(self)
         print(self)
 
-Perf = RealPerf if TESTING else DummyPerf
+Perf = RealPerf if TESTING else MetricsPerf if METRICS_ENABLED or SERVER_TIMING else DummyPerf
+
+
+@cache
+def fmt_server_timing_name(name: str) -> str:
+    """Server-Timing names are tokens, e.g. 'generate index' -> 'generate_index'."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name) or 'stage'
+
+
+async def sample_server_timing() -> None:
+    g.server_timing = random() < SERVER_TIMING_SAMPLE_RATE
+
+
+async def add_server_timing(response: Response) -> Response:
+    if perf := g.get('perf'):
+        response.headers['Server-Timing'] = perf.server_timing()
+    return response
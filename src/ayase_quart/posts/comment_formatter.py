@@ -0,0 +1,140 @@
+import re
+from html import escape
+
+"""
+Formats yotsuba comments (raw text, e.g. 4chan's) into html in a single scan.
+
+It produces the same html as running these passes one after the other over the whole comment:
+html escaping, quotelinks, bbcode, greentext, clickable links and newlines.
+
+The comment is escaped once, then split on `token_re` into the text between quotelinks, bbcode tags and greentext lines.
+Links can't cross any of the tags those passes would have inserted, since every tag starts with `<`,
+so linking each piece of text on its own gives the same result as linking the whole comment.
+Unpaired bbcode tags stay in the text, like the regex passes left them.
+"""
+
+link_re = re.compile(r'(https?://(?:[a-z0-9\-]+\.)+[a-z]{2,}(?:(?:\:|/)[^\s<>\"\']*)?)', re.IGNORECASE)
+punc_ending_re = re.compile(r'^(.*?)(?=((?:\.|,)+(?:\s|$)))', re.IGNORECASE)
+def link_t(match: re.Match) -> str:
+    url: str = match.group(1)
+    if punc_groups := punc_ending_re.match(url):
+        url = punc_groups.group(1)
+        punc = punc_groups.group(2)
+        return f'<a href="{url}">{url}</a>{punc}'
+    return f'<a href="{url}">{url}</a>'
+
+
+def clickable_links(comment: str) -> str:
+    return link_re.sub(link_t, comment)
+
+
+# groups: token, quotelink post_num, bbcode slash, bbcode tag
+# newlines are only tokens where a line could be greentext, the others stay in the text
+token_re = re.compile(r'(&gt;&gt;(\d+)|\[(/?)(spoiler|code|banned)\]|\n(?=&gt;))')
+# same groups, for comments without `>`, which have no quotelinks or greentext
+bbcode_token_re = re.compile(r'((?!)(\d+)|\[(/?)(spoiler|code|banned)\])')
+bbcode_t = {
+    ('spoiler', ''): '<span class="spoiler">',
+    ('spoiler', '/'): '</span>',
+    ('code', ''): '<code>',
+    ('code', '/'): '</code>',
+    ('banned', ''): '<span class="banned">',
+    ('banned', '/'): '</span>',
+}
+
+
+def get_bbcode_pairs(slashes: list[str | None], tags: list[str | None], texts: list[str]) -> set[int]:
+    """Indexes of the tokens that are bbcode tags getting replaced.
+
+    Each opening tag pairs with the next closing tag of its kind, like `\\[spoiler\\](.*?)\\[/spoiler\\]`.
+    Nothing is replaced unless some closing tag comes at least one character after some opening tag.
+    """
+    first_open = None
+    last_close = None
+    opened: dict[str, int] = {}
+    pairs = set()
+    for i, tag in enumerate(tags):
+        if not tag:
+            continue
+
+        if not slashes[i]:
+            if first_open is None:
+                first_open = i
+            opened.setdefault(tag, i)
+            continue
+
+        last_close = i
+        if (open_i := opened.pop(tag, None)) is not None:
+            pairs.add(open_i)
+            pairs.add(i)
+
+    if not pairs or last_close < first_open or (last_close == first_open + 1 and not texts[first_open]):
+        return set()
+    return pairs
+
+
+def html_text(text: str, do_links: bool, greentext: bool, in_code: bool) -> tuple[str, bool]:
+    """Returns the html of some text between tokens, and whether a greentext line is still open after it."""
+    if do_links and '://' in text:
+        text = link_re.sub(link_t, text)
+    if greentext and (i := text.find('\n')) != -1:
+        text = f'{text[:i]}</span>{text[i:]}'
+        greentext = False
+    if not in_code:
+        text = text.replace('\n', '<br>')
+    return text, greentext
+
+
+def format_comment(comment: str, thread_num: int, board: str) -> str:
+    has_angle_r = '>' in comment
+    has_square_l = '[' in comment
+    if has_angle_r or '<' in comment:
+        comment = escape(comment)
+    do_links = 'http' in comment
+
+    if not (has_angle_r or has_square_l):
+        if do_links:
+            comment = link_re.sub(link_t, comment)
+        return comment.replace('\n', '<br>')
+
+    # [text, token, post_num, slash, tag, text, token, ...]
+    parts = (token_re if has_angle_r else bbcode_token_re).split(comment)
+    bbcode_pairs = get_bbcode_pairs(parts[3::5], parts[4::5], parts[5::5]) if has_square_l else ()
+
+    parts_iter = iter(parts)
+    text = next(parts_iter)
+    greentext = has_angle_r and text.startswith('&gt;')
+    out = ['<span class="quote">'] if greentext else []
+    in_code = False
+    for i, (token, post_num, slash, tag, after) in enumerate(zip(parts_iter, parts_iter, parts_iter, parts_iter, parts_iter)):
+        if tag and i not in bbcode_pairs:
+            text += token + after
+            continue
+
+        if text:
+            text, greentext = html_text(text, do_links, greentext, in_code)
+            out.append(text)
+        text = after
+
+        if post_num is not None:
+            op_tag = ' (OP)' if int(post_num) == thread_num else ''
+            out.append(f'<a href="/{board}/thread/{thread_num}#p{post_num}" class="quotelink" data-board="{board}">&gt;&gt;{post_num}{op_tag}</a>')
+        elif tag:
+            out.append(bbcode_t[(tag, slash)])
+            if tag == 'code':
+                in_code = not slash
+        else:
+            if greentext:
+                out.append('</span>')
+            out.append('\n' if in_code else '<br>')
+            # a line starting with a quotelink starts with its token instead, while `>>>123` is greentext
+            if greentext := after.startswith('&gt;'):
+                out.append('<span class="quote">')
+
+    if text:
+        text, greentext = html_text(text, do_links, greentext, in_code)
+        out.append(text)
+    if greentext:
+        out.append('</span>')
+
+    return ''.join(out)
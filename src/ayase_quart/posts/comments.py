@@ -2,11 +2,17 @@ import html
 import re
 
 from ..configs import archive_conf
-from .quotelinks import html_quotelinks
+from .comment_formatter import format_comment
 
 
 COMMENTS_PREESCAPED = archive_conf['comments_preescaped']
 
+# bump whenever the html `html_comment()` returns changes
+COMMENT_FORMAT_REVISION = 1
+# stored with each `<board>_rendered` row, which is only used with the version it was written with.
+# comments_preescaped picks another formatter, so it's part of the version too.
+COMMENT_FORMAT_VERSION = (COMMENT_FORMAT_REVISION << 1) | int(COMMENTS_PREESCAPED)
+
 
 def html_title(title: str) -> str:
     return html.escape(title) if title else title
@@ -19,33 +25,7 @@ def html_comment(comment: str, thread_num: int, board: str) -> str:
     if COMMENTS_PREESCAPED:
         return _html_comment_vichan(comment)
 
-    return _html_comment_yotsuba(comment, thread_num, board)
-
-
-def _html_comment_yotsuba(comment: str, thread_num: int, board: str):
-    """Will escape html if needed.
-
-    Note: Yes, there are multiple `in comment` statements,
-    but this is 1-2ms faster than looping over `comment` once, believe it or not.
-    """
-    has_angle_r = '>' in comment
-    has_square_l = '[' in comment
-    if has_angle_r or '<' in comment:
-        comment = html.escape(comment)
-    if has_angle_r:
-        comment = html_quotelinks(comment, board, thread_num)
-    if has_square_l:
-        comment = html_bbcode(comment)
-    if has_angle_r:
-        comment = html_greentext(comment)
-    if 'http' in comment:
-        comment = clickable_links(comment)
-
-    if has_square_l: # only do expensive [code] processing if there were bbtags at all
-        comment = replace_newlines_except_in_code(comment)
-    else:
-        comment = comment.replace('\n', '<br>')
-    return comment
+    return format_comment(comment, thread_num, board)
 
 
 vichan_comment_re = re.compile(r'\s*onclick="[^"]*"')
@@ -65,17 +45,6 @@ def _html_comment_vichan(comment: str):
     return comment
 
 
-def replace_newlines_except_in_code(html: str):
-    if not html:
-        return html
-
-    parts = re.split(r'(<code>.*?</code>)', html, flags=re.DOTALL)
-    for i, part in enumerate(parts):
-        if not part.startswith('<code>'):
-            parts[i] = part.replace('\n', '<br>')
-    return ''.join(parts)
-
-
 def html_highlight(html: str, term: str, klass: str='hl_magenta') -> str:
     if not term or not html:
         return html
@@ -91,38 +60,3 @@ def html_highlight(html: str, term: str, klass: str='hl_magenta') -> str:
         for part in parts
     ]
     return ''.join(highlighted_parts)
-
-
-bbcode_re = re.compile(r'.*\[(spoiler|code|banned)\].+\[/(spoiler|code|banned)\].*', re.DOTALL)
-spoiler_re = re.compile(r'\[spoiler\](.*?)\[/spoiler\]', re.DOTALL)
-spoiler_sub = r'<span class="spoiler">\1</span>'
-code_re = re.compile(r'\[code\](.*?)\[/code\]', re.DOTALL)
-code_sub = r'<code>\1</code>'
-banned_re = re.compile(r'\[banned\](.*?)\[/banned\]', re.DOTALL)
-banned_sub = r'<span class="banned">\1</span>'
-def html_bbcode(comment: str):
-    if not bbcode_re.fullmatch(comment):
-        return comment
-    comment = spoiler_re.sub(spoiler_sub, comment)
-    comment = code_re.sub(code_sub, comment)
-    comment = banned_re.sub(banned_sub, comment)
-    return comment
-
-
-greentext_re = re.compile(r'^&gt;(?!&gt;\d)(.*)$', re.MULTILINE)
-greentext_sub = r'<span class="quote">&gt;\1</span>'
-def html_greentext(comment: str):
-    return greentext_re.sub(greentext_sub, comment)
-
-
-link_re = re.compile(r'(https?://(?:[a-z0-9\-]+\.)+[a-z]{2,}(?:(?:\:|/)[^\s<>\"\']*)?)', re.IGNORECASE)
-punc_ending_re = re.compile(r'^(.*?)(?=((?:\.|,)+(?:\s|$)))', re.IGNORECASE)
-def clickable_links(comment: str):
-    def replace_link(match):
-        url: str = match.group(1)
-        if punc_groups := punc_ending_re.match(url):
-            url = punc_groups.group(1)
-            punc = punc_groups.group(2)
-            return f'<a href="{url}">{url}</a>{punc}'
-        return f'<a href="{url}">{url}</a>'
-    return link_re.sub(replace_link, comment)
@@ -0,0 +1,113 @@
+from collections.abc import Awaitable, Callable
+
+from ..db import db_q
+from ..enums import DbType
+
+"""
+Tables derived from the posts of a board, like `<board>_quotelinks` and `<board>_rendered`, are filled by tailing
+the board in batches of doc_ids. The last doc_id processed per board is kept in a progress table,
+so an incremental run only tails the posts added since the previous run.
+
+With a `version`, the progress also records what the rows were derived with, and a different version restarts
+an incremental run from the first post.
+"""
+
+DEFAULT_POST_BATCH = 5_000
+
+type Transform = Callable[[str, list[tuple]], list[tuple]]
+"""board, `(doc_id, *post_columns)` rows -> rows to insert"""
+type Insert = Callable[[str, list[tuple]], Awaitable[None]]
+"""board, rows to insert"""
+
+
+class DocIdTailer:
+    def __init__(
+        self,
+        progress_table: str,
+        post_columns: tuple[str, ...],
+        create: Callable[[str], Awaitable[None]],
+        transform: Transform,
+        insert: Insert,
+        version: int | None=None,
+        batch_size: int=DEFAULT_POST_BATCH,
+    ):
+        self.progress_table = progress_table
+        self.post_columns = post_columns
+        self.create = create
+        self.transform = transform
+        self.insert = insert
+        self.version = version
+        self.batch_size = batch_size
+
+    def get_create_progress_sql(self) -> str:
+        int_type = 'int unsigned' if db_q.db_type == DbType.mysql else 'integer'
+        version_col = f'version {int_type} not null,' if self.version is not None else ''
+        return f"""create table if not exists {self.progress_table} (
+            board_shortname varchar(32) not null primary key,
+            {version_col}
+            last_doc_id {int_type} not null
+        );"""
+
+    def get_upsert_progress_sql(self) -> str:
+        phg = db_q.Phg()
+        cols = ('board_shortname', 'version', 'last_doc_id') if self.version is not None else ('board_shortname', 'last_doc_id')
+        insert = f'insert into {self.progress_table} ({", ".join(cols)}) values ({phg.qty(len(cols))})'
+        match db_q.db_type:
+            case DbType.mysql:
+                return f'{insert} on duplicate key update {", ".join(f"{col} = values({col})" for col in cols[1:])};'
+            case _:
+                return f'{insert} on conflict(board_shortname) do update set {", ".join(f"{col} = excluded.{col}" for col in cols[1:])};'
+
+    async def create_tables(self, board: str) -> None:
+        await self.create(board)
+        await db_q.query_tuple(self.get_create_progress_sql(), commit=True)
+
+    async def get_progress(self, board: str) -> int:
+        """Last doc_id processed, with the current version if there is one. 0 if there is none."""
+        cols = 'version, last_doc_id' if self.version is not None else 'null, last_doc_id'
+        sql = f'select {cols} from {self.progress_table} where board_shortname = {db_q.Phg()()};'
+        if not (rows := await db_q.query_tuple(sql, params=(board,))):
+            return 0
+        version, last_doc_id = rows[0]
+        return last_doc_id if version == self.version else 0
+
+    async def set_progress(self, board: str, last_doc_id: int) -> None:
+        params = (board, self.version, last_doc_id) if self.version is not None else (board, last_doc_id)
+        await db_q.query_tuple(self.get_upsert_progress_sql(), params=params, commit=True)
+
+    async def load(self, board: str, after_doc_id: int=0) -> int:
+        """Processes posts with `doc_id > after_doc_id` in batches, checkpointing progress after each batch.
+
+        Returns the number of posts processed.
+        """
+        processed = 0
+        while True:
+            phg = db_q.Phg()
+            sql = f"""
+            select doc_id, {', '.join(self.post_columns)}
+            from `{board}`
+            where doc_id > {phg()}
+            and comment is not null
+            order by doc_id asc
+            limit {int(self.batch_size)}
+            ;"""
+            if not (rows := await db_q.query_tuple(sql, params=(after_doc_id,))):
+                break
+
+            await self.insert(board, self.transform(board, rows))
+
+            after_doc_id = rows[-1][0]
+            await self.set_progress(board, after_doc_id)
+
+            processed += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        return processed
+
+    async def full(self, board: str) -> int:
+        await self.create_tables(board)
+        return await self.load(board, after_doc_id=0)
+
+    async def incremental(self, board: str) -> int:
+        await self.create_tables(board)
+        return await self.load(board, after_doc_id=await self.get_progress(board))
@@ -0,0 +1,101 @@
+from collections import defaultdict
+from itertools import batched
+
+from ..db import db_q
+from ..enums import DbType
+from .doc_id_tailer import DocIdTailer
+from .quotelinks import extract_quotelinks
+
+"""
+`<board>_quotelinks` holds one row per (src_num, dst_num) quotelink found in a post's comment.
+
+It replaces selecting every comment of every thread on an index/search page just to compute backlinks.
+The table is filled by a `DocIdTailer`, with the last doc_id processed per board kept in `quotelinks_progress`.
+"""
+
+QL_INSERT_BATCH = 1_000
+
+
+def get_create_quotelinks_sql(board: str) -> list[str]:
+    match db_q.db_type:
+        case DbType.mysql:
+            return [
+                f"""create table if not exists `{board}_quotelinks` (
+                    src_num int unsigned not null,
+                    dst_num int unsigned not null,
+                    thread_num int unsigned not null,
+                    primary key (src_num, dst_num),
+                    index thread_num_index (thread_num)
+                );""",
+            ]
+        case _:
+            return [
+                f"""create table if not exists `{board}_quotelinks` (
+                    src_num integer not null,
+                    dst_num integer not null,
+                    thread_num integer not null,
+                    primary key (src_num, dst_num)
+                );""",
+                f"""create index if not exists `{board}_quotelinks_thread_num_index` on `{board}_quotelinks` (thread_num);""",
+            ]
+
+
+def get_insert_ignore_sql(table: str, columns: tuple[str], n_rows: int) -> str:
+    phg = db_q.Phg()
+    values = ','.join(f'({phg.qty(len(columns))})' for _ in range(n_rows))
+    cols = ','.join(columns)
+    match db_q.db_type:
+        case DbType.mysql:
+            return f'insert ignore into `{table}` ({cols}) values {values};'
+        case DbType.sqlite:
+            return f'insert or ignore into `{table}` ({cols}) values {values};'
+        case _:
+            return f'insert into `{table}` ({cols}) values {values} on conflict do nothing;'
+
+
+async def create_quotelinks_table(board: str) -> None:
+    for sql in get_create_quotelinks_sql(board):
+        await db_q.query_tuple(sql, commit=True)
+
+
+def get_quotelink_rows(board: str, rows: list[tuple]) -> list[tuple[int, int, int]]:
+    """`rows` are `(doc_id, num, thread_num, comment)`, returns `(src_num, dst_num, thread_num)`."""
+    return [
+        (num, dst_num, thread_num)
+        for _, num, thread_num, comment in rows
+        for dst_num in set(extract_quotelinks(comment))
+    ]
+
+
+async def insert_quotelinks(board: str, ql_rows: list[tuple[int, int, int]]) -> None:
+    columns = ('src_num', 'dst_num', 'thread_num')
+    for batch in batched(ql_rows, QL_INSERT_BATCH):
+        sql = get_insert_ignore_sql(f'{board}_quotelinks', columns, len(batch))
+        await db_q.query_tuple(sql, params=[v for row in batch for v in row], commit=True)
+
+
+quotelinks_tailer = DocIdTailer(
+    'quotelinks_progress',
+    ('num', 'thread_num', 'comment'),
+    create=create_quotelinks_table,
+    transform=get_quotelink_rows,
+    insert=insert_quotelinks,
+)
+
+
+async def get_board_thread_quotelinks_indexed(board: str, thread_nums: tuple[int]) -> dict[int, list[int]]:
+    """Same output as `get_quotelink_lookup()`, read from `<board>_quotelinks`."""
+    sql = f"""
+        select dst_num, src_num
+        from `{board}_quotelinks`
+        where thread_num in ({db_q.Phg().size(thread_nums)})
+        order by src_num asc
+    ;"""
+    post_2_quotelinks = defaultdict(list)
+    for dst_num, src_num in await db_q.query_tuple(sql, params=thread_nums):
+        post_2_quotelinks[dst_num].append(src_num)
+    return post_2_quotelinks
+
+
+async def delete_post_quotelinks(board: str, num: int) -> None:
+    await db_q.query_tuple(f'delete from `{board}_quotelinks` where src_num = {db_q.Phg()()};', params=(num,), commit=True)
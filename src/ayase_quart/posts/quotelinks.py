@@ -78,13 +78,3 @@ def extract_quotelinks_esc(comment: str) -> list[int]:
         int(match)
         for match in esc_ql_re.findall(comment)
     ]
-
-
-def html_quotelinks(comment: str, board: str, thread_num: int):
-    def replacer(match):
-        post_num = match.group(1)
-        op_tag = ' (OP)' if int(post_num) == thread_num else ''
-        return f'<a href="/{board}/thread/{thread_num}#p{post_num}" class="quotelink" data-board="{board}">&gt;&gt;{post_num}{op_tag}</a>'
-
-    esc_ql_re = re.compile(r'&gt;&gt;(\d+)')
-    return esc_ql_re.sub(replacer, comment)
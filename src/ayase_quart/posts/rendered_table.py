@@ -0,0 +1,133 @@
+from itertools import batched
+from zlib import crc32
+
+from ..db import db_q
+from ..enums import DbType
+from .comments import COMMENT_FORMAT_VERSION, html_comment
+from .doc_id_tailer import DocIdTailer
+
+"""
+`<board>_rendered` holds the html of each post's comment, as `html_comment()` formats it, keyed by doc_id.
+
+Pages read it instead of formatting every comment on every view, and format live whatever is missing.
+A row is only used when it was written with the current `COMMENT_FORMAT_VERSION` and its crc matches the post's comment,
+so bumping the version, changing `comments_preescaped`, or the scraper editing a comment (e.g. ban messages), falls back to live formatting.
+The table is filled by a `DocIdTailer` like `<board>_quotelinks`, with the last doc_id and version kept in `rendered_progress`.
+A version bump restarts an incremental run from the first post.
+"""
+
+RENDERED_INSERT_BATCH = 500
+
+type RenderedLookup = dict[int, tuple[int, str]]
+"""`{doc_id: (comment_crc, html)}`"""
+
+
+def get_comment_crc(comment: str) -> int:
+    return crc32(comment.encode())
+
+
+def get_create_rendered_sql(board: str) -> list[str]:
+    match db_q.db_type:
+        case DbType.mysql:
+            return [
+                f"""create table if not exists `{board}_rendered` (
+                    doc_id int unsigned not null primary key,
+                    thread_num int unsigned not null,
+                    version int unsigned not null,
+                    comment_crc int unsigned not null,
+                    comment mediumtext not null,
+                    index thread_num_index (thread_num)
+                );""",
+            ]
+        case _:
+            return [
+                f"""create table if not exists `{board}_rendered` (
+                    doc_id integer not null primary key,
+                    thread_num integer not null,
+                    version integer not null,
+                    comment_crc bigint not null,
+                    comment text not null
+                );""",
+                f"""create index if not exists `{board}_rendered_thread_num_index` on `{board}_rendered` (thread_num);""",
+            ]
+
+
+def get_upsert_rendered_sql(board: str, n_rows: int) -> str:
+    phg = db_q.Phg()
+    values = ','.join(f'({phg.qty(5)})' for _ in range(n_rows))
+    cols = 'doc_id, thread_num, version, comment_crc, comment'
+    match db_q.db_type:
+        case DbType.mysql:
+            return f'replace into `{board}_rendered` ({cols}) values {values};'
+        case DbType.sqlite:
+            return f'insert or replace into `{board}_rendered` ({cols}) values {values};'
+        case _:
+            return f"""insert into `{board}_rendered` ({cols}) values {values}
+                on conflict (doc_id) do update set
+                thread_num = excluded.thread_num, version = excluded.version, comment_crc = excluded.comment_crc, comment = excluded.comment
+            ;"""
+
+
+async def create_rendered_table(board: str) -> None:
+    for sql in get_create_rendered_sql(board):
+        await db_q.query_tuple(sql, commit=True)
+
+
+def get_rendered_rows(board: str, rows: list[tuple]) -> list[tuple[int, int, int, int, str]]:
+    """`rows` are `(doc_id, thread_num, comment)`, returns `(doc_id, thread_num, version, comment_crc, html)`."""
+    return [
+        (doc_id, thread_num, COMMENT_FORMAT_VERSION, get_comment_crc(comment), html_comment(comment, thread_num, board))
+        for doc_id, thread_num, comment in rows
+    ]
+
+
+async def insert_rendered(board: str, rendered_rows: list[tuple]) -> None:
+    for batch in batched(rendered_rows, RENDERED_INSERT_BATCH):
+        sql = get_upsert_rendered_sql(board, len(batch))
+        await db_q.query_tuple(sql, params=[v for row in batch for v in row], commit=True)
+
+
+rendered_tailer = DocIdTailer(
+    'rendered_progress',
+    ('thread_num', 'comment'),
+    create=create_rendered_table,
+    transform=get_rendered_rows,
+    insert=insert_rendered,
+    version=COMMENT_FORMAT_VERSION,
+)
+
+
+async def get_board_rendered_by_doc_ids(board: str, doc_ids: tuple[int]) -> RenderedLookup:
+    phg = db_q.Phg()
+    sql = f"""
+        select doc_id, comment_crc, comment
+        from `{board}_rendered`
+        where doc_id in ({phg.size(doc_ids)})
+        and version = {phg()}
+    ;"""
+    rows = await db_q.query_tuple(sql, params=(*doc_ids, COMMENT_FORMAT_VERSION))
+    return {doc_id: (comment_crc, comment) for doc_id, comment_crc, comment in rows}
+
+
+async def get_board_rendered_by_thread(board: str, thread_num: int) -> RenderedLookup:
+    phg = db_q.Phg()
+    sql = f"""
+        select doc_id, comment_crc, comment
+        from `{board}_rendered`
+        where thread_num = {phg()}
+        and version = {phg()}
+    ;"""
+    rows = await db_q.query_tuple(sql, params=(thread_num, COMMENT_FORMAT_VERSION))
+    return {doc_id: (comment_crc, comment) for doc_id, comment_crc, comment in rows}
+
+
+def html_comment_rendered(post: dict, thread_num: int, board: str, rendered: RenderedLookup) -> str:
+    """`html_comment()` of the post's comment, from `rendered` when it holds the html of this exact comment."""
+    comment = post['comment']
+    if (row := rendered.get(post['doc_id'])) and row[0] == get_comment_crc(comment):
+        return row[1]
+    return html_comment(comment, thread_num, board)
+
+
+async def delete_post_rendered(board: str, doc_id: int) -> None:
+    await db_q.query_tuple(f'delete from `{board}_rendered` where doc_id = {db_q.Phg()()};', params=(doc_id,), commit=True)
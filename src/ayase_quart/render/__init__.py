@@ -1,10 +1,13 @@
 from jinja2 import Template
 from quart import render_template
 
-from ..configs import app_conf
+from ..configs import app_conf, render_cache_conf
+from .fragment_cache import BaseFragmentCache, get_fragment_cache
 
 TESTING = app_conf.get('testing', False)
 
+thread_cache: BaseFragmentCache = get_fragment_cache(render_cache_conf)
+
 
 async def render_controller(template: str | Template, **kwargs):
     """
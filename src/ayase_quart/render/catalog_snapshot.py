@@ -0,0 +1,134 @@
+import asyncio
+import traceback
+
+from ..asagi_converter import (
+    CATALOG_PAGE_THREADS,
+    PageCursor,
+    get_catalog_ops,
+    get_catalog_pages,
+    get_next_page_cursor,
+    get_page_threads,
+    get_threads_bumped_since
+)
+from ..boards import board_shortnames
+from ..configs import catalog_snapshot_conf
+from ..metrics import metrics
+from ..moderation import fc
+from ..posts.template_optimizer import render_catalog_card, wrap_post_t
+
+"""
+Each worker keeps every board's first catalog page in memory, so `/<board>/catalog` doesn't query and escape 150 OPs per request.
+
+A refresh only reads the threads bumped since the newest bump in the snapshot, plus the snapshot's own threads for their counts.
+Only OPs new to the snapshot are selected and escaped. A full rebuild happens every `full_refresh_every` refreshes,
+when moderation bumps the board's generation, or when threads vanish and the page needs back-filling.
+"""
+
+
+class CatalogSnapshot:
+    def __init__(self, board: str):
+        self.board = board
+        self.rows: list[dict] = [] # <board>_threads rows, newest bump first
+        self.ops: dict[int, dict] = {} # thread_num -> escaped op
+        self.catalog: list[dict] = []
+        self.cards: dict[int, tuple[dict, str]] = {} # thread_num -> (catalog op, card rendered without the nuke button)
+        self.next_cursor: PageCursor | None = None
+        self.generation: int | None = None
+        self.n_refreshes = 0
+        self.ready = False
+
+    async def refresh(self, full_refresh_every: int, prerender: bool) -> None:
+        generation = await fc.get_generation(self.board)
+        full = (
+            not self.rows
+            or generation != self.generation
+            or (full_refresh_every and self.n_refreshes % full_refresh_every == 0)
+        )
+
+        if full:
+            rows = await get_page_threads(self.board, CATALOG_PAGE_THREADS)
+            self.ops = {}
+        else:
+            watermark = self.rows[0]['time_bump']
+            rows = await get_threads_bumped_since(self.board, watermark, tuple(row['thread_num'] for row in self.rows))
+            rows = sorted(rows, key=lambda row: (row['time_bump'], row['thread_num']), reverse=True)[:CATALOG_PAGE_THREADS]
+
+            # a thread was deleted, so the page has a gap only a full read can fill
+            if len(rows) < len(self.rows):
+                rows = await get_page_threads(self.board, CATALOG_PAGE_THREADS)
+
+        thread_nums = tuple(row['thread_num'] for row in rows)
+        if new_nums := tuple(num for num in thread_nums if num not in self.ops):
+            for op in await get_catalog_ops(self.board, new_nums):
+                self.ops[op['num']] = op
+        self.ops = {num: self.ops[num] for num in thread_nums if num in self.ops}
+
+        threads = {row['thread_num']: (row['nreplies'], row['nimages']) for row in rows}
+        ops = sorted(self.ops.values(), key=lambda op: op['thread_num'], reverse=True)
+        catalog = get_catalog_pages(ops, threads)
+
+        cards = {}
+        if prerender:
+            cards = {
+                op['num']: (op, render_catalog_card(wrap_post_t(op | {})))
+                for page in catalog
+                for op in page['threads']
+            }
+
+        self.rows = rows
+        self.catalog = catalog
+        self.cards = cards
+        self.next_cursor = get_next_page_cursor(rows, CATALOG_PAGE_THREADS)
+        self.generation = generation
+        self.n_refreshes += 1
+        self.ready = True
+
+    def get_card(self, op: dict) -> str | None:
+        """`None` for ops that moderation filtering replaced with a modified copy."""
+        if (card := self.cards.get(op['num'])) and card[0] is op:
+            return card[1]
+        return None
+
+
+class CatalogSnapshots:
+    def __init__(self, boards: list[str], interval: int, full_refresh_every: int, prerender: bool):
+        self.snapshots = {board: CatalogSnapshot(board) for board in boards}
+        self.interval = interval
+        self.full_refresh_every = full_refresh_every
+        self.prerender = prerender
+        self.task: asyncio.Task | None = None
+
+    def get(self, board: str) -> CatalogSnapshot | None:
+        if not (snapshot := self.snapshots.get(board)):
+            return None
+        metrics.hit('catalog_snapshot', snapshot.ready)
+        return snapshot if snapshot.ready else None
+
+    async def refresh(self) -> None:
+        for snapshot in self.snapshots.values():
+            try:
+                await snapshot.refresh(self.full_refresh_every, self.prerender)
+            except Exception as e:
+                print(f'Catalog snapshot refresh failed for /{snapshot.board}/')
+                traceback.print_exception(e)
+
+    async def run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+
+catalog_snapshots = CatalogSnapshots(
+    board_shortnames if catalog_snapshot_conf.get('enabled', False) else [],
+    interval=catalog_snapshot_conf.get('interval', 10),
+    full_refresh_every=catalog_snapshot_conf.get('full_refresh_every', 30),
+    prerender=catalog_snapshot_conf.get('prerender', True),
+)
@@ -0,0 +1,126 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+import orjson
+
+from ..metrics import metrics
+
+FC_DEFAULT_MAXSIZE = 256
+FC_DEFAULT_REDIS_DB = 5
+FC_DEFAULT_TTL = 60 * 60 * 24
+FC_DEFAULT_KEY_PREFIX = 'fragment_cache:'
+
+
+type Version = tuple
+type Fragment = Any
+
+
+class BaseFragmentCache(ABC):
+    """Stores rendered html fragments alongside the version they were rendered at.
+
+    A fragment is only handed back if the caller's current version matches the stored one,
+    so stale entries are replaced on the next miss rather than needing an explicit purge.
+    """
+
+    @abstractmethod
+    async def get(self, key: str, version: Version) -> Fragment | None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def set(self, key: str, version: Version, fragment: Fragment) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError()
+
+
+class FragmentCacheNull(BaseFragmentCache):
+    async def get(self, key: str, version: Version) -> Fragment | None: return None
+    async def set(self, key: str, version: Version, fragment: Fragment) -> None: pass
+    async def delete(self, key: str) -> None: pass
+
+
+class FragmentCacheLru(BaseFragmentCache):
+    """Per-worker, in-process LRU."""
+
+    def __init__(self, maxsize: int=FC_DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, tuple[Version, Fragment]] = OrderedDict()
+
+    async def get(self, key: str, version: Version) -> Fragment | None:
+        if not (entry := self.entries.get(key)):
+            metrics.hit('fragment', False)
+            return None
+        if entry[0] != version:
+            del self.entries[key]
+            metrics.hit('fragment', False)
+            return None
+        self.entries.move_to_end(key)
+        metrics.hit('fragment', True)
+        return entry[1]
+
+    async def set(self, key: str, version: Version, fragment: Fragment) -> None:
+        self.entries[key] = (version, fragment)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+
+class FragmentCacheRedis(FragmentCacheLru):
+    """In-process LRU in front of a redis tier shared by all workers."""
+
+    def __init__(self, maxsize: int=FC_DEFAULT_MAXSIZE, redis_db: int=FC_DEFAULT_REDIS_DB, ttl: int=FC_DEFAULT_TTL, key_prefix: str=FC_DEFAULT_KEY_PREFIX):
+        super().__init__(maxsize)
+        from ..db.redis import get_redis
+        self.redis = get_redis(redis_db)
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    async def get(self, key: str, version: Version) -> Fragment | None:
+        if (fragment := await super().get(key, version)) is not None:
+            return fragment
+
+        async with self.redis:
+            if not (raw := await self.redis.get(self.key_prefix + key)):
+                metrics.hit('fragment_redis', False)
+                return None
+
+        stored_version, fragment = orjson.loads(raw)
+        if tuple(stored_version) != version:
+            metrics.hit('fragment_redis', False)
+            return None
+        metrics.hit('fragment_redis', True)
+
+        await super().set(key, version, fragment)
+        return fragment
+
+    async def set(self, key: str, version: Version, fragment: Fragment) -> None:
+        await super().set(key, version, fragment)
+        async with self.redis:
+            await self.redis.set(self.key_prefix + key, orjson.dumps((version, fragment)).decode(), ex=self.ttl)
+
+    async def delete(self, key: str) -> None:
+        await super().delete(key)
+        async with self.redis:
+            await self.redis.delete([self.key_prefix + key])
+
+
+def get_fragment_cache(cache_conf: dict) -> BaseFragmentCache:
+    if not cache_conf.get('enabled', False):
+        return FragmentCacheNull()
+
+    maxsize = cache_conf.get('maxsize', FC_DEFAULT_MAXSIZE)
+    if not cache_conf.get('redis', False):
+        return FragmentCacheLru(maxsize)
+
+    return FragmentCacheRedis(
+        maxsize=maxsize,
+        redis_db=cache_conf.get('redis_db', FC_DEFAULT_REDIS_DB),
+        ttl=cache_conf.get('ttl', FC_DEFAULT_TTL),
+        key_prefix=cache_conf.get('key_prefix', FC_DEFAULT_KEY_PREFIX),
+    )
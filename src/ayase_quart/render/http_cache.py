@@ -0,0 +1,185 @@
+import asyncio
+from datetime import datetime, timezone
+from hashlib import blake2b
+
+from quart import Response, make_response, request, session
+
+from ..asagi_converter import CATALOG_PAGE_THREADS, PageCursor, get_page_version, get_post_version, get_thread_version
+from ..configs import http_cache_conf
+from ..metrics import metrics
+from ..moderation import fc
+from ..posts.comments import COMMENT_FORMAT_VERSION
+from ..security import session_csrf_token_name
+from .catalog_snapshot import CatalogSnapshot
+
+"""
+ETag and Last-Modified validators for pages and json, so browsers, nginx and CDNs can revalidate instead of re-downloading.
+
+ETags are hashed from the cheap metadata a response is rendered from, e.g. a thread's `time_bump`, `nreplies` and `ts_expired`,
+plus the board's moderation generation and who is asking. They are known before the heavy queries run,
+so an `If-None-Match` hit is answered with a 304 straight away.
+
+Only `If-None-Match` is honoured. Last-Modified is sent for clients that display it, but moderation and deletions
+change a page without changing any of its timestamps, so `If-Modified-Since` alone can't tell whether a copy is current.
+
+Anonymous responses are cacheable for a configurable ttl. Html pages that embed the session's csrf token are `private`,
+everything else anonymous is `public`. Logged in users always revalidate.
+"""
+
+HTTP_CACHE_ENABLED: bool = http_cache_conf.get('enabled', False)
+HTTP_CACHE_SALT: str = http_cache_conf.get('salt', '')
+
+THREAD_TTL: int = http_cache_conf.get('thread_ttl', 10)
+INDEX_TTL: int = http_cache_conf.get('index_ttl', 10)
+CATALOG_TTL: int = http_cache_conf.get('catalog_ttl', 30)
+POST_TTL: int = http_cache_conf.get('post_ttl', 60)
+
+
+async def get_thread_version_generation(board: str, thread_num: int) -> tuple | None:
+    """`(time_bump, nreplies, ts_expired, generation)`, `None` when the thread doesn't exist."""
+    thread_version, generation = await asyncio.gather(
+        get_thread_version(board, thread_num),
+        fc.get_generation(board),
+    )
+    if not thread_version:
+        return None
+    return (*thread_version, generation)
+
+
+def get_thread_last_modified(version: tuple | None) -> int | None:
+    if not version:
+        return None
+    time_bump, _, ts_expired, _ = version
+    return max(time_bump, ts_expired or 0)
+
+
+async def get_post_version_generation(board: str, num: int) -> tuple | None:
+    """`(doc_id, ts_unix, ts_expired, deleted, comment length, generation)`, `None` when the post doesn't exist."""
+    post_version, generation = await asyncio.gather(
+        get_post_version(board, num),
+        fc.get_generation(board),
+    )
+    if not post_version:
+        return None
+    return (*post_version, generation)
+
+
+def get_post_last_modified(version: tuple | None) -> int | None:
+    if not version:
+        return None
+    _, ts_unix, ts_expired, *_ = version
+    return max(ts_unix, ts_expired or 0)
+
+
+async def get_page_version_generation(board: str, post_count: int, page_num: int, cursor: PageCursor | None=None) -> tuple | None:
+    """`(page_version, generation)` of an index or catalog page, `None` when validators are disabled."""
+    if not HTTP_CACHE_ENABLED:
+        return None
+    return await asyncio.gather(
+        get_page_version(board, post_count, page_num, cursor),
+        fc.get_generation(board),
+    )
+
+
+async def get_catalog_version_generation(board: str, page_num: int, cursor: PageCursor | None, snapshot: CatalogSnapshot | None) -> tuple | None:
+    """Pages served from a catalog snapshot are versioned by the snapshot's rows, since the snapshot can lag behind the db."""
+    if not HTTP_CACHE_ENABLED:
+        return None
+    if not snapshot:
+        return await get_page_version_generation(board, CATALOG_PAGE_THREADS, page_num, cursor)
+
+    page_version = tuple((row['thread_num'], row['time_bump'], row['nreplies']) for row in snapshot.rows)
+    return page_version, await fc.get_generation(board)
+
+
+def get_page_last_modified(version: tuple | None) -> int | None:
+    if not version:
+        return None
+    page_version, _ = version
+    return max((time_bump for _, time_bump, _ in page_version), default=None)
+
+
+def get_etag(*parts) -> str:
+    return blake2b(repr((HTTP_CACHE_SALT, COMMENT_FORMAT_VERSION, *parts)).encode(), digest_size=12).hexdigest()
+
+
+class Validators:
+    """Validators and caching headers of one response. A `Validators()` without an ETag leaves responses untouched."""
+
+    def __init__(self, etag: str | None=None, last_modified: int | None=None, ttl: int=0, private: bool=False, no_cache: bool=False, vary: str | None=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.ttl = ttl
+        self.private = private
+        self.no_cache = no_cache
+        self.vary = vary
+
+    def is_fresh(self) -> bool:
+        """Whether the client's copy, per `If-None-Match`, is still current."""
+        if self.etag is None:
+            return False
+        is_fresh = request.if_none_match.contains_weak(self.etag)
+        metrics.hit('http_etag', is_fresh)
+        return is_fresh
+
+    def set_headers(self, response: Response) -> Response:
+        if self.etag is None:
+            return response
+
+        # weak, since gzip in front of us changes the bytes but not the meaning
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified:
+            response.last_modified = datetime.fromtimestamp(self.last_modified, timezone.utc)
+
+        if self.no_cache:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        else:
+            if self.private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            response.cache_control.max_age = self.ttl
+
+        if self.vary:
+            response.vary.add(self.vary)
+        return response
+
+    def not_modified(self) -> Response:
+        return self.set_headers(Response(status=304))
+
+    async def respond(self, rv) -> Response:
+        """Turns a view's return value into a response carrying the validators."""
+        if self.etag is None:
+            return rv
+        return self.set_headers(await make_response(rv))
+
+
+def web_validators(version: tuple | None, last_modified: int | None, ttl: int, logged_in: bool, is_admin: bool, has_csrf: bool) -> Validators:
+    """For html pages, which differ per user role, and per session when they embed the csrf token."""
+    if not HTTP_CACHE_ENABLED or version is None:
+        return Validators()
+
+    csrf = session.get(session_csrf_token_name) if has_csrf else None
+    return Validators(
+        etag=get_etag(request.path, request.query_string, version, logged_in, is_admin, csrf),
+        last_modified=last_modified,
+        ttl=ttl,
+        private=has_csrf,
+        no_cache=logged_in,
+        vary='Cookie',
+    )
+
+
+def json_validators(version: tuple | None, last_modified: int | None, ttl: int, authenticated: bool) -> Validators:
+    """For json, which only differs by whether the request carries a valid bearer token."""
+    if not HTTP_CACHE_ENABLED or version is None:
+        return Validators()
+
+    return Validators(
+        etag=get_etag(request.path, request.query_string, version, authenticated),
+        last_modified=last_modified,
+        ttl=ttl,
+        no_cache=authenticated,
+        vary='Authorization',
+    )
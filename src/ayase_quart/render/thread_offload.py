@@ -0,0 +1,89 @@
+from asyncio import gather, wrap_future
+from concurrent.futures import ProcessPoolExecutor as Executor
+from multiprocessing import get_context
+
+from ..asagi_converter import (
+    get_counts_from_posts,
+    rows_2_posts,
+    thread_rows_2_posts
+)
+from ..configs import app_conf
+from ..moderation import fc
+from ..posts.rendered_table import RenderedLookup
+from ..posts.template_optimizer import get_posts_t_thread, render_wrapped_post_t_thread, set_posts_quotelinks
+
+"""
+Formats and templates the posts of very large threads in a process pool, so the worker's event loop keeps serving other requests meanwhile.
+
+Like `BoardLoaderPipeline.transform_worker()` in `search/loader.py`, rows go out as tuples and html comes back as strings.
+Each post comes back as its own chunk, so reported posts are still filtered in the event loop, on the formatted comments as before,
+and only the few posts the filter changes for staff are templated again there.
+"""
+
+thread_offload_min_posts: int = app_conf.get('thread_offload_min_posts', 0)
+thread_offload_processes: int = app_conf.get('thread_offload_processes', 2)
+
+
+def warm_up() -> None:
+    """Submitted once per process so the first large thread doesn't wait on imports."""
+    pass
+
+
+def render_thread_rows(board: str, thread_num: int, details: dict, rows: list[tuple], rendered: RenderedLookup) -> tuple[dict, list[tuple[str, str]], list[str]]:
+    """Runs in the process pool.
+
+    Returns the thread's quotelink lookup, each post's `(title, comment)` html, and each post's html.
+    """
+    post_2_quotelinks, thread = thread_rows_2_posts(board, thread_num, details, rows, rendered)
+    posts = thread['posts']
+    html_fields = [(post['title'], post['comment']) for post in posts]
+    set_posts_quotelinks(posts, post_2_quotelinks)
+    return post_2_quotelinks, html_fields, [render_wrapped_post_t_thread(post) for post in posts]
+
+
+class ThreadRenderPool:
+    def __init__(self, processes: int):
+        self.processes = processes
+        self.pool: Executor | None = None
+
+    def get_pool(self) -> Executor:
+        if not self.pool:
+            # forking a worker that already runs db driver threads is unsafe, forkserver children start clean
+            self.pool = Executor(max_workers=self.processes, mp_context=get_context('forkserver'))
+        return self.pool
+
+    async def start(self) -> None:
+        pool = self.get_pool()
+        await gather(*(wrap_future(pool.submit(warm_up)) for _ in range(self.processes)))
+
+    async def stop(self) -> None:
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def render_thread(self, board: str, thread_num: int, details: dict, rows: list[tuple], rendered: RenderedLookup, logged_in: bool) -> tuple[str, int, int]:
+        """Returns `(posts_t, nreplies, nimages)`, the same as rendering the output of `generate_thread()` in the event loop."""
+        rows = [tuple(row) for row in rows] # e.g. asyncpg Records don't pickle
+        post_2_quotelinks, html_fields, chunks = await wrap_future(
+            self.get_pool().submit(render_thread_rows, board, thread_num, dict(details), rows, rendered)
+        )
+
+        posts = rows_2_posts(rows)
+        for post, (title, comment) in zip(posts, html_fields):
+            post['title'] = title
+            post['comment'] = comment
+        posts[0].update(details)
+
+        # `posts` stays referenced so no filtered post can free up its id
+        post_chunks = {id(post): chunk for post, chunk in zip(posts, chunks)}
+        filtered = await fc.filter_reported_posts(posts, is_authority=logged_in)
+        nreplies, nimages = get_counts_from_posts(filtered)
+
+        posts_t = ''.join(
+            chunk if (chunk := post_chunks.get(id(post))) is not None else get_posts_t_thread([post], post_2_quotelinks)
+            for post in filtered
+        )
+        return posts_t, nreplies, nimages
+
+
+thread_render_pool = ThreadRenderPool(thread_offload_processes)
@@ -1,4 +1,4 @@
-from ..asagi_converter import search_posts
+from ..asagi_converter import search_posts, search_posts_keyset
 from ..configs import index_search_conf, vanilla_search_conf
 from .post_metadata import board_2_int
 from .providers import get_index_search_provider
@@ -49,3 +49,7 @@ async def get_posts_and_total_hits_fts(form_data: dict):
 
 async def get_posts_and_total_hits_sql(form_data: dict):
     return await search_posts(form_data, vanilla_search_conf['max_hits'])
+
+
+async def get_posts_and_total_hits_sql_keyset(form_data: dict):
+    return await search_posts_keyset(form_data, vanilla_search_conf['max_hits'], count_hits=vanilla_search_conf.get('count_hits', True))
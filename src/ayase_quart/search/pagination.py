@@ -41,6 +41,57 @@ def get_page_link(base_link: str, page: int, is_active: bool=False, text: str=No
     wrapped = f'<li{is_active}>{link}</li>'
     return wrapped
 
+def get_base_link(path: str, params: dict) -> str:
+    params.pop('page', None)
+    params.pop('cursor', None)
+    # params.pop('nums', None)
+    # params.pop('thread_nums', None)
+
+    params_t = []
+    for k, v in params.items():
+        if any(v == x for x in (None, '', False)):
+            continue
+        if type(v) is list:
+            for e in v:
+                params_t.append((k, e))
+        else:
+            params_t.append((k, v))
+    enc_params = urlencode(params_t)
+    return f'{path}?{enc_params}'
+
+
+def template_cursor_links(path: str, params: dict, next_cursor: str | None, section: str=None):
+    """
+    Keyset paged results have no page numbers, only the first page and the next one.
+
+    <div class="paginate">
+        <ul>
+            <li><a href="sql?comment=hello&boards=g&page=1">First</a></li>
+            <br>
+            <li><a href="sql?comment=hello&boards=g&cursor=1700000000_0_123">Next</a></li>
+        </ul>
+    </div>
+    """
+    is_first_page = not params.get('cursor')
+    if is_first_page and not next_cursor:
+        return ''
+
+    base_link = get_base_link(path, params)
+
+    links = []
+    if not is_first_page:
+        links.append(get_page_link(base_link, 1, text='First', section=section))
+
+    if next_cursor:
+        if links:
+            links.append('<br>')
+        anchor = f'#{section}' if section else ''
+        links.append(f'<li><a href="{base_link}&cursor={next_cursor}{anchor}">Next</a></li>')
+
+    links = ''.join(links)
+    return f'<div class="paginate"><ul>{links}</ul></div>'
+
+
 def template_pagination_links(path: str, params: dict, total_pages: int, section: str=None):
     """
     Given
@@ -81,21 +132,7 @@ def template_pagination_links(path: str, params: dict, total_pages: int, section
     if cur_page > total_pages:
         cur_page = total_pages
 
-    params.pop('page', None)
-    # params.pop('nums', None)
-    # params.pop('thread_nums', None)
-
-    params_t = []
-    for k, v in params.items():
-        if any(v == x for x in (None, '', False)):
-            continue
-        if type(v) is list:
-            for e in v:
-                params_t.append((k, e))
-        else:
-            params_t.append((k, v))
-    enc_params = urlencode(params_t)
-    base_link = f'{path}?{enc_params}'
+    base_link = get_base_link(path, params)
 
     links = []
 
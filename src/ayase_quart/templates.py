@@ -7,6 +7,7 @@ from .configs import (
     SITE_NAME, REPO_PKG,
     app_conf,
     archive_conf,
+    db_conf,
     index_search_conf,
     mod_conf,
     site_conf,
@@ -28,6 +29,7 @@ render_constants = dict(
     vanilla_search_enabled=vanilla_search_conf.get('enabled', False),
     index_search_enabled=index_search_conf.get('enabled', False),
     moderation_enabled=mod_conf['enabled'],
+    slow_query_log_enabled=db_conf.get('slow_query_log', {}).get('enabled', False),
     stats_enabled=stats_conf['enabled'],
     endpoint=lambda: request.endpoint,
     url_for=url_for,
@@ -59,6 +61,7 @@ template_about = env.get_template("about.html")
 template_stats = env.get_template("stats.html")
 template_login = env.get_template('login.html')
 template_configs = env.get_template('configs.html')
+template_slow_queries = env.get_template('slow_queries.html')
 
 template_error_message = env.get_template("error_message.html")
 
@@ -3,7 +3,7 @@ import sys
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from posts.comments import clickable_links
+from posts.comment_formatter import clickable_links
 
 
 def test_clickable_links():
@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from ayase_quart import asagi_converter
+from ayase_quart.asagi_converter import OP_THREAD_COUNT_TTL, OP_THREAD_RECOUNT_TTL, get_op_thread_count
+
+
+class TestOpThreadCount(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        asagi_converter.op_thread_counts.clear()
+        self.thread_nums = [10, 20, 30]
+        self.now = 1_000.0
+        self.generation = 0
+        self.get_generation = AsyncMock(side_effect=lambda board: self.generation)
+
+        patchers = [
+            patch('ayase_quart.asagi_converter.db_q.query_tuple', AsyncMock(side_effect=self.query_tuple)),
+            patch('ayase_quart.asagi_converter.time', Mock(monotonic=lambda: self.now)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.query_tuple = asagi_converter.db_q.query_tuple
+
+    def tearDown(self):
+        asagi_converter.op_thread_counts.clear()
+
+    async def query_tuple(self, sql: str, params=None):
+        await asyncio.sleep(0)
+        thread_nums = [n for n in self.thread_nums if not params or n > params[0]]
+        return [(len(thread_nums), max(thread_nums, default=None))]
+
+    async def count(self) -> int:
+        return await get_op_thread_count('g', self.get_generation)
+
+    async def test_served_from_memory_within_ttl(self):
+        self.assertEqual(await self.count(), 3)
+        self.thread_nums.append(40)
+        self.now += OP_THREAD_COUNT_TTL - 1
+        self.assertEqual(await self.count(), 3)
+        self.assertEqual(self.query_tuple.await_count, 1)
+        self.assertEqual(self.get_generation.await_count, 1)
+
+    async def test_refresh_adds_new_threads(self):
+        await self.count()
+        self.thread_nums.append(40)
+        self.now += OP_THREAD_COUNT_TTL
+        self.assertEqual(await self.count(), 4)
+        self.assertEqual(self.query_tuple.await_args.kwargs['params'], (30,))
+
+    async def test_concurrent_refreshes_count_new_threads_once(self):
+        await self.count()
+        self.thread_nums.append(40)
+        self.now += OP_THREAD_COUNT_TTL
+        # the second request keeps the current count while the first refreshes it
+        self.assertEqual(await asyncio.gather(self.count(), self.count()), [4, 3])
+        self.assertEqual(self.query_tuple.await_count, 2)
+        self.assertEqual(await self.count(), 4)
+
+    async def test_generation_bump_recounts(self):
+        await self.count()
+        self.thread_nums.remove(20)
+        self.generation += 1
+        self.now += OP_THREAD_COUNT_TTL
+        self.assertEqual(await self.count(), 2)
+
+    async def test_recount_ttl_catches_removals(self):
+        await self.count()
+        self.thread_nums.remove(20)
+        self.now += OP_THREAD_COUNT_TTL
+        self.assertEqual(await self.count(), 3)
+        self.now += OP_THREAD_RECOUNT_TTL
+        self.assertEqual(await self.count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from ayase_quart import asagi_converter
+from ayase_quart.asagi_converter import CATALOG_PAGE_THREADS, generate_catalog, get_page_cursor
+
+
+def get_threads(time_bump: int) -> list[dict]:
+    return [
+        dict(thread_num=time_bump - i, time_bump=time_bump - i, nreplies=0, nimages=0)
+        for i in range(CATALOG_PAGE_THREADS)
+    ]
+
+
+class TestPageCursorAnchors(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        asagi_converter.page_cursor_index.clear()
+        self.skipped_cursor = (1_000, 1_000)
+        patchers = [
+            patch('ayase_quart.asagi_converter.get_page_threads', AsyncMock(return_value=get_threads(100_000))),
+            patch('ayase_quart.asagi_converter.get_catalog_ops', AsyncMock(return_value=[])),
+            patch('ayase_quart.asagi_converter.skip_threads', AsyncMock(return_value=self.skipped_cursor)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        asagi_converter.page_cursor_index.clear()
+
+    async def test_client_cursor_is_not_remembered(self):
+        # the cursor starts page 2, but is sent for page 10
+        await generate_catalog('g', page_num=10, cursor=(100_001, 100_001))
+        self.assertEqual(await get_page_cursor('g', CATALOG_PAGE_THREADS, 11), self.skipped_cursor)
+        asagi_converter.skip_threads.assert_awaited_once_with('g', None, 10 * CATALOG_PAGE_THREADS)
+
+    async def test_resolved_cursor_is_remembered(self):
+        await generate_catalog('g', page_num=10)
+        asagi_converter.skip_threads.reset_mock()
+
+        last = get_threads(100_000)[-1]
+        self.assertEqual(await get_page_cursor('g', CATALOG_PAGE_THREADS, 11), (last['time_bump'], last['thread_num']))
+        asagi_converter.skip_threads.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from ayase_quart.configs import mod_conf
+from ayase_quart.moderation.filter_cache.redis_fc import FilterCacheRedis, u32_to_bytes
+
+
+class FakeFilterCommands:
+    def __init__(self, pipeline: 'FakePipeline', name: str):
+        self.pipeline = pipeline
+        self.name = name
+
+    def mexists(self, key: str, nums_bytes: list[bytes]) -> asyncio.Future:
+        """Queued like a coredis pipeline command, answered on `execute()`."""
+        result = asyncio.get_running_loop().create_future()
+        self.pipeline.queued.append((self.name, key, nums_bytes, result))
+        return result
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.queued = []
+        self.bf = FakeFilterCommands(self, 'bf')
+        self.cf = FakeFilterCommands(self, 'cf')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.redis.round_trips += 1
+        for name, key, nums_bytes, result in self.queued:
+            self.redis.commands.append((name, key))
+            result.set_result([num_bytes in self.redis.filters.get(key, set()) for num_bytes in nums_bytes])
+
+
+class FakeRedis:
+    def __init__(self):
+        self.filters: dict[str, set[bytes]] = {}
+        self.round_trips = 0
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def pipeline(self, transaction: bool=True) -> FakePipeline:
+        assert not transaction
+        return FakePipeline(self)
+
+
+class TestRedisBoardNumPairs(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        with patch('ayase_quart.moderation.filter_cache.redis_fc.get_redis', return_value=self.redis):
+            self.fc = FilterCacheRedis(mod_conf | dict(remove_replies_to_hidden_op=True))
+
+        self.fc.confirm_deleted = AsyncMock(side_effect=lambda board, nums: {(board, num) for num in nums})
+        self.fc.confirm_reported = AsyncMock(side_effect=lambda board, nums: {(board, num) for num in nums})
+
+    def add(self, rfilter, board: str, *nums: int):
+        self.redis.filters.setdefault(rfilter.fmt_key(board), set()).update(u32_to_bytes(num) for num in nums)
+
+    async def test_page_is_one_round_trip(self):
+        self.add(self.fc.bf, 'g', 12)
+        self.add(self.fc.cf, 'ck', 21)
+        posts = [
+            dict(board_shortname='g', num=11, thread_num=10),
+            dict(board_shortname='g', num=12, thread_num=10),
+            dict(board_shortname='ck', num=21, thread_num=20),
+        ]
+        self.assertEqual(await self.fc.get_board_num_pairs(posts), {('g', 12), ('ck', 21)})
+        self.assertEqual(self.redis.round_trips, 1)
+        self.assertEqual(sorted(self.redis.commands), sorted([
+            ('bf', self.fc.bf.fmt_key('g')), ('cf', self.fc.cf.fmt_key('g')),
+            ('bf', self.fc.bf.fmt_key('ck')), ('cf', self.fc.cf.fmt_key('ck')),
+        ]))
+        self.fc.confirm_deleted.assert_awaited_once_with('g', [12])
+        self.fc.confirm_reported.assert_awaited_once_with('ck', [21])
+
+    async def test_reply_to_hidden_op_off_the_page(self):
+        # the hidden op is reported, and is not among the posts
+        self.add(self.fc.cf, 'g', 10)
+        reply = dict(board_shortname='g', num=11, thread_num=10)
+        board_num_pairs = await self.fc.get_board_num_pairs([reply])
+        self.assertEqual(board_num_pairs, {('g', 10)})
+        self.assertTrue(self.fc.should_filter(board_num_pairs, reply))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+
+"""
+A roaring-style compressed bitmap of unsigned 32 bit ints, in pure python.
+
+Ints are grouped by their high 16 bits. Each group is stored as a sorted array of its low 16 bits while it has
+at most `ARRAY_MAX` members, and as an 8 KiB bitset once it has more, so sparse and dense ranges both stay small.
+
+`to_bytes()` writes the containers out as they are, so `from_buffer()` can read them back as memoryviews over
+an mmap without copying. Containers read that way are only copied when they are first modified.
+"""
+
+ARRAY_MAX = 4096
+BITSET_BYTES = 8192
+
+# magic, number of containers, number of ints
+HEADER = struct.Struct('=4sIQ')
+# high 16 bits, is bitset, padding, number of ints in the container
+CONTAINER = struct.Struct('=HBxI')
+MAGIC = b'AQBM'
+
+type Container = array | bytearray | memoryview
+
+
+def bitset_from_array(values: Iterable[int]) -> bytearray:
+    bitset = bytearray(BITSET_BYTES)
+    for low in values:
+        bitset[low >> 3] |= 1 << (low & 7)
+    return bitset
+
+
+def array_from_bitset(bitset: Container) -> array:
+    return array('H', (
+        (i << 3) | bit
+        for i, byte in enumerate(bitset) if byte
+        for bit in range(8) if byte >> bit & 1
+    ))
+
+
+def bitset_count(bitset: Container) -> int:
+    return int.from_bytes(bitset).bit_count()
+
+
+class Bitmap:
+    __slots__ = ('arrays', 'bitsets', 'n')
+
+    def __init__(self, values: Iterable[int]=()):
+        self.arrays: dict[int, Container] = {}
+        self.bitsets: dict[int, Container] = {}
+        self.n = 0
+        self.update(values)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __contains__(self, value: int) -> bool:
+        high = value >> 16
+        low = value & 0xFFFF
+        if (values := self.arrays.get(high)) is not None:
+            i = bisect_left(values, low)
+            return i < len(values) and values[i] == low
+        if (bitset := self.bitsets.get(high)) is not None:
+            return bool(bitset[low >> 3] >> (low & 7) & 1)
+        return False
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self.arrays.keys() | self.bitsets.keys()):
+            base = high << 16
+            values = self.arrays[high] if high in self.arrays else array_from_bitset(self.bitsets[high])
+            for low in values:
+                yield base | low
+
+    def add(self, value: int) -> bool:
+        """Returns whether `value` was new."""
+        high = value >> 16
+        low = value & 0xFFFF
+
+        if (bitset := self.bitsets.get(high)) is not None:
+            mask = 1 << (low & 7)
+            if bitset[low >> 3] & mask:
+                return False
+            if type(bitset) is memoryview:
+                bitset = self.bitsets[high] = bytearray(bitset)
+            bitset[low >> 3] |= mask
+            self.n += 1
+            return True
+
+        values = self.arrays.get(high)
+        if values is None:
+            values = self.arrays[high] = array('H')
+        i = bisect_left(values, low)
+        if i < len(values) and values[i] == low:
+            return False
+        if type(values) is memoryview:
+            values = self.arrays[high] = array('H', values)
+        values.insert(i, low)
+        self.n += 1
+
+        if len(values) > ARRAY_MAX:
+            self.bitsets[high] = bitset_from_array(values)
+            del self.arrays[high]
+        return True
+
+    def discard(self, value: int) -> bool:
+        """Returns whether `value` was removed."""
+        high = value >> 16
+        low = value & 0xFFFF
+
+        if (values := self.arrays.get(high)) is not None:
+            i = bisect_left(values, low)
+            if i == len(values) or values[i] != low:
+                return False
+            if type(values) is memoryview:
+                values = self.arrays[high] = array('H', values)
+            del values[i]
+            if not values:
+                del self.arrays[high]
+            self.n -= 1
+            return True
+
+        if (bitset := self.bitsets.get(high)) is not None:
+            mask = 1 << (low & 7)
+            if not bitset[low >> 3] & mask:
+                return False
+            if type(bitset) is memoryview:
+                bitset = self.bitsets[high] = bytearray(bitset)
+            bitset[low >> 3] &= ~mask
+            self.n -= 1
+            if bitset_count(bitset) <= ARRAY_MAX:
+                self.arrays[high] = array_from_bitset(bitset)
+                del self.bitsets[high]
+            return True
+
+        return False
+
+    def update(self, values: Iterable[int]) -> None:
+        for value in values:
+            self.add(value)
+
+    def to_bytes(self) -> bytes:
+        highs = sorted(self.arrays.keys() | self.bitsets.keys())
+        parts = [HEADER.pack(MAGIC, len(highs), self.n)]
+        for high in highs:
+            if high in self.arrays:
+                values = self.arrays[high]
+                parts.append(CONTAINER.pack(high, 0, len(values)))
+                data = bytes(values) if type(values) is memoryview else values.tobytes()
+                parts.append(data)
+                # keeps the next container 4 byte aligned
+                if len(data) % 4:
+                    parts.append(b'\0\0')
+            else:
+                bitset = self.bitsets[high]
+                parts.append(CONTAINER.pack(high, 1, bitset_count(bitset)))
+                parts.append(bytes(bitset))
+        return b''.join(parts)
+
+    @classmethod
+    def from_buffer(cls, buffer: memoryview, offset: int=0) -> tuple['Bitmap', int]:
+        """Reads a bitmap written by `to_bytes()` without copying its containers.
+        Returns the bitmap, and the offset just past it.
+        """
+        magic, n_containers, n = HEADER.unpack_from(buffer, offset)
+        if magic != MAGIC:
+            raise ValueError(magic)
+        offset += HEADER.size
+
+        bitmap = cls()
+        for _ in range(n_containers):
+            high, is_bitset, count = CONTAINER.unpack_from(buffer, offset)
+            offset += CONTAINER.size
+            if is_bitset:
+                bitmap.bitsets[high] = buffer[offset:offset + BITSET_BYTES]
+                offset += BITSET_BYTES
+            else:
+                size = count * 2
+                bitmap.arrays[high] = buffer[offset:offset + size].cast('H')
+                offset += size + (size % 4)
+        bitmap.n = n
+        return bitmap, offset
@@ -0,0 +1,23 @@
+from .integers import is_uint
+
+CURSOR_SEP = '_'
+
+
+def encode_cursor(*values: int) -> str:
+    """
+    See tests for behavior
+    """
+    return CURSOR_SEP.join(str(int(v)) for v in values)
+
+
+def decode_cursor(token: str | None, n_values: int=2) -> tuple[int, ...] | None:
+    """Returns `None` for anything that isn't exactly `n_values` unsigned ints, so bad tokens fall back to page numbers.
+    See tests for behavior
+    """
+    if not token:
+        return None
+
+    values = token.split(CURSOR_SEP)
+    if len(values) != n_values or not all(is_uint(v) for v in values):
+        return None
+    return tuple(int(v) for v in values)
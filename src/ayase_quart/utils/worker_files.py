@@ -0,0 +1,93 @@
+import asyncio
+import os
+import traceback
+from abc import ABC, abstractmethod
+
+import aiofiles
+import orjson
+
+"""
+State each worker keeps in its own memory, written to `<dir>/<pid>.json` every `flush_interval` seconds,
+so any worker can answer for all of them by reading every file in `<dir>`.
+Files of workers that are gone are removed when a worker starts.
+"""
+
+
+class WorkerFiles(ABC):
+    def __init__(self, files_dir: str, flush_interval: float):
+        self.files_dir = files_dir
+        self.flush_interval = flush_interval
+        self.path = ''
+        self.task: asyncio.Task | None = None
+
+    @abstractmethod
+    def to_dict(self) -> dict:
+        """This worker's state, as written to its file."""
+        raise NotImplementedError()
+
+    def needs_flush(self) -> bool:
+        """Whether the periodic flush should write the file."""
+        return True
+
+    async def flush(self) -> None:
+        if not self.path:
+            return
+        data = orjson.dumps(self.to_dict())
+        # replaced in one go, so readers never see a half written file
+        tmp_path = f'{self.path}.tmp'
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def remove_dead_workers(self) -> None:
+        for file_name in os.listdir(self.files_dir):
+            pid, ext = os.path.splitext(file_name)
+            if ext != '.json' or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                os.remove(os.path.join(self.files_dir, file_name))
+            except PermissionError:
+                pass
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self.needs_flush():
+                continue
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f'{type(self).__name__} flush failed')
+                traceback.print_exception(e)
+
+    async def start(self) -> None:
+        # in start(), since workers may be forked after the instance is created
+        self.path = os.path.join(self.files_dir, f'{os.getpid()}.json')
+        os.makedirs(self.files_dir, exist_ok=True)
+        self.remove_dead_workers()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+
+async def read_worker_files(files_dir: str) -> list[dict]:
+    """Every worker's last flushed state."""
+    if not os.path.isdir(files_dir):
+        return []
+
+    workers = []
+    for file_name in os.listdir(files_dir):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            async with aiofiles.open(os.path.join(files_dir, file_name), 'rb') as f:
+                workers.append(orjson.loads(await f.read()))
+        except FileNotFoundError:
+            continue # removed by another worker
+    return workers
@@ -0,0 +1,35 @@
+import random
+
+from bench.http import WeightedChoice, get_percentiles, parse_mix, parse_server_timing
+
+
+def test_parse_server_timing():
+    header = 'query;dur=1.50, filter_reported;desc="x";dur=0.25, total;dur=1.75, broken;dur=abc, nodur'
+    assert parse_server_timing(header) == [('query', 0.0015), ('filter_reported', 0.00025), ('total', 0.00175)]
+
+
+def test_parse_mix():
+    assert parse_mix('thread=3, index=1') == dict(thread=3.0, index=1.0)
+    try:
+        parse_mix('threads=1')
+    except ValueError:
+        pass
+    else:
+        assert False
+
+
+def test_weighted_choice():
+    rng = random.Random(24)
+    choice = WeightedChoice(['a', 'b', 'c'], [1, 0, 3])
+    picks = [choice(rng) for _ in range(4_000)]
+    assert 'b' not in picks
+    assert 2_700 < picks.count('c') < 3_300
+
+
+def test_percentiles():
+    stats = get_percentiles([i / 1000 for i in range(1, 101)])
+    assert round(stats['p50'], 4) == 0.0505
+    assert round(stats['p99'], 4) == 0.0990
+    assert stats['max'] == 0.1
+    assert get_percentiles([0.5])['p95'] == 0.5
+    assert get_percentiles([])['p50'] is None
@@ -0,0 +1,52 @@
+import sqlite3
+
+from bench.synthetic_db import create_synthetic_db
+
+
+def dump(path: str, board: str) -> list[tuple]:
+    with sqlite3.connect(path) as db:
+        return db.execute(f'select * from `{board}` order by num').fetchall()
+
+
+def test_synthetic_db_is_consistent(tmp_path):
+    path = str(tmp_path / 'asagi.db')
+    stats = create_synthetic_db(path, boards=('g', 'ck'), n_threads=40, max_replies=400, seed=3)
+    assert [s.board for s in stats] == ['g', 'ck']
+
+    db = sqlite3.connect(path)
+    for s in stats:
+        board = s.board
+        assert db.execute(f'select count(*) from `{board}`').fetchone()[0] == s.posts
+        assert db.execute(f'select count(*), max(nreplies) from `{board}_threads`').fetchone() == (40, 400)
+        assert s.largest_thread_posts == 401
+
+        # the threads table agrees with the posts
+        mismatched = db.execute(f"""
+            select t.thread_num
+            from `{board}_threads` t
+            join (
+                select thread_num, count(*) - 1 as nreplies, max(timestamp) as time_last, sum(media_hash is not null) as nimages
+                from `{board}` group by thread_num
+            ) p using (thread_num)
+            where t.nreplies != p.nreplies or t.time_last != p.time_last or t.nimages != p.nimages
+        """).fetchall()
+        assert not mismatched
+
+        # every thread starts with its op, and nums follow the timestamps
+        assert not db.execute(f'select num from `{board}` where op = 1 and num != thread_num').fetchall()
+        assert db.execute(f'select count(*) from `{board}` where op = 1').fetchone()[0] == 40
+        rows = db.execute(f'select timestamp from `{board}` order by num').fetchall()
+        assert rows == sorted(rows)
+
+        assert db.execute(f'select count(*) from `{board}_deleted`').fetchone()[0] == s.deleted
+        assert db.execute(f'select sum(total) from `{board}_images`').fetchone()[0] == db.execute(f'select count(*) from `{board}` where media_id != 0').fetchone()[0]
+    db.close()
+
+
+def test_synthetic_db_is_repeatable(tmp_path):
+    a, b, c = (str(tmp_path / f'{name}.db') for name in 'abc')
+    create_synthetic_db(a, boards=('g',), n_threads=20, max_replies=100, seed=1)
+    create_synthetic_db(b, boards=('g',), n_threads=20, max_replies=100, seed=1)
+    create_synthetic_db(c, boards=('g',), n_threads=20, max_replies=100, seed=2)
+    assert dump(a, 'g') == dump(b, 'g')
+    assert dump(a, 'g') != dump(c, 'g')
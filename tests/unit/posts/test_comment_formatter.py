@@ -0,0 +1,114 @@
+import html
+import random
+import re
+
+from posts.comment_formatter import clickable_links, format_comment
+
+
+# The chained regex passes `format_comment()` replaced, kept as the reference it must match exactly.
+
+def chained_quotelinks(comment: str, board: str, thread_num: int):
+    def replacer(match):
+        post_num = match.group(1)
+        op_tag = ' (OP)' if int(post_num) == thread_num else ''
+        return f'<a href="/{board}/thread/{thread_num}#p{post_num}" class="quotelink" data-board="{board}">&gt;&gt;{post_num}{op_tag}</a>'
+    return re.sub(r'&gt;&gt;(\d+)', replacer, comment)
+
+
+def chained_bbcode(comment: str):
+    if not re.fullmatch(r'.*\[(spoiler|code|banned)\].+\[/(spoiler|code|banned)\].*', comment, re.DOTALL):
+        return comment
+    comment = re.sub(r'\[spoiler\](.*?)\[/spoiler\]', r'<span class="spoiler">\1</span>', comment, flags=re.DOTALL)
+    comment = re.sub(r'\[code\](.*?)\[/code\]', r'<code>\1</code>', comment, flags=re.DOTALL)
+    comment = re.sub(r'\[banned\](.*?)\[/banned\]', r'<span class="banned">\1</span>', comment, flags=re.DOTALL)
+    return comment
+
+
+def chained_newlines(comment: str):
+    parts = re.split(r'(<code>.*?</code>)', comment, flags=re.DOTALL)
+    return ''.join(part if part.startswith('<code>') else part.replace('\n', '<br>') for part in parts)
+
+
+def chained_comment(comment: str, thread_num: int, board: str):
+    has_angle_r = '>' in comment
+    has_square_l = '[' in comment
+    if has_angle_r or '<' in comment:
+        comment = html.escape(comment)
+    if has_angle_r:
+        comment = chained_quotelinks(comment, board, thread_num)
+    if has_square_l:
+        comment = chained_bbcode(comment)
+    if has_angle_r:
+        comment = re.sub(r'^&gt;(?!&gt;\d)(.*)$', r'<span class="quote">&gt;\1</span>', comment, flags=re.MULTILINE)
+    if 'http' in comment:
+        comment = clickable_links(comment)
+    if has_square_l:
+        return chained_newlines(comment)
+    return comment.replace('\n', '<br>')
+
+
+corpus = [
+    'hello world',
+    '>>123\nthis',
+    '>>123\n>>124\nboth of you are wrong',
+    '>>>/g/123\ncheck this thread',
+    '>>>123',
+    '>be me\n>go outside\n>it\'s raining',
+    '>>100 (OP)\n>implying\nno',
+    'look at https://example.com/page?a=1&b=2, it\'s good.',
+    'http://example.com.',
+    'visit HTTP://EXAMPLE.COM or http://example.org/path/to.html...',
+    '<script>alert("x")</script>',
+    'a & b < c',
+    '[spoiler]Snape kills Dumbledore[/spoiler]',
+    '[code]\nint main() {\n    return 0;\n}\n[/code]\nok',
+    '[code]>>123\n>not green\n[/code]',
+    '[spoiler]a[code]b[/spoiler]c[/code]\nd',
+    '[banned]USER WAS BANNED FOR THIS POST[/banned]',
+    '[spoiler][/spoiler]',
+    '[spoiler][/code]',
+    '[/spoiler]x[spoiler]',
+    '[spoiler]unclosed\nhttp://a.com/x[/spoiler]y',
+    'http://a.com/x[/spoiler]y',
+    'http://a.com/>>123',
+    'http://a.com/"quoted"<b>',
+    'http://a.com/\'x',
+    '>http://greentext.com/link\nhttps://b.co',
+    '>>0123',
+    '>>١٢٣',
+    'trailing\n',
+    '\n\n>\n>>\n>>>',
+    'x\r\n>y\r\n',
+    '[code]a\nb[/code][code]c\nd[/code]\ne',
+    '>green [spoiler]x\ny[/spoiler]',
+    '&gt;&gt;123 not a quotelink [spoiler]x[/spoiler]',
+    'http://ſ.example.com/',
+]
+
+fragments = [
+    '>', '>>', '>>>', '>>1', '>>100', '>>99', '>>>/a/1', '<', '&', '&gt;', '&gt;&gt;1', '"', "'", '.', ',', '...', ' ', '\n', '\r', '\t',
+    '[', ']', '[spoiler]', '[/spoiler]', '[code]', '[/code]', '[banned]', '[/banned]', '[spoiler', 'code]',
+    'http', 'http://', 'https://example.com', 'http://a.b.co/x?y=1&z=2', 'HTTP://X.ORG', 'ftp://x.com', '://',
+    'word', 'Ünïcödé', '１２', '0', '7', '-', '/', ':', 'a.com',
+]
+
+
+def test_format_comment_corpus():
+    for comment in corpus:
+        for thread_num in (100, 123):
+            assert format_comment(comment, thread_num, 'g') == chained_comment(comment, thread_num, 'g'), comment
+
+
+def test_format_comment_fuzz():
+    rng = random.Random(0)
+    for _ in range(20_000):
+        comment = ''.join(rng.choice(fragments) for _ in range(rng.randint(1, 12)))
+        assert format_comment(comment, 100, 'g') == chained_comment(comment, 100, 'g'), comment
+
+
+def test_format_comment_fuzz_chars():
+    rng = random.Random(1)
+    chars = '>[]/<&"\'\n .,:1ahtpscodebn'
+    for _ in range(20_000):
+        comment = ''.join(rng.choice(chars) for _ in range(rng.randint(1, 30)))
+        assert format_comment(comment, 1, 'g') == chained_comment(comment, 1, 'g'), comment
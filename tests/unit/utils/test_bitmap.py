@@ -0,0 +1,60 @@
+import random
+
+from utils.bitmap import ARRAY_MAX, Bitmap
+
+
+def test_bitmap_membership():
+    bitmap = Bitmap([3, 70_000, 2**32 - 1])
+    assert len(bitmap) == 3
+    assert 3 in bitmap
+    assert 70_000 in bitmap
+    assert 2**32 - 1 in bitmap
+    assert 4 not in bitmap
+    assert 70_001 not in bitmap
+    assert list(bitmap) == [3, 70_000, 2**32 - 1]
+
+    assert not bitmap.add(3)
+    assert bitmap.discard(3)
+    assert not bitmap.discard(3)
+    assert 3 not in bitmap
+    assert len(bitmap) == 2
+
+
+def test_bitmap_dense_container():
+    values = range(0, (ARRAY_MAX + 100) * 3, 3)
+    bitmap = Bitmap(values)
+    assert bitmap.bitsets and not bitmap.arrays
+    assert list(bitmap) == list(values)
+
+    for value in values[:200]:
+        bitmap.discard(value)
+    assert bitmap.arrays and not bitmap.bitsets
+    assert list(bitmap) == list(values[200:])
+
+
+def test_bitmap_buffer_round_trip():
+    rng = random.Random(18)
+    expected = set()
+    bitmap = Bitmap()
+    for _ in range(20_000):
+        value = rng.choice((rng.randrange(2**32), rng.randrange(200_000)))
+        bitmap.add(value)
+        expected.add(value)
+
+    data = bitmap.to_bytes()
+    loaded, offset = Bitmap.from_buffer(memoryview(data))
+    assert offset == len(data)
+    assert len(loaded) == len(expected)
+    assert list(loaded) == sorted(expected)
+
+    # containers read from the buffer are copied on their first change
+    for _ in range(5_000):
+        value = rng.randrange(200_000)
+        if rng.random() < 0.5:
+            assert loaded.add(value) == (value not in expected)
+            expected.add(value)
+        else:
+            assert loaded.discard(value) == (value in expected)
+            expected.discard(value)
+    assert list(loaded) == sorted(expected)
+    assert Bitmap.from_buffer(memoryview(data))[0].to_bytes() == data
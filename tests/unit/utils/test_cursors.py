@@ -0,0 +1,28 @@
+from utils.cursors import decode_cursor, encode_cursor
+
+
+def test_encode_cursor():
+    assert encode_cursor(1700000000, 123) == '1700000000_123'
+    assert encode_cursor(0, 0) == '0_0'
+    assert encode_cursor(5) == '5'
+
+
+def test_decode_cursor():
+    assert decode_cursor('1700000000_123') == (1700000000, 123)
+    assert decode_cursor('0_0') == (0, 0)
+    assert decode_cursor('5', n_values=1) == (5,)
+    assert decode_cursor('1_2_3', n_values=3) == (1, 2, 3)
+    assert decode_cursor(encode_cursor(42, 7)) == (42, 7)
+
+
+def test_decode_cursor_invalid():
+    assert decode_cursor(None) is None
+    assert decode_cursor('') is None
+    assert decode_cursor('123') is None
+    assert decode_cursor('1_2_3') is None
+    assert decode_cursor('_') is None
+    assert decode_cursor('1_') is None
+    assert decode_cursor('-1_2') is None
+    assert decode_cursor('1_x') is None
+    assert decode_cursor('1.5_2') is None
+    assert decode_cursor('1_⑨') is None